@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures how the phases of `lp_ssh.launch` scale with hosts and nodes.
+
+`ssh` is replaced by the local shim next to this file, so every host is a
+directory with its own tmux server on this machine. Example:
+
+  python benchmark.py --hosts 1,10,100 --nodes 10,100,1000 --output_dir /tmp/lp_bench
+"""
+
+import csv
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from absl import app
+from absl import flags
+
+from tlaunch import lp_ssh
+from tlaunch.lp_ssh import context
+from tlaunch.lp_ssh import ssh_pool
+from tlaunch.lp_ssh.launch.run_ssh import heartbeat
+from tlaunch.lp_ssh.launch.run_ssh import launch_ssh_tmux
+from tlaunch.lp_ssh.launch.run_ssh import port_reservation
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_list('hosts', ['1', '10', '100'], 'Numbers of hosts to sweep.')
+flags.DEFINE_list('nodes', ['1', '100', '1000'], 'Numbers of nodes to sweep.')
+flags.DEFINE_integer('repeats', 1, 'Number of runs of every configuration.')
+flags.DEFINE_float('handshake_secs', 0.05,
+                   'Emulated cost of a non-multiplexed ssh connection.')
+flags.DEFINE_float('node_secs', 30., 'How long every node keeps running.')
+flags.DEFINE_boolean('dry_nodes', True,
+                     'Run `sleep` in the windows instead of the node entry '
+                     'point, to measure the launcher alone.')
+flags.DEFINE_string('output_dir', '.', 'Directory of results.json and results.csv.')
+
+PHASES = ('context_init', 'bind_addresses', 'to_executables', 'ssh_connect',
+          'session_creation', 'window_spawn', 'first_heartbeat')
+
+
+class _Idle:
+
+  def __init__(self, secs):
+    self._secs = secs
+
+  def run(self):
+    time.sleep(self._secs)
+
+
+def _make_program(num_hosts, num_nodes):
+  program = lp_ssh.Program('launch_latency', None)
+  for node_id in range(num_nodes):
+    host = 'bench-host-{}'.format(node_id % num_hosts)
+    program.add_node(lp_ssh.SSHNode(_Idle, FLAGS.node_secs).to_host(host), label=host)
+  return program
+
+
+def _run_once(num_hosts, num_nodes):
+  timings = {}
+
+  def timed(phase, fn, *args):
+    start = time.time()
+    result = fn(*args)
+    timings[phase] = time.time() - start
+    return result
+
+  program = _make_program(num_hosts, num_nodes)
+
+  def init_context():
+    for label, nodes in program.groups.items():
+      for node in nodes:
+        node._initialize_context(context.LaunchType.SSH_MULTI_PROCESSING,
+                                 launch_config=None)
+    for label, nodes in program.groups.items():
+      for node in nodes:
+        for handle in node._input_handles:
+          handle.connect(node, label)
+
+  def bind_addresses():
+    reserved_ports = port_reservation.reserve_program_ports(
+        program, FLAGS.lp_ssh_max_parallel_hosts, FLAGS.lp_ssh_host_timeout_secs,
+        FLAGS.lp_ssh_port_reservation_secs)
+    for node in program.get_all_nodes():
+      node.bind_addresses(reserved_ports=reserved_ports)
+
+  def to_executables():
+    commands = []
+    for label, nodes in program.groups.items():
+      commands.extend(nodes[0].to_executables(nodes, label, nodes[0]._launch_context))
+    if FLAGS.dry_nodes:
+      for command in commands:
+        command.command_as_list = ['sleep', str(FLAGS.node_secs)]
+    return commands
+
+  timed('context_init', init_context)
+  timed('bind_addresses', bind_addresses)
+  commands = timed('to_executables', to_executables)
+  hosts = {command.host: command.port for command in commands}
+  launch_dir = os.getcwd()
+
+  ssh_execute = timed('ssh_connect', lambda: {
+      host: ssh_pool.ssh_command(host, port) for host, port in hosts.items()})
+  sessions = timed('session_creation', launch_ssh_tmux._create_sessions,
+                   ssh_execute, 'bench', 'tmux', launch_dir,
+                   FLAGS.lp_ssh_max_parallel_hosts, FLAGS.lp_ssh_host_timeout_secs)
+  pids = timed('window_spawn', launch_ssh_tmux._spawn_all_windows,
+               ssh_execute, commands, sessions, 'tmux', launch_dir,
+               FLAGS.lp_ssh_max_parallel_hosts, FLAGS.lp_ssh_host_timeout_secs)
+
+  monitor = heartbeat.HeartbeatMonitor(FLAGS.lp_ssh_heartbeat_interval_secs)
+  start = time.time()
+  for host, port in hosts.items():
+    python = 'python3' if FLAGS.dry_nodes else commands[0].interpreter
+    monitor.start(host, port, python, sessions[host], pids[host])
+  while len(monitor.first_heartbeat()) < len(hosts):
+    if time.time() - start > FLAGS.lp_ssh_host_timeout_secs:
+      raise RuntimeError('Timed out waiting for the first heartbeats.')
+    time.sleep(0.01)
+  timings['first_heartbeat'] = max(monitor.first_heartbeat().values()) - start
+
+  monitor.close()
+  for host, port in hosts.items():
+    subprocess.call(ssh_execute[host] + ['tmux', 'kill-server'],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  ssh_pool.close_pool()
+  return timings
+
+
+def main(_):
+  shim_dir = os.path.dirname(os.path.abspath(__file__))
+  # Short root, tmux socket paths are limited to ~100 characters.
+  root = tempfile.mkdtemp(prefix='lpb')
+  os.environ['PATH'] = shim_dir + os.pathsep + os.environ['PATH']
+  os.environ['LP_SSH_SHIM_ROOT'] = root
+  os.environ['LP_SSH_SHIM_HANDSHAKE_SECS'] = str(FLAGS.handshake_secs)
+
+  results = []
+  try:
+    for num_hosts in map(int, FLAGS.hosts):
+      for num_nodes in map(int, FLAGS.nodes):
+        if num_nodes < num_hosts:
+          continue
+        for repeat in range(FLAGS.repeats):
+          timings = _run_once(num_hosts, num_nodes)
+          row = dict(hosts=num_hosts, nodes=num_nodes, repeat=repeat,
+                     total=sum(timings.values()), **timings)
+          print(json.dumps(row))
+          results.append(row)
+  finally:
+    shutil.rmtree(root, ignore_errors=True)
+
+  os.makedirs(FLAGS.output_dir, exist_ok=True)
+  with open(os.path.join(FLAGS.output_dir, 'results.json'), 'w') as f:
+    json.dump(results, f, indent=2)
+  with open(os.path.join(FLAGS.output_dir, 'results.csv'), 'w', newline='') as f:
+    writer = csv.DictWriter(f, ['hosts', 'nodes', 'repeat', 'total'] + list(PHASES))
+    writer.writeheader()
+    writer.writerows(results)
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares the serializers of the transmit info tables.
+
+For every serializer and message, measures the encode and decode throughput
+and the bytes on the wire (payload plus out-of-band buffers). Example:
+
+  python benchmark.py --large_array_mb 64 --output_dir /tmp/serializer_bench
+"""
+
+import csv
+import json
+import os
+import time
+
+from absl import app
+from absl import flags
+import numpy as np
+
+from tlaunch.lp_ssh.transmit import serializers
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_list('serializers', [], 'Serializers to compare, all available ones if empty.')
+flags.DEFINE_float('min_secs', 1., 'Minimum duration of every measurement.')
+flags.DEFINE_integer('large_array_mb', 16, 'Size of the large array message.')
+flags.DEFINE_string('output_dir', '.', 'Directory of results.json and results.csv.')
+
+FIELDS = ('serializer', 'message', 'bytes', 'encode_per_sec', 'decode_per_sec',
+          'encode_mb_per_sec', 'decode_mb_per_sec')
+
+
+def _messages():
+  rng = np.random.RandomState(0)
+  return {
+      # What actors typically report.
+      'rl_info': {
+          'episode': 1234, 'episode_return': 17.5, 'episode_length': 500,
+          'fps': 2400.3, 'host': 'actor-17', 'losses': [0.1, 0.02, 0.3],
+          'done': False,
+      },
+      # A batch of observations with their rewards and actions.
+      'small_arrays': {
+          'observation': rng.rand(32, 84, 84).astype(np.float32),
+          'reward': rng.rand(32).astype(np.float32),
+          'action': rng.randint(0, 18, size=32),
+          'episode': 1234,
+      },
+      'large_array': {
+          'weights': rng.rand(FLAGS.large_array_mb * 2 ** 18).astype(np.float32),
+      },
+  }
+
+
+def _wire_bytes(payload, buffers):
+  return len(payload) + sum(buffer.nbytes for buffer in buffers)
+
+
+def _rate(fn, min_secs):
+  """Returns how many times per second `fn` runs."""
+  count = 0
+  start = time.perf_counter()
+  while True:
+    fn()
+    count += 1
+    elapsed = time.perf_counter() - start
+    if elapsed >= min_secs:
+      return count / elapsed
+
+
+def _bench(serializer, message, min_secs):
+  payload, buffers = serializer.dumps(message)
+  # Like sampled columns, decoded buffers are not the encoded ones.
+  buffers = [np.array(buffer) for buffer in buffers]
+  size = _wire_bytes(payload, buffers)
+  encode_per_sec = _rate(lambda: serializer.dumps(message), min_secs)
+  decode_per_sec = _rate(lambda: serializer.loads(payload, buffers), min_secs)
+  return dict(bytes=size,
+              encode_per_sec=encode_per_sec,
+              decode_per_sec=decode_per_sec,
+              encode_mb_per_sec=encode_per_sec * size / 2 ** 20,
+              decode_mb_per_sec=decode_per_sec * size / 2 ** 20)
+
+
+def main(_):
+  names = FLAGS.serializers or serializers.available_serializers()
+  results = []
+  for message_name, message in _messages().items():
+    for name in names:
+      try:
+        row = _bench(serializers.get_serializer(name), message, FLAGS.min_secs)
+      except TypeError as e:
+        print('Skipping {} with {}: {}'.format(message_name, name, e))
+        continue
+      row = dict(serializer=name, message=message_name, **row)
+      print(json.dumps(row))
+      results.append(row)
+
+  os.makedirs(FLAGS.output_dir, exist_ok=True)
+  with open(os.path.join(FLAGS.output_dir, 'results.json'), 'w') as f:
+    json.dump(results, f, indent=2)
+  with open(os.path.join(FLAGS.output_dir, 'results.csv'), 'w', newline='') as f:
+    writer = csv.DictWriter(f, FIELDS)
+    writer.writeheader()
+    writer.writerows(results)
+
+
+if __name__ == '__main__':
+  app.run(main)
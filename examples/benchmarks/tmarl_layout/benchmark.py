@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares the table layouts of the sync mode of `tmarl_server`.
+
+For every layout and number of actors, starts a reverb server with the tables
+of the layout and runs synchronous rounds on it: the learner publishes
+weights, every actor fetches them, then inserts its experience, and the
+learner samples the experience of all actors. The three phases are timed
+separately. Example:
+
+  python benchmark.py --actors 10,100,1000 --rounds 20 --output_dir /tmp/layout_bench
+"""
+
+import csv
+import json
+import os
+import time
+from concurrent import futures
+
+from absl import app
+from absl import flags
+import numpy as np
+import portpicker
+import reverb
+
+from tlaunch.lp_ssh.transmit import tmarl_server
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_list('actors', ['10', '100', '1000'], 'Numbers of actors to sweep.')
+flags.DEFINE_list('layouts', list(tmarl_server.TABLE_LAYOUTS), 'Table layouts to compare.')
+flags.DEFINE_integer('rounds', 20, 'Number of synchronous rounds of every run.')
+flags.DEFINE_integer('actor_threads', 32, 'Threads running the actors.')
+flags.DEFINE_integer('weight_kb', 256, 'Size of the weights.')
+flags.DEFINE_integer('experience_kb', 64, 'Size of the experience of an actor per round.')
+flags.DEFINE_string('output_dir', '.', 'Directory of results.json and results.csv.')
+
+FIELDS = ('layout', 'actors', 'tables', 'startup_secs', 'rounds_per_sec',
+          'fetches_per_sec', 'inserts_per_sec', 'samples_per_sec')
+
+
+def _run_once(table_layout, actor_num):
+  start = time.perf_counter()
+  tables = tmarl_server.make_tables(table_layout, actor_num)
+  server = reverb.Server(tables=tables, port=portpicker.pick_unused_port())
+  startup_secs = time.perf_counter() - start
+
+  address = 'localhost:{}'.format(server.port)
+  learner = reverb.Client(address)
+  actors = [reverb.Client(address) for _ in range(FLAGS.actor_threads)]
+  weights = [np.zeros(FLAGS.weight_kb * 256, dtype=np.float32)]
+  experience = [np.zeros(FLAGS.experience_kb * 256, dtype=np.float32)]
+  last_keys = [None] * actor_num
+
+  def fetch(actor_id):
+    client = actors[actor_id % len(actors)]
+    last_keys[actor_id], _ = tmarl_server.fetch_weights(client, table_layout, actor_id,
+                                                        last_keys[actor_id])
+
+  def insert(actor_id):
+    client = actors[actor_id % len(actors)]
+    tmarl_server.insert_experience(client, table_layout, actor_id, experience)
+
+  def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+  def run_actors(executor, fn):
+    for future in [executor.submit(fn, actor_id) for actor_id in range(actor_num)]:
+      future.result()
+
+  fetch_secs = insert_secs = sample_secs = 0.
+  with futures.ThreadPoolExecutor(max_workers=FLAGS.actor_threads) as executor:
+    start = time.perf_counter()
+    for _ in range(FLAGS.rounds):
+      fetch_secs += timed(lambda: (
+          tmarl_server.publish_weights(learner, table_layout, actor_num, weights),
+          run_actors(executor, fetch)))
+      insert_secs += timed(lambda: run_actors(executor, insert))
+      sample_secs += timed(lambda: tmarl_server.sample_experiences(
+          learner, table_layout, actor_num))
+    elapsed = time.perf_counter() - start
+  server.stop()
+
+  items = FLAGS.rounds * actor_num
+
+  return dict(layout=table_layout,
+              actors=actor_num,
+              tables=len(tables),
+              startup_secs=startup_secs,
+              rounds_per_sec=FLAGS.rounds / elapsed,
+              # One weight fetch, experience insert and sample per actor and
+              # round, over the time of its phase.
+              fetches_per_sec=items / fetch_secs,
+              inserts_per_sec=items / insert_secs,
+              samples_per_sec=items / sample_secs)
+
+
+def main(_):
+  results = []
+  for actor_num in map(int, FLAGS.actors):
+    for table_layout in FLAGS.layouts:
+      row = _run_once(table_layout, actor_num)
+      print(json.dumps(row))
+      results.append(row)
+
+  os.makedirs(FLAGS.output_dir, exist_ok=True)
+  with open(os.path.join(FLAGS.output_dir, 'results.json'), 'w') as f:
+    json.dump(results, f, indent=2)
+  with open(os.path.join(FLAGS.output_dir, 'results.csv'), 'w', newline='') as f:
+    writer = csv.DictWriter(f, FIELDS)
+    writer.writeheader()
+    writer.writerows(results)
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -46,8 +46,10 @@ class Displayer:
     self.client = client
 
   def run(self):
+    version = 0
     while True:
-      gpu_status = self.client.get_info()
+      # Only prints the status again once a host sent a new one.
+      version, gpu_status = self.client.wait_for_info(version)
       for host in gpu_status:
         print('Host {}:'.format(host))
         for g_s in gpu_status[host]:
@@ -6,10 +6,16 @@ from base_trainer import MultiGPUTrainer
 
 def main(argv):
   program = lp_ssh.Program('mnist_distributed')
+  local_resources = {}
   for host_index, host in enumerate(['host1','host2','host3','host4']):
     ssh_node = lp_ssh.SSHNode(MultiGPUTrainer, argv, host_index).to_host(host)
-    program.add_node(ssh_node, label=host + '_MultiGPUTrainer')
-  lp_ssh.launch(program, terminal='ssh_tmux_session')
+    label = host + '_MultiGPUTrainer'
+    program.add_node(ssh_node, label=label)
+    # CUDA can not be used in forked subprocesses, and importing torch before
+    # the trainer is unpickled shows up in the startup profile.
+    local_resources[label] = lp_ssh.SSHPythonProcess(start_method='spawn',
+                                                     preimports=('torch',))
+  lp_ssh.launch(program, local_resources=local_resources, terminal='ssh_tmux_session')
 
 if __name__ == '__main__':
   from absl import flags
@@ -20,6 +20,7 @@ import time
 from absl import app
 
 from tlaunch import lp_ssh
+from tlaunch.lp_ssh.transmit import aggregator
 
 class Worker:
   def __init__(self,host,client):
@@ -29,70 +30,41 @@ class Worker:
   def run(self):
     while True:
       try:
-        self.client.send_info({self.host:1})
+        self.client.send_info({self.host:1}, table=aggregator.AGGREGATION_TABLE)
         time.sleep(5)
       except:
         break
     lp_ssh.stop()
 
-class MiddelConsumer:
-  def __init__(self,host,middle_clients,root_client):
-    self.host = host
-    self.leaf_clients = middle_clients
-    self.root_client = root_client
-
-  def run(self):
-    while True:
-      try:
-        for middle_client in self.middle_clients:
-          rec_info = middle_client.get_info()
-          print('{} receives {}'.format(self.host,rec_info))
-          self.root_client.send_info(rec_info)
-      except:
-        break
-    lp_ssh.stop()
-
 class RootConsumer:
   def __init__(self,host,client):
     self.host = host
     self.client = client
 
   def run(self):
-    while True:
-      try:
-        rec_info = self.client.get_info()
+    try:
+      for rec_info in aggregator.iter_messages(self.client):
         print('Root consumer receives {}'.format(rec_info))
-      except:
-        break
+    except:
+      pass
     lp_ssh.stop()
 
 
 def make_tree_type():
   program = lp_ssh.Program('tree_type')
-  root_host = 'host1'
-  root_server = lp_ssh.TransmitNode().to_host(root_host)
-  root_client = program.add_node(root_server, label=root_host)
-
-  root_consumer_node = lp_ssh.SSHNode(RootConsumer, root_host, root_client).to_host(root_host)
-  program.add_node(root_consumer_node, label=root_host)
-
-
-  middel_hosts = ['host2','host3']
-  middle_clients = []
-  for middle_host in middel_hosts:
-    middle_server = lp_ssh.TransmitNode().to_host(middle_host)
-    middle_clients.append(program.add_node(middle_server, label=middle_host))
-
-  for middle_host in middel_hosts:
-    middle_consumer_node = lp_ssh.SSHNode(MiddelConsumer, middle_host, middle_clients,root_client).to_host(middle_host)
-    program.add_node(middle_consumer_node, label=middle_host)
-
-  leaf_hosts = {'host2':['host4','host5'],'host3':['host6','host7']}
-
-  for middle_host_id,middle_host in enumerate(middel_hosts):
-    for leaf_host in leaf_hosts[middle_host]:
-      ssh_node  = lp_ssh.SSHNode(Worker,leaf_host,middle_clients[middle_host_id]).to_host(leaf_host)
-      program.add_node(ssh_node, label=leaf_host)
+  # host1 is the root, it aggregates host2 and host3, which aggregate
+  # host4 to host7.
+  hosts = ['host1','host2','host3','host4','host5','host6','host7']
+  tree = lp_ssh.build_aggregation_tree(program, hosts, arity=2, flush_interval_secs=1.)
+
+  root_consumer_node = lp_ssh.SSHNode(RootConsumer, hosts[0], tree.root).to_host(hosts[0])
+  program.add_node(root_consumer_node, label=hosts[0])
+
+  for host_id, leaf_host in enumerate(hosts):
+    if host_id < 3:
+      continue
+    ssh_node  = lp_ssh.SSHNode(Worker,leaf_host,tree.servers[host_id]).to_host(leaf_host)
+    program.add_node(ssh_node, label=leaf_host)
 
   lp_ssh.launch(program, terminal='ssh_tmux_session')
 
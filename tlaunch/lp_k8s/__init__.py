@@ -5,3 +5,4 @@ from .config import Config, Container
 from .node.reverb import ReverbNode
 from .node.courier import CourierNode
 from .source import Source, GitSource
+from .startup import startup_report
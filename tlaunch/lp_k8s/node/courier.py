@@ -1,14 +1,26 @@
 import launchpad as lp
 from launchpad import address as lp_address
+from launchpad.nodes import dereference
 from launchpad.nodes.courier import courier_utils
+import tree
+
+from tlaunch.utils import startup_profile
 
 from . import common
 
 
 class CourierNode(lp.CourierNode):
   """Inherits `CourierNode` from launchpad and remove `worker_manager` from it."""
+  def _construct_instance(self):
+    # Same as launchpad, with the phase the ssh nodes also record.
+    args, kwargs = tree.map_structure(dereference.maybe_dereference,
+                                      (self._args, self._kwargs))
+    startup_profile.mark(startup_profile.HANDLES_DEREFERENCED)
+    return self._constructor(*args, **kwargs)
+
   def run(self) -> None:
     instance = self._construct_instance()  # pytype:disable=wrong-arg-types
+    startup_profile.mark(startup_profile.CONSTRUCTED)
     self._server = courier_utils.make_courier_server(
         instance,
         port=lp_address.get_port_from_address(self._address.resolve()),
@@ -17,11 +29,13 @@ class CourierNode(lp.CourierNode):
       # Transfer the ownership of the server to the instance, so that the user
       # can decide when to start and stop the courier server.
       instance.set_courier_server(self._server)
+      startup_profile.mark(startup_profile.RUN_STARTED)
       if hasattr(instance, 'run') and self._should_run:
         instance.run()
     else:
       # Start the server after instantiation and serve forever
       self._server.Start()
+      startup_profile.mark(startup_profile.RUN_STARTED)
       if hasattr(instance, 'run') and self._should_run:
         # If a run() method is provided, stop the server at the end of run().
         instance.run()
@@ -1,6 +1,8 @@
 import launchpad as lp
 import reverb
 
+from tlaunch.utils import startup_profile
+
 from . import common
 
 
@@ -12,9 +14,11 @@ class ReverbNode(lp.ReverbNode):
       checkpointer = None
     else:
       checkpointer = self._checkpoint_ctor()
+    startup_profile.mark(startup_profile.CONSTRUCTED)
 
     self._server = reverb.Server(tables=priority_tables,
                                  port=lp.get_port_from_address(
                                      self._address.resolve()),
                                  checkpointer=checkpointer)
+    startup_profile.mark(startup_profile.RUN_STARTED)
     common.wait_for_stop()
@@ -4,6 +4,10 @@ This is mostly copied from launchpad, but slimmer.
 Note that this is only usable with my implementation of lp-operator.
 """
 
+import time
+
+_ENTRY_START_TIME = time.time()
+
 import builtins
 import contextlib
 import os
@@ -14,6 +18,13 @@ from types import ModuleType
 
 import cloudpickle
 
+# Imported before missing imports are masked below, the startup phases are not
+# recorded when tlaunch is not installed in the image.
+try:
+  from tlaunch.utils import startup_profile
+except ImportError:
+  startup_profile = None
+
 
 class DummyModule(ModuleType):
   def __getattr__(self, key):
@@ -34,6 +45,8 @@ realimport, builtins.__import__ = builtins.__import__, tryimport
 
 CONFIG_DIR = '/etc/config'
 SOURCE_DIR = '/workdir'
+# Set in the environment of a container to record its startup phases.
+STARTUP_PROFILE_DIR_ENV = 'LP_STARTUP_PROFILE_DIR'
 
 
 def main():
@@ -41,13 +54,23 @@ def main():
   node_name, _, lp_task_id = platform.node().rpartition('-')
   task_id = int(lp_task_id)
 
+  if startup_profile is not None and os.environ.get(STARTUP_PROFILE_DIR_ENV):
+    # Records are also printed, to be collected from the logs of the pods.
+    startup_profile.configure(os.environ[STARTUP_PROFILE_DIR_ENV], platform.node(),
+                              interpreter_start=_ENTRY_START_TIME, echo=True)
+
   if os.path.exists(SOURCE_DIR):
     for dirpath in os.listdir(SOURCE_DIR):
       path = os.path.join(SOURCE_DIR, dirpath)
       if os.path.islink(path):
         sys.path.append(path)
+  if startup_profile is not None:
+    startup_profile.mark(startup_profile.FLAGS_POPULATED)
 
   functions = cloudpickle.load(open(os.path.join(CONFIG_DIR, node_name), 'rb'))
+  if startup_profile is not None:
+    startup_profile.mark(startup_profile.PAYLOAD_UNPICKLED)
+  # The nodes record the next phases, from HANDLES_DEREFERENCED on.
 
   with contextlib.suppress():  # no-op context manager
     functions[task_id]()
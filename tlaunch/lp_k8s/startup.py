@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import List, Optional
+
+from kubernetes import client, config
+
+from tlaunch.lp_k8s.client import validate_name
+from tlaunch.utils import startup_profile
+
+
+def collect_startup_records(job_name: Optional[str] = None,
+                            namespace: Optional[str] = None,
+                            kube_config: Optional[str] = None) -> List[dict]:
+  """Reads the startup records printed by the pods of an lpjob.
+
+  Pods only print records when `LP_STARTUP_PROFILE_DIR` is set in the
+  environment of their container.
+  """
+  job_name = validate_name(job_name)
+  namespace = namespace or 'default'
+  try:
+    config.load_incluster_config()
+  except Exception:
+    config.load_kube_config(kube_config)
+
+  api = client.CoreV1Api()
+  records = []
+  for pod in api.list_namespaced_pod(namespace,
+                                     label_selector=f'app={job_name}').items:
+    try:
+      log = api.read_namespaced_pod_log(pod.metadata.name, namespace)
+    except client.exceptions.ApiException:
+      # Not scheduled yet.
+      continue
+    record = startup_profile.parse_log(log)
+    if record is not None:
+      records.append(record)
+  return records
+
+
+def startup_report(job_name: Optional[str] = None,
+                   namespace: Optional[str] = None,
+                   kube_config: Optional[str] = None) -> str:
+  """Returns the startup time report of the pods of an lpjob."""
+  records = collect_startup_records(job_name, namespace, kube_config)
+  return startup_profile.format_report(startup_profile.aggregate(records))
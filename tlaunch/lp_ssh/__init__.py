@@ -18,14 +18,16 @@
 
 from .nodes.normal_node import PyClassNode
 
-from .nodes.ssh_node import SSHNode
+from .nodes.ssh_node import SSHNode, SSHPythonProcess
 
 from .stop_program.stop import stop
 from .launch.launch import launch
 from .kill_tmux import kill_tmux
 from .program import Program
+from .placement import Host, PlacementError, Resources
 
 
-from .nodes.transmit.node import TransmitNode,RLTransmitNode
+from .nodes.transmit.node import TransmitNode,RLTransmitNode,ShardedTransmitNode
+from .nodes.transmit.aggregator import AggregatorNode, build_aggregation_tree
 
 from tlaunch.lp_ssh import flags
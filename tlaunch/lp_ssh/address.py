@@ -18,6 +18,8 @@
 import abc
 import os
 import re
+import socket
+import time
 from typing import Optional
 from absl import logging
 import portpicker
@@ -52,10 +54,17 @@ class LocalAddressBuilder(SimpleLocalAddressBuilder):
 
 
 class CustomAddress:
-    def __init__(self, host, port):
+    def __init__(self, host, port, client_port=None, reservation_dir=None):
         self.host = host
         self.port = port
-        self.client_port = portpicker.pick_unused_port()
+        # Ports reserved on the host are held there until `release` is called,
+        # others are picked on the launcher.
+        self.client_port = client_port or portpicker.pick_unused_port()
+        self.reservation_dir = reservation_dir
+
+    def release(self):
+        if getattr(self, 'reservation_dir', None):
+            release_port(self.reservation_dir, self.client_port)
 
     def split(self, split_char):
         if split_char == ':':
@@ -74,10 +83,13 @@ class CustomAddress:
         return "host:{},host port:{},client port:{}".format(self.host,self.port,self.client_port)
 
 class HostAddressBuilder(SimpleLocalAddressBuilder):
-    def __init__(self, host, port):
+    def __init__(self, host, port, client_port=None, reservation_dir=None):
         # This automatically makes use of PORTSERVER_ADDRESS (usually set by test)
         # self._address = '{}:{}'.format(host, portpicker.pick_unused_port())
-        self._address = CustomAddress(host,port)
+        self._address = CustomAddress(host, port, client_port, reservation_dir)
+
+    def release(self):
+        self._address.release()
 
 
 class Address(object):
@@ -137,6 +149,15 @@ class Address(object):
 
         return self._address_builder.build()
 
+    def release_reservation(self) -> None:
+        """Frees the port reserved for this address on its host, if any.
+
+        Must be called by the owning node right before it binds the address.
+        """
+        release = getattr(self._address_builder, 'release', None)
+        if release is not None:
+            release()
+
     def assign(self, node) -> None:
         """Assigns the Address to the specified node (must be done exactly once)."""
         if self._owning_node is not None:
@@ -161,6 +182,18 @@ class Address(object):
 
 
 class HostAddress(Address):
+    def __init__(self, name: Optional[str] = None, reserve: bool = False):
+        """Initializes an address on the host of its node.
+
+        Args:
+          name: (Optional) Name of the address.
+          reserve: Whether the launcher reserves the port on the host, see
+            `port_reservation`. The owning node must then call
+            `release_reservation` right before it binds the address.
+        """
+        super().__init__(name)
+        self.reserve = reserve
+
     def to_host(self, host):
         if ":" in host:
             self.host = host.split(":")[0]
@@ -170,6 +203,29 @@ class HostAddress(Address):
             self.port = "22"
 
 
+def release_port(reservation_dir: str, port: int, timeout: float = 10.) -> None:
+    """Asks the port holder of this host to free `port` and waits until it did.
+
+    See `launch/run_ssh/port_holder.py`.
+    """
+    try:
+        os.remove(os.path.join(reservation_dir, str(port)))
+    except FileNotFoundError:
+        # Not held (anymore).
+        return
+    deadline = time.time() + timeout
+    while True:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            try:
+                sock.bind(('', int(port)))
+                return
+            except OSError:
+                if time.time() > deadline:
+                    logging.warning('Port %s is still held after %ss', port, timeout)
+                    return
+        time.sleep(0.05)
+
+
 def get_port_from_address(address: str) -> int:
     """Returns the port from a given address.
 
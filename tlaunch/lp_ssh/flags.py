@@ -32,6 +32,53 @@ try:
 except:
     pass
 
-
-
-
+MAX_PARALLEL_HOSTS = flags.DEFINE_integer(
+    'lp_ssh_max_parallel_hosts', 32,
+    'Maximum number of hosts contacted concurrently while setting up the tmux '
+    'sessions of an ssh launch.')
+HOST_TIMEOUT_SECS = flags.DEFINE_float(
+    'lp_ssh_host_timeout_secs', 60.,
+    'Timeout in seconds of a single ssh round trip to a host during launch.')
+POLL_INTERVAL_SECS = flags.DEFINE_float(
+    'lp_ssh_poll_interval_secs', 0.5,
+    'Initial interval in seconds between two liveness checks of remote '
+    'workers. The interval backs off while no worker changes state.')
+MAX_POLL_INTERVAL_SECS = flags.DEFINE_float(
+    'lp_ssh_max_poll_interval_secs', 5.,
+    'Upper bound in seconds of the backed off liveness check interval.')
+HEARTBEAT = flags.DEFINE_boolean(
+    'lp_ssh_heartbeat', True,
+    'Start a heartbeat agent next to the tmux session of every host, which '
+    'pushes worker exits to the launcher instead of having them polled.')
+HEARTBEAT_INTERVAL_SECS = flags.DEFINE_float(
+    'lp_ssh_heartbeat_interval_secs', 0.2,
+    'Interval in seconds at which heartbeat agents check their workers.')
+STARTUP_PROFILE_DIR = flags.DEFINE_string(
+    'lp_ssh_startup_profile_dir', '',
+    'If set, every node records when it reaches each phase of its startup in '
+    'a sub directory of this path on its host, and the launcher reports the '
+    'startup time of the program once all nodes are running.')
+STARTUP_REPORT_TIMEOUT_SECS = flags.DEFINE_float(
+    'lp_ssh_startup_report_timeout_secs', 600.,
+    'How long the launcher waits for all nodes to start before reporting the '
+    'startup time of the nodes started so far.')
+RESERVE_PORTS = flags.DEFINE_boolean(
+    'lp_ssh_reserve_ports', True,
+    'Reserve the ports of the addresses created with `reserve=True`, e.g. '
+    'those of the transmit servers, on their hosts at launch, with one round '
+    'trip per host, instead of picking them on the launcher.')
+PORT_RESERVATION_SECS = flags.DEFINE_float(
+    'lp_ssh_port_reservation_secs', 600.,
+    'How long a reserved port is held on its host if its server does not '
+    'release it by binding it.')
+PLACEMENT_PLAN_PATH = flags.DEFINE_string(
+    'lp_ssh_placement_plan_path', '',
+    'If set, the placement of the groups of a program with an inventory is '
+    'written to this JSON file at launch.')
+HOST_FACTS_CACHE = flags.DEFINE_string(
+    'lp_ssh_host_facts_cache', '~/.cache/tlaunch/host_facts.json',
+    'JSON file caching the facts (interpreter, cores, memory, GPUs, tmux '
+    'sessions) collected from the hosts of a launch.')
+HOST_FACTS_TTL_SECS = flags.DEFINE_float(
+    'lp_ssh_host_facts_ttl_secs', 300.,
+    'How long the cached facts of a host are used before probing it again.')
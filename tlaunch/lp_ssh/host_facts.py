@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Facts about the hosts of a launch, collected in parallel and cached on disk.
+
+Facts are collected with a single ssh round trip per host (a shell script,
+so nothing but a POSIX shell is needed on the host) and cached in a JSON file
+for `ttl_secs`, so that later launches, placement and preflight checks do not
+probe the hosts again.
+"""
+
+import fcntl
+import json
+import os
+import shlex
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent import futures
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from absl import logging
+
+from tlaunch.lp_ssh import placement
+from tlaunch.lp_ssh import ssh_pool
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'tlaunch',
+                                  'host_facts.json')
+DEFAULT_TTL_SECS = 300.
+
+HostKey = Tuple[str, str]
+
+_PROBE_SCRIPT = """
+py={python}
+if path=$(command -v "$py" 2>/dev/null) && [ -x "$path" ]; then
+  echo "python=$path"
+  echo "python_version=$("$path" -c 'import platform; print(platform.python_version())' 2>/dev/null)"
+fi
+echo "cpus=$(nproc 2>/dev/null || getconf _NPROCESSORS_ONLN 2>/dev/null)"
+echo "memory_total_kb=$(awk '/^MemTotal:/ {{print $2}}' /proc/meminfo 2>/dev/null)"
+echo "memory_available_kb=$(awk '/^MemAvailable:/ {{print $2}}' /proc/meminfo 2>/dev/null)"
+echo "gpus=$(nvidia-smi -L 2>/dev/null | grep -c '^GPU')"
+echo "tmux_sessions=$(tmux ls -F '#{{session_name}}' 2>/dev/null | tr '\\n' ' ')"
+"""
+
+
+class HostFacts(NamedTuple):
+  host: str
+  port: str
+  # Absolute path of the probed interpreter, None if it is not executable.
+  python: Optional[str]
+  python_version: Optional[str]
+  cpus: int
+  memory_total_gb: float
+  memory_available_gb: float
+  gpus: int
+  # tmux sessions running when the facts were collected.
+  tmux_sessions: List[str]
+  collected_at: float
+
+
+def _parse(host: str, port: str, output: str) -> HostFacts:
+  values = {}
+  for line in output.splitlines():
+    key, sep, value = line.partition('=')
+    if sep:
+      values[key.strip()] = value.strip()
+
+  def number(key, cast=int):
+    try:
+      return cast(values.get(key, '') or 0)
+    except ValueError:
+      return cast(0)
+
+  return HostFacts(host=host,
+                   port=port,
+                   python=values.get('python') or None,
+                   python_version=values.get('python_version') or None,
+                   cpus=number('cpus'),
+                   memory_total_gb=number('memory_total_kb', float) / 2 ** 20,
+                   memory_available_gb=number('memory_available_kb', float) / 2 ** 20,
+                   gpus=number('gpus'),
+                   tmux_sessions=values.get('tmux_sessions', '').split(),
+                   collected_at=time.time())
+
+
+def probe(host: str, port: str = '22', python: str = 'python3',
+          timeout: float = 60.) -> HostFacts:
+  """Collects the facts of `host` with a single round trip."""
+  command = ['sh', '-s']
+  if not ssh_pool.is_local(host):
+    command = ssh_pool.ssh_command(host, port) + command
+  output = subprocess.check_output(
+      command, input=_PROBE_SCRIPT.format(python=shlex.quote(python)).encode(),
+      stderr=subprocess.DEVNULL, timeout=timeout)
+  return _parse(host, str(port), output.decode())
+
+
+class HostFactsCache:
+  """JSON file of facts by host, ssh port and interpreter.
+
+  Writes hold an flock on `<path>.lock`, so that concurrent launches do not
+  lose each other's entries. Reads need no lock, the file is replaced
+  atomically.
+  """
+
+  def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_secs: float = DEFAULT_TTL_SECS):
+    self._path = path
+    self._ttl_secs = ttl_secs
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def _key(host: str, port: str, python: str) -> str:
+    return '{}:{}:{}'.format(host, port, python)
+
+  def _read(self) -> Dict[str, Dict]:
+    try:
+      with open(self._path) as f:
+        return json.load(f)
+    except (OSError, ValueError):
+      return {}
+
+  def get(self, host: str, port: str, python: str) -> Optional[HostFacts]:
+    """Returns the facts of the host if they are younger than the TTL."""
+    with self._lock:
+      entry = self._read().get(self._key(host, port, python))
+    if entry is None:
+      return None
+    facts = HostFacts(**entry)
+    if time.time() - facts.collected_at > self._ttl_secs:
+      return None
+    return facts
+
+  def put(self, python: str, facts: Iterable[HostFacts]) -> None:
+    """Stores the facts of several hosts, probed with `python`, in one write."""
+    facts = list(facts)
+    if not facts:
+      return
+    os.makedirs(os.path.dirname(self._path) or '.', exist_ok=True)
+    with self._lock, open(self._path + '.lock', 'a') as lock_file:
+      fcntl.flock(lock_file, fcntl.LOCK_EX)
+      try:
+        entries = self._read()
+        now = time.time()
+        entries = {key: entry for key, entry in entries.items()
+                   if now - entry.get('collected_at', 0) <= self._ttl_secs}
+        for host_facts in facts:
+          entries[self._key(host_facts.host, host_facts.port, python)] = host_facts._asdict()
+        # Written atomically, concurrent launches may read the file.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self._path) or '.',
+                                        prefix='.host_facts')
+        with os.fdopen(fd, 'w') as f:
+          json.dump(entries, f)
+        os.replace(tmp_path, self._path)
+      finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _collect(hosts: Sequence[HostKey], python: str, max_parallel_hosts: int,
+             timeout: float, cache: HostFactsCache,
+             refresh: bool) -> Tuple[Dict[HostKey, HostFacts], Set[HostKey]]:
+  """Returns the facts of `collect` and the hosts whose facts were cached."""
+  facts = {}
+  to_probe = []
+  for host, port in dict.fromkeys((host, str(port)) for host, port in hosts):
+    cached = None if refresh else cache.get(host, port, python)
+    if cached is None:
+      to_probe.append((host, port))
+    else:
+      facts[(host, port)] = cached
+  cached_hosts = set(facts)
+  if not to_probe:
+    return facts, cached_hosts
+
+  probed = {}
+  with futures.ThreadPoolExecutor(max_workers=max(1, max_parallel_hosts)) as executor:
+    future_to_key = {executor.submit(probe, host, port, python, timeout): (host, port)
+                     for host, port in to_probe}
+    for future in futures.as_completed(future_to_key):
+      host, port = future_to_key[future]
+      try:
+        probed[(host, port)] = future.result()
+      except Exception as e:  # pylint: disable=broad-except
+        # E.g. ssh failing, timing out, or missing on the launcher.
+        logging.warning('Unable to collect the facts of %s:%s: %s', host, port, e)
+  cache.put(python, probed.values())
+  facts.update(probed)
+  return facts, cached_hosts
+
+
+def collect(hosts: Sequence[HostKey],
+            python: str = 'python3',
+            max_parallel_hosts: int = 32,
+            timeout: float = 60.,
+            cache: Optional[HostFactsCache] = None,
+            refresh: bool = False) -> Dict[HostKey, HostFacts]:
+  """Returns the facts of every (host, ssh port), probing the hosts concurrently.
+
+  Hosts with fresh facts in `cache` are not probed, unless `refresh`. Hosts
+  which could not be probed are logged and left out of the result.
+  """
+  return _collect(hosts, python, max_parallel_hosts, timeout, cache or HostFactsCache(),
+                  refresh)[0]
+
+
+def _split_host(name: str) -> HostKey:
+  host, _, port = name.partition(':')
+  return host, port or '22'
+
+
+def inventory(host_names: Sequence[str], **kwargs) -> List[placement.Host]:
+  """Returns the placement inventory of `host_names` ('host' or
+  'host:ssh_port'), sized by their cores, available memory and GPUs.
+
+  Args:
+    host_names: Hosts of the inventory.
+    **kwargs: Passed to `collect`.
+  """
+  facts = collect([_split_host(name) for name in host_names], **kwargs)
+  hosts = []
+  for name in host_names:
+    host_facts = facts.get(_split_host(name))
+    if host_facts is None:
+      logging.warning('Leaving %s out of the inventory, its facts are unknown', name)
+      continue
+    hosts.append(placement.Host(name, host_facts.cpus, host_facts.memory_available_gb,
+                                host_facts.gpus))
+  return hosts
+
+
+def check_interpreters(commands, max_parallel_hosts: int = 32, timeout: float = 60.,
+                       cache: Optional[HostFactsCache] = None) -> None:
+  """Checks that the interpreter of every command is executable on its host.
+
+  Raises:
+    ValueError: if an interpreter is missing on a host, or a host could not
+      be probed.
+  """
+  cache = cache or HostFactsCache()
+  hosts_by_python = {}
+  for command in commands:
+    hosts_by_python.setdefault(command.command_as_list[0], set()).add(
+        (command.host, str(command.port)))
+  for python, hosts in sorted(hosts_by_python.items()):
+    facts, cached_hosts = _collect(sorted(hosts), python, max_parallel_hosts, timeout, cache,
+                                   refresh=False)
+    # Interpreters may have been installed since the facts were cached, hosts
+    # probed by this call are not probed again.
+    stale = sorted(key for key in cached_hosts if facts[key].python is None)
+    if stale:
+      facts.update(collect(stale, python, max_parallel_hosts, timeout, cache, refresh=True))
+    missing = sorted('{}:{}'.format(*key) for key in hosts
+                     if key not in facts or facts[key].python is None)
+    if missing:
+      raise ValueError("Unable to execute '{}' on {}".format(python, ', '.join(missing)))
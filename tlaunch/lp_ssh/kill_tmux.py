@@ -17,6 +17,11 @@
 """"""
 
 import subprocess
+
+from tlaunch.lp_ssh import ssh_pool
+from tlaunch.lp_ssh.launch.run_ssh import heartbeat
+
+
 def kill_tmux_on_host(host_origin,session_name_prefix,kill_all):
     multiplexer = "tmux"
 
@@ -33,7 +38,14 @@ def kill_tmux_on_host(host_origin,session_name_prefix,kill_all):
             if host == "localhost":
                 exec_command_list = [multiplexer, 'kill-server']
             else:
-                exec_command_list = ['ssh', '-p', port, host] + [multiplexer, 'kill-server']
+                exec_command_list = ssh_pool.ssh_command(host, port) + [multiplexer, 'kill-server']
+            subprocess.check_output(exec_command_list)
+            # Status directories of all sessions, see `heartbeat.status_dir`.
+            remove_command = 'rm -rf {}'.format(heartbeat.status_dir('*'))
+            if host == "localhost":
+                exec_command_list = ['sh', '-c', remove_command]
+            else:
+                exec_command_list = ssh_pool.ssh_command(host, port) + [remove_command]
             subprocess.check_output(exec_command_list)
 
         except:
@@ -46,7 +58,7 @@ def kill_tmux_on_host(host_origin,session_name_prefix,kill_all):
                 exec_command_list = [multiplexer, 'ls']
 
             else:
-                exec_command_list = ['ssh', '-p', port, host] + [multiplexer, 'ls']
+                exec_command_list = ssh_pool.ssh_command(host, port) + [multiplexer, 'ls']
 
             output = subprocess.check_output(exec_command_list,
                                     stderr=subprocess.STDOUT)
@@ -64,9 +76,10 @@ def kill_tmux_on_host(host_origin,session_name_prefix,kill_all):
                     if host == "localhost":
                         exec_command_list = [multiplexer, 'kill-session', '-t', name]
                     else:
-                        exec_command_list = ['ssh', '-p', port, host] + [multiplexer, 'kill-session', '-t', name]
+                        exec_command_list = ssh_pool.ssh_command(host, port) + [multiplexer, 'kill-session', '-t', name]
                     print("\t"+" ".join(exec_command_list))
                     subprocess.check_output(exec_command_list)
+                    heartbeat.remove_status_dir(host, port, name)
         except:
             pass
 
@@ -29,7 +29,10 @@ from launchpad.launch.run_locally.run_locally import SEPARATE_TERMINAL_TMUX_SESS
 from launchpad.launch.run_locally import feature_testing
 
 from tlaunch.lp_ssh import context
+from tlaunch.lp_ssh import host_facts
+from tlaunch.lp_ssh import placement
 from .run_ssh.launch_ssh_tmux import launch_with_ssh_tmux_session
+from .run_ssh import port_reservation
 
 FLAGS = flags.FLAGS
 
@@ -126,15 +129,36 @@ def launch(
           context.LaunchType.SSH_MULTI_PROCESSING,
           launch_config=launch_config)
 
+  facts_cache = host_facts.HostFactsCache(os.path.expanduser(FLAGS.lp_ssh_host_facts_cache),
+                                          FLAGS.lp_ssh_host_facts_ttl_secs)
+
+  # Place the nodes without a host on the inventory of the program.
+  if terminal == SEPARATE_SSH_TERMINAL_TMUX_SESSION and program.inventory:
+    inventory = program.inventory
+    if all(isinstance(host, str) for host in inventory):
+      # Host names, sized by their facts.
+      inventory = host_facts.inventory(
+          inventory, max_parallel_hosts=FLAGS.lp_ssh_max_parallel_hosts,
+          timeout=FLAGS.lp_ssh_host_timeout_secs, cache=facts_cache)
+    placement_plan = placement.place(program, inventory)
+    logging.info(placement_plan.format())
+    if FLAGS.lp_ssh_placement_plan_path:
+      placement_plan.write(FLAGS.lp_ssh_placement_plan_path)
+
   # Notify the input handles
   for label, nodes in program.groups.items():
     for node in nodes:
       for handle in node._input_handles:
         handle.connect(node, label)
 
-  # Bind addresses
+  # Bind addresses, with their ports reserved on the hosts of the servers.
+  reserved_ports = None
+  if terminal == SEPARATE_SSH_TERMINAL_TMUX_SESSION and FLAGS.lp_ssh_reserve_ports:
+    reserved_ports = port_reservation.reserve_program_ports(
+        program, FLAGS.lp_ssh_max_parallel_hosts, FLAGS.lp_ssh_host_timeout_secs,
+        FLAGS.lp_ssh_port_reservation_secs)
   for node in program.get_all_nodes():
-    node.bind_addresses()
+    node.bind_addresses(reserved_ports=reserved_ports)
 
 
   commands = []
@@ -152,8 +176,15 @@ def launch(
 
   for command in commands:
     print("{}:{} to use python: {}".format(command.host,command.port, command.command_as_list[0]) )
-    if not os.access(command.command_as_list[0], os.X_OK):
-      raise ValueError("Unable to execute '%s'" % command.command_as_list[0])
+  if terminal == SEPARATE_SSH_TERMINAL_TMUX_SESSION:
+    # The interpreters are checked on the hosts of the commands, from the facts
+    # cached by previous launches when they are recent enough.
+    host_facts.check_interpreters(commands, FLAGS.lp_ssh_max_parallel_hosts,
+                                  FLAGS.lp_ssh_host_timeout_secs, facts_cache)
+  else:
+    for command in commands:
+      if not os.access(command.command_as_list[0], os.X_OK):
+        raise ValueError("Unable to execute '%s'" % command.command_as_list[0])
 
 
   terminal_name = _get_terminal(terminal)
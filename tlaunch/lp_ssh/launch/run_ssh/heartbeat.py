@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Launcher side of the heartbeat agents running next to the tmux sessions."""
+
+import json
+import os
+import shlex
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from absl import logging
+
+from tlaunch.lp_ssh import ssh_pool
+
+_AGENT_PATH = os.path.join(os.path.dirname(__file__), 'heartbeat_agent.py')
+
+HostKey = Tuple[str, str]
+
+
+def status_dir(session_name: str) -> str:
+  """Returns the directory in which the panes of a session write return codes."""
+  return '/tmp/lp_ssh_status_{}'.format(session_name)
+
+
+def remove_status_dir(host: str, port: str, session_name: str,
+                      timeout: float = 30.) -> None:
+  """Removes the status directory of a session once its panes are done."""
+  if ssh_pool.is_local(host):
+    command = ['rm', '-rf', status_dir(session_name)]
+  else:
+    command = ssh_pool.ssh_command(host, port) + [
+        'rm', '-rf', shlex.quote(status_dir(session_name))]
+  try:
+    subprocess.call(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                    timeout=timeout)
+  except (OSError, subprocess.TimeoutExpired) as e:
+    logging.warning('Failed to remove %s on %s: %s', status_dir(session_name), host, e)
+
+
+class HeartbeatMonitor:
+  """Runs one heartbeat agent per host and collects the events they stream.
+
+  Every agent is started with a single ssh command (over the pooled master
+  connection) whose stdout stays open for the lifetime of the program, so
+  exits are pushed to the launcher instead of being polled.
+  """
+
+  def __init__(self, interval_secs: float = 0.2, stats_interval_secs: float = 5.):
+    self._interval_secs = interval_secs
+    self._stats_interval_secs = stats_interval_secs
+    self._lock = threading.Lock()
+    self._channels = {}  # type: Dict[HostKey, subprocess.Popen]
+    self._connected = {}  # type: Dict[HostKey, bool]
+    self._returncodes = {}  # type: Dict[Tuple[str, str, int], Optional[int]]
+    self._stats = {}  # type: Dict[Tuple[str, str, int], dict]
+    self._first_heartbeat = {}  # type: Dict[HostKey, float]
+    self._sessions = {}  # type: Dict[HostKey, str]
+    self._changed = threading.Event()
+
+  def _agent_command(self, host: str, port: str, python: str,
+                     session_name: str, pids: List[int]) -> List[str]:
+    agent_args = [python, '-u', '-', '--status_dir', status_dir(session_name),
+                  '--interval', str(self._interval_secs),
+                  '--stats_interval', str(self._stats_interval_secs)]
+    agent_args += [str(pid) for pid in pids]
+    if ssh_pool.is_local(host):
+      return agent_args
+    # Run by the remote shell.
+    return ssh_pool.ssh_command(host, port) + [shlex.quote(arg) for arg in agent_args]
+
+  def start(self, host: str, port: str, python: str, session_name: str,
+            pids: List[int]) -> None:
+    """Starts the agent watching `pids` on `host`."""
+    key = (host, str(port))
+    channel = subprocess.Popen(
+        self._agent_command(host, str(port), python, session_name, pids),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL)
+    with open(_AGENT_PATH, 'rb') as f:
+      channel.stdin.write(f.read())
+    channel.stdin.close()
+    with self._lock:
+      self._channels[key] = channel
+      self._connected[key] = True
+      self._sessions[key] = session_name
+    reader = threading.Thread(target=self._read_events, args=(key, channel),
+                              name='heartbeat_{}'.format(host))
+    reader.daemon = True
+    reader.start()
+
+  def _read_events(self, key: HostKey, channel: subprocess.Popen) -> None:
+    host, port = key
+    for line in channel.stdout:
+      try:
+        event = json.loads(line)
+      except ValueError:
+        continue
+      with self._lock:
+        self._first_heartbeat.setdefault(key, time.time())
+        if event['event'] == 'exit':
+          self._returncodes[(host, port, event['pid'])] = event['returncode']
+          self._changed.set()
+        elif event['event'] == 'stats':
+          self._stats[(host, port, event['pid'])] = event
+        elif event['event'] == 'done':
+          break
+    channel.wait()
+    with self._lock:
+      if self._connected.get(key):
+        self._connected[key] = False
+        self._changed.set()
+    if channel.returncode:
+      logging.warning('Heartbeat channel to %s:%s closed with code %s, '
+                      'falling back to polling', host, port, channel.returncode)
+
+  def is_connected(self, host: str, port: str) -> bool:
+    """Whether exits of the workers of `host` are still pushed by its agent."""
+    with self._lock:
+      return self._connected.get((host, str(port)), False)
+
+  def has_exited(self, host: str, port: str, pid: int) -> bool:
+    with self._lock:
+      return (host, str(port), pid) in self._returncodes
+
+  def returncode(self, host: str, port: str, pid: int) -> Optional[int]:
+    """Return code of an exited worker, None if it is unknown."""
+    with self._lock:
+      return self._returncodes.get((host, str(port), pid))
+
+  def stats(self) -> Dict[Tuple[str, str, int], dict]:
+    """Latest resource snapshot (rss, cpu) of each worker's process tree."""
+    with self._lock:
+      return dict(self._stats)
+
+  def first_heartbeat(self) -> Dict[HostKey, float]:
+    """Time at which the first event of each host was received."""
+    with self._lock:
+      return dict(self._first_heartbeat)
+
+  def wait_for_change(self, timeout: Optional[float] = None) -> bool:
+    """Blocks until a worker exits, a channel closes or `timeout` passes."""
+    changed = self._changed.wait(timeout)
+    self._changed.clear()
+    return changed
+
+  def close(self) -> None:
+    """Stops the agents and removes the status directories of the sessions."""
+    with self._lock:
+      channels = list(self._channels.values())
+      sessions, self._sessions = self._sessions, {}
+      for key in self._connected:
+        self._connected[key] = False
+    for channel in channels:
+      if channel.poll() is None:
+        channel.terminate()
+    for (host, port), session_name in sessions.items():
+      remove_status_dir(host, port, session_name)
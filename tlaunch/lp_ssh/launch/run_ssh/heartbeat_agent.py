@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Agent watching the node processes of one host.
+
+The agent is piped to the remote interpreter over ssh, so it must only depend
+on the standard library. It writes one JSON event per line to stdout:
+
+  {"event": "ready", "pids": [...]}                  once, at startup
+  {"event": "exit", "pid": 12, "returncode": 0}      when a pane exits
+  {"event": "stats", "pid": 12, "rss": 1024, ...}    periodic snapshots
+  {"event": "done"}                                  when all panes exited
+
+The return code of a pane is read from `<status_dir>/<pane pid>.rc`, which the
+pane's shell writes right before exiting.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+
+def _emit(**event):
+  sys.stdout.write(json.dumps(event) + '\n')
+  sys.stdout.flush()
+
+
+def _is_alive(pid):
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    return True
+  # Exited panes which were not reaped yet still accept signals.
+  try:
+    with open('/proc/{}/stat'.format(pid)) as f:
+      return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+  except OSError:
+    return True
+
+
+def _read_returncode(status_dir, pid, timeout=0.5):
+  path = os.path.join(status_dir, '{}.rc'.format(pid))
+  deadline = time.time() + timeout
+  while True:
+    try:
+      with open(path) as f:
+        return int(f.read().strip())
+    except (OSError, ValueError):
+      if time.time() > deadline:
+        return None
+      time.sleep(0.05)
+
+
+def _process_table():
+  """Returns a dict mapping pid to (ppid, rss in bytes, cpu seconds)."""
+  page_size = os.sysconf('SC_PAGE_SIZE')
+  clock_ticks = os.sysconf('SC_CLK_TCK')
+  table = {}
+  for entry in os.listdir('/proc'):
+    if not entry.isdigit():
+      continue
+    try:
+      with open('/proc/{}/stat'.format(entry)) as f:
+        # The command name may contain spaces, the fields start after it.
+        fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+      continue
+    table[int(entry)] = (int(fields[1]),
+                         int(fields[21]) * page_size,
+                         (int(fields[11]) + int(fields[12])) / clock_ticks)
+  return table
+
+
+def _emit_stats(pids):
+  if not os.path.isdir('/proc'):
+    return
+  table = _process_table()
+  children = {}
+  for pid, (ppid, _, _) in table.items():
+    children.setdefault(ppid, []).append(pid)
+  for pid in pids:
+    tree = [pid]
+    rss, cpu = 0, 0.
+    while tree:
+      current = tree.pop()
+      if current in table:
+        rss += table[current][1]
+        cpu += table[current][2]
+      tree.extend(children.get(current, []))
+    _emit(event='stats', pid=pid, rss=rss, cpu=cpu, time=time.time())
+
+
+def main(argv):
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--status_dir', required=True)
+  parser.add_argument('--interval', type=float, default=0.2)
+  parser.add_argument('--stats_interval', type=float, default=5.)
+  parser.add_argument('pids', type=int, nargs='*')
+  args = parser.parse_args(argv)
+
+  running = [pid for pid in args.pids if _is_alive(pid)]
+  _emit(event='ready', pids=running)
+  for pid in args.pids:
+    if pid not in running:
+      _emit(event='exit', pid=pid,
+            returncode=_read_returncode(args.status_dir, pid))
+
+  next_stats = time.time()
+  while running:
+    for pid in list(running):
+      if not _is_alive(pid):
+        running.remove(pid)
+        _emit(event='exit', pid=pid,
+              returncode=_read_returncode(args.status_dir, pid))
+    if running and time.time() >= next_stats:
+      _emit_stats(running)
+      next_stats = time.time() + args.stats_interval
+    time.sleep(args.interval)
+  _emit(event='done')
+
+
+if __name__ == '__main__':
+  try:
+    main(sys.argv[1:])
+  except BrokenPipeError:
+    # The launcher closed the channel.
+    pass
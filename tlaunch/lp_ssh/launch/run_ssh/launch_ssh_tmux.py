@@ -15,16 +15,51 @@
 # limitations under the License.
 
 """"""
+import collections
 import os
 import logging
+import shlex
+import threading
+import time
+from concurrent import futures
 
 import subprocess
 
 import atexit
 import psutil
 
-from launchpad.launch.worker_manager import ThreadWorker
-from tlaunch.lp_ssh.launch.worker_manager import WorkerManager
+from absl import flags
+from tlaunch.lp_ssh.flags import flags as lp_flags
+from tlaunch.lp_ssh import ssh_pool
+from tlaunch.lp_ssh.launch.run_ssh import heartbeat
+from tlaunch.lp_ssh.launch.run_ssh import payload_sync
+from tlaunch.lp_ssh.launch.run_ssh import startup_report
+from tlaunch.lp_ssh.launch.worker_manager import ThreadWorker, WorkerManager
+
+FLAGS = flags.FLAGS
+
+
+_POLL_BACKOFF = 1.5
+
+
+def alive_pids(server, port, pids, timeout=None):
+    """Returns the subset of `pids` still running on `server`, in one ssh round trip.
+
+      Returns:
+        A set of pids, or None if the host could not be reached.
+    """
+    command = ssh_pool.ssh_command(server, port) + [
+        'ps', '-o', 'pid=', '-p', ','.join(str(pid) for pid in pids)]
+    try:
+        p = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logging.warning('Liveness check on %s:%s timed out', server, port)
+        return None
+    # `ps` exits with 1 when none of the pids is running.
+    if p.returncode not in (0, 1):
+        logging.warning('Liveness check on %s:%s failed: %s', server, port, p.stderr.decode().strip())
+        return None
+    return {int(pid) for pid in p.stdout.split()}
 
 
 class ServerProcess:
@@ -34,13 +69,8 @@ class ServerProcess:
         self.pid = pid
 
     def is_alive(self):
-        command = ['ssh','-p', self.port, self.server, 'python -c "import psutil;psutil.Process({})"'.format(self.pid)]
-        try:
-            subprocess.check_output(
-                command,
-                stderr=subprocess.STDOUT)
-
-        except subprocess.CalledProcessError as e:
+        alive = alive_pids(self.server, self.port, [self.pid])
+        if alive is not None and self.pid not in alive:
             logging.info('{}:{} is not alive'.format(self.server, self.pid))
             return False
         else:
@@ -49,13 +79,82 @@ class ServerProcess:
 
 
 class SSHWorkerManager(WorkerManager):
+    def __init__(self, *args, poll_interval_secs=None, max_poll_interval_secs=None, **kwargs):
+        """Initializes a SSHWorkerManager.
+
+          Args:
+            poll_interval_secs: Interval between two liveness checks of the remote
+              workers right after one of the workers changed state. Defaults to
+              --lp_ssh_poll_interval_secs.
+            max_poll_interval_secs: The interval is multiplied by `_POLL_BACKOFF`
+              after every check in which no worker changed state, up to this
+              bound. Defaults to --lp_ssh_max_poll_interval_secs.
+        """
+        super().__init__(*args, **kwargs)
+        self._min_poll_interval = poll_interval_secs or FLAGS.lp_ssh_poll_interval_secs
+        self._max_poll_interval = max(self._min_poll_interval,
+                                      max_poll_interval_secs or FLAGS.lp_ssh_max_poll_interval_secs)
+        self._poll_interval = self._min_poll_interval
+        # Created by the first poll, shut down once no worker is left.
+        self._poll_executor = None
+        self._heartbeat = None
+
+    def attach_heartbeat(self, monitor: heartbeat.HeartbeatMonitor):
+        """Uses the exit events pushed by `monitor` instead of polling.
+
+          Workers of hosts whose heartbeat channel is closed are polled again.
+        """
+        self._heartbeat = monitor
+
     def register_existing_ssh_process(self, name: str, server: str, port: str, pid: int):
         self._workers_count[name] += 1
         self._active_workers[name].append(ServerProcess(server, port=port,pid=pid))
 
+    def _poll_remote_workers(self):
+        """Checks all remote workers with one command per host.
+
+          Returns:
+            A dict mapping (server, port) to the set of running pids, or to None
+            if the host could not be reached.
+        """
+        host_pids = collections.defaultdict(list)
+        for workers in self._active_workers.values():
+            for worker in workers:
+                if isinstance(worker, ServerProcess) and not self._is_pushed(worker):
+                    host_pids[(worker.server, worker.port)].append(worker.pid)
+        if not host_pids:
+            return {}
+        if self._poll_executor is None:
+            self._poll_executor = futures.ThreadPoolExecutor(
+                max_workers=max(1, FLAGS.lp_ssh_max_parallel_hosts))
+        future_to_host = {
+            self._poll_executor.submit(alive_pids, server, port, pids, self._max_poll_interval):
+                (server, port)
+            for (server, port), pids in host_pids.items()
+        }
+        return {future_to_host[future]: future.result() for future in futures.as_completed(future_to_host)}
+
+    def _shutdown_poll_executor(self):
+        if self._poll_executor is not None:
+            self._poll_executor.shutdown(wait=True)
+            self._poll_executor = None
+
+    def _is_pushed(self, worker):
+        return (self._heartbeat is not None and
+                self._heartbeat.is_connected(worker.server, worker.port))
+
+    def _sleep_between_checks(self):
+        if self._heartbeat is not None:
+            # Wakes up as soon as an agent reports an exit.
+            self._heartbeat.wait_for_change(self._poll_interval)
+        else:
+            time.sleep(self._poll_interval)
+
     def _check_workers(self):
         """Checks status of running workers, terminate runtime in case of errors."""
         has_workers = False
+        state_changed = False
+        remote_alive = self._poll_remote_workers()
         for label in self._active_workers:
             still_active = []
             for worker in self._active_workers[label]:
@@ -79,8 +178,20 @@ class SSHWorkerManager(WorkerManager):
                     except subprocess.TimeoutExpired:
                         pass
                 elif isinstance(worker, ServerProcess):
-                    if not worker.is_alive():
+                    if self._heartbeat is not None and self._heartbeat.has_exited(
+                            worker.server, worker.port, worker.pid):
+                        res = self._heartbeat.returncode(worker.server, worker.port, worker.pid)
+                        logging.info('{}:{} exited with {}'.format(worker.server, worker.pid, res))
                         active = False
+                        if res and not self._first_failure and not self._stop_counter:
+                            self._first_failure = RuntimeError(
+                                'Worker {} on {} exited with {}.'.format(worker.pid, worker.server, res))
+                    elif not self._is_pushed(worker):
+                        # Unreachable hosts keep their workers active until the next check.
+                        alive = remote_alive.get((worker.server, worker.port))
+                        if alive is not None and worker.pid not in alive:
+                            logging.info('{}:{} is not alive'.format(worker.server, worker.pid))
+                            active = False
                 else:
                     try:
                         res = worker.wait(0)
@@ -90,94 +201,154 @@ class SSHWorkerManager(WorkerManager):
                 if active:
                     has_workers = True
                     still_active.append(worker)
+                else:
+                    state_changed = True
             self._active_workers[label] = still_active
+        if state_changed:
+            self._poll_interval = self._min_poll_interval
+        else:
+            self._poll_interval = min(self._poll_interval * _POLL_BACKOFF, self._max_poll_interval)
         if has_workers and self._first_failure and not self._stop_counter:
             self._stop()
         elif not has_workers:
             self._disable_alarm()
+            self._shutdown_poll_executor()
 
 
 def launch_with_ssh_tmux_session(commands_to_launch,
-                                 session_name_prefix=None):
+                                 session_name_prefix=None,
+                                 max_parallel_hosts=None,
+                                 host_timeout_secs=None):
     """Launch multiple CommandToLaunch tuples in a new ssh tmux session."""
 
     session_name_prefix = session_name_prefix or 'ssh_launch'
 
     return _launch_with_multiplex_ssh_session(commands_to_launch,
                                               session_name_prefix,
-                                              'tmux')
+                                              'tmux',
+                                              max_parallel_hosts=max_parallel_hosts,
+                                              host_timeout_secs=host_timeout_secs)
 
 
-def _launch_with_multiplex_ssh_session(commands_to_launch, session_name_prefix, multiplexer):
-    """Launch multiple CommandToLaunch tuples in a new multiplex session.
+def _create_session(ssh_execute, session_name_prefix, multiplexer, launch_dir, timeout):
+    """Creates a detached session on one host, uniquifying its name if needed.
 
-      Args:
-        commands_to_launch: An iterable of `CommandToLaunch` namedtuples.
-        session_name_prefix: Leading part of the name given to the new tmux session.
-          If there is no existing session with this name, it will be used as-is,
-          however if another session exists the name will be uniquified by appending
-          an incrementing counter.
-        multiplexer : tmux or byobu
+      Returns:
+        A `(session_name, latency_secs)` tuple.
     """
-    # Make a new session with the unmodified name, if this fails add a suffix to
-    # the name and retry.
-    session_name_host_dict = {}
-    ssh_execute = {}
-    launch_dir = os.getcwd()
-
-    for command_to_launch in commands_to_launch:
-        session_name_host_dict[command_to_launch.host] = session_name_prefix
-        ssh_execute[command_to_launch.host] = ['ssh', '-p', command_to_launch.port, command_to_launch.host]
-
+    start = time.time()
+    session_name = session_name_prefix
+    suffix_index = 0
+    while True:
+        try:
+            exec_command_list = ssh_execute + [multiplexer, 'new-session', '-d', '-s', session_name, '-c',
+                                               launch_dir]
+            # The timeout covers all uniquify retries on this host.
+            subprocess.check_output(exec_command_list,
+                                    stderr=subprocess.STDOUT,
+                                    timeout=max(0, timeout - (time.time() - start)))
+        except subprocess.CalledProcessError as e:
+            if 'duplicate session' in e.output.decode():
+                logging.info('%r session %r already exists, trying to uniquify...',
+                             multiplexer, session_name)
+                session_name = '{}_{}'.format(session_name_prefix, suffix_index)
+                suffix_index += 1
+            else:
+                raise e  # If `tmux new-session` failed for some other reason.
+        else:
+            return session_name, time.time() - start
 
-    for host in session_name_host_dict:
-        suffix_index = 0
 
-        session_name = session_name_host_dict[host]
+def _create_sessions(ssh_execute, session_name_prefix, multiplexer, launch_dir,
+                     max_parallel_hosts, timeout):
+    """Creates one session per host, contacting up to `max_parallel_hosts` at once.
 
-        while True:
+      Returns:
+        A dict mapping each host to its session name.
+    """
+    session_name_host_dict = {}
+    latencies = {}
+    failures = {}
+    with futures.ThreadPoolExecutor(max_workers=max(1, max_parallel_hosts)) as executor:
+        future_to_host = {
+            executor.submit(_create_session, ssh_execute[host], session_name_prefix,
+                            multiplexer, launch_dir, timeout): host
+            for host in ssh_execute
+        }
+        for future in futures.as_completed(future_to_host):
+            host = future_to_host[future]
             try:
-
-                exec_command_list = ssh_execute[host] + [multiplexer, 'new-session', '-d', '-s', session_name, '-c',
-                                                         launch_dir]
-
-                subprocess.check_output(exec_command_list,
-                                        stderr=subprocess.STDOUT)
-
-
+                session_name, latency = future.result()
+            except subprocess.TimeoutExpired:
+                failures[host] = 'timed out after {}s'.format(timeout)
             except subprocess.CalledProcessError as e:
-                if 'duplicate session' in e.output.decode():
-                    logging.info('%r session %r already exists, trying to uniquify...',
-                                 multiplexer, session_name)
-                    session_name = '{}_{}'.format(session_name_prefix, suffix_index)
-                    suffix_index += 1
-                else:
-                    raise e  # If `tmux new-session` failed for some other reason.
+                failures[host] = e.output.decode().strip()
             else:
-
-                print('Launch tmux on {} with session name:{}'.format(ssh_execute[host][3],session_name) )
-                break
-        session_name_host_dict[host] = session_name
+                session_name_host_dict[host] = session_name
+                latencies[host] = latency
+                print('Launch tmux on {} with session name:{}'.format(host, session_name))
+
+    if latencies:
+        slowest = max(latencies, key=latencies.get)
+        print('Created {} sessions, mean latency {:.2f}s, slowest host {} ({:.2f}s)'.format(
+            len(latencies), sum(latencies.values()) / len(latencies), slowest, latencies[slowest]))
+    for host in sorted(latencies, key=latencies.get, reverse=True):
+        logging.info('Session creation on %s took %.2fs', host, latencies[host])
+    if failures:
+        raise RuntimeError('Failed to create {} session on {}'.format(
+            multiplexer, ', '.join('{} ({})'.format(host, reason) for host, reason in failures.items())))
+    return session_name_host_dict
+
+
+def _push_all_files(ssh_execute, commands_to_launch, max_parallel_hosts, timeout):
+    """Copies the files the commands need to their hosts, each host once."""
+    host_files = collections.defaultdict(dict)
+    host_max_age = {}
+    for command_to_launch in commands_to_launch:
+        host_files[command_to_launch.host].update(command_to_launch.files)
+        max_age = command_to_launch.files_max_age_secs
+        if max_age is not None and command_to_launch.files:
+            host = command_to_launch.host
+            host_max_age[host] = min(max_age, host_max_age.get(host, max_age))
+
+    failures = {}
+    with futures.ThreadPoolExecutor(max_workers=max(1, max_parallel_hosts)) as executor:
+        future_to_host = {
+            executor.submit(payload_sync.push_files, ssh_execute[host], files, timeout,
+                            host_max_age.get(host)): host
+            for host, files in host_files.items() if files
+        }
+        for future in futures.as_completed(future_to_host):
+            host = future_to_host[future]
+            try:
+                future.result()
+            except subprocess.TimeoutExpired:
+                failures[host] = 'timed out after {}s'.format(timeout)
+            except subprocess.CalledProcessError as e:
+                failures[host] = e.output.decode().strip()
+    if failures:
+        raise RuntimeError('Failed to copy payloads to {}'.format(
+            ', '.join('{} ({})'.format(host, reason) for host, reason in failures.items())))
 
 
+def _window_script(commands_to_launch, session_name, multiplexer, launch_dir):
+    """Returns a shell script opening one window per command and printing its pane pid."""
+    lines = ['set -e', 'mkdir -p {}'.format(shlex.quote(heartbeat.status_dir(session_name)))]
     for command_to_launch in commands_to_launch:
         # Apply command-specific overrides to environment variables.
+        # The window command is run by the remote POSIX shell, so it is quoted
+        # for sh rather than with `subprocess.list2cmdline`.
         env_as_list = [
-            f'{k}={v}' for k, v in command_to_launch.env_overrides.items()]
-
-        # When the program is done, echo the command so it can be copy-pasted, and
-        # then drop into a shell.
-
-        command_str = subprocess.list2cmdline(env_as_list +
-                                              command_to_launch.command_as_list)
-
-        inner_command = f'{command_str}; '
-
+            f'{k}={shlex.quote(str(v))}' for k, v in command_to_launch.env_overrides.items()]
+        command_str = ' '.join(env_as_list + [shlex.quote(arg) for arg in
+                                              command_to_launch.command_as_list])
+        # The pane's shell records the return code for the heartbeat agent.
+        status_dir = shlex.quote(heartbeat.status_dir(session_name))
+        inner_command = f'{command_str}; echo $? > {status_dir}/$$.rc'
         window_name = command_to_launch.title
-
-        session_name = session_name_host_dict[command_to_launch.host]
-
-        command = ssh_execute[command_to_launch.host] + [
+        print("{}\nHost {} session: {} window: {} execute {}".format(
+            '-' * 20, command_to_launch.host, session_name, window_name, command_str))
+        lines.append(' '.join(shlex.quote(arg) for arg in [
             multiplexer,
             'new-window',
             '-t',
@@ -185,29 +356,134 @@ def _launch_with_multiplex_ssh_session(commands_to_launch, session_name_prefix,
             '-n',
             window_name,
             '-c', launch_dir,
+            '-P', '-F', '#{pane_pid}',
             inner_command,
-        ]
-        # Make the process block until it has completed.
-        # print(command)
-        print("{}\nHost {} session: {} window: {} execute {}".format('-'*20,ssh_execute[command_to_launch.host][3],session_name,window_name, inner_command[:-2]))
-        subprocess.Popen(command)
+        ]))
+    return '\n'.join(lines) + '\n'
 
 
+def _spawn_windows(ssh_execute, commands_to_launch, session_name, multiplexer, launch_dir, timeout):
+    """Opens the windows of all commands of one host in a single ssh round trip.
 
-    def get_session_processes(host):
+      Returns:
+        The pane pids of the new windows, in the order of `commands_to_launch`.
+    """
+    script = _window_script(commands_to_launch, session_name, multiplexer, launch_dir)
+    output = subprocess.check_output(ssh_execute + ['sh', '-s'],
+                                     input=script.encode(),
+                                     stderr=subprocess.STDOUT,
+                                     timeout=timeout)
+    return [int(pid) for pid in output.decode().split() if pid.isdigit()]
 
-        session_name = session_name_host_dict[host]
-        p = subprocess.run(ssh_execute[host] + [
-            multiplexer + ' list-panes -t ' + session_name + ' -s -F "#{pane_pid}"'], stdout=subprocess.PIPE,
-                           check=True)
 
-        return [int(pid) for pid in p.stdout.replace(b'"', b'').strip().split()]
+def _spawn_all_windows(ssh_execute, commands_to_launch, session_name_host_dict, multiplexer,
+                       launch_dir, max_parallel_hosts, timeout):
+    """Opens the windows of all hosts concurrently.
+
+      Returns:
+        A dict mapping each host to the pane pids of its windows.
+    """
+    host_commands = collections.defaultdict(list)
+    for command_to_launch in commands_to_launch:
+        host_commands[command_to_launch.host].append(command_to_launch)
+
+    pids = {}
+    failures = {}
+    with futures.ThreadPoolExecutor(max_workers=max(1, max_parallel_hosts)) as executor:
+        future_to_host = {
+            executor.submit(_spawn_windows, ssh_execute[host], host_commands[host],
+                            session_name_host_dict[host], multiplexer, launch_dir, timeout): host
+            for host in host_commands
+        }
+        for future in futures.as_completed(future_to_host):
+            host = future_to_host[future]
+            try:
+                pids[host] = future.result()
+            except subprocess.TimeoutExpired:
+                failures[host] = 'timed out after {}s'.format(timeout)
+            except subprocess.CalledProcessError as e:
+                failures[host] = e.output.decode().strip()
+            else:
+                if len(pids[host]) != len(host_commands[host]):
+                    failures[host] = 'started {} of {} windows'.format(
+                        len(pids[host]), len(host_commands[host]))
+    if failures:
+        raise RuntimeError('Failed to open {} windows on {}'.format(
+            multiplexer, ', '.join('{} ({})'.format(host, reason) for host, reason in failures.items())))
+    return pids
+
+
+def _launch_with_multiplex_ssh_session(commands_to_launch, session_name_prefix, multiplexer,
+                                       max_parallel_hosts=None, host_timeout_secs=None):
+    """Launch multiple CommandToLaunch tuples in a new multiplex session.
+
+      Args:
+        commands_to_launch: An iterable of `CommandToLaunch` namedtuples.
+        session_name_prefix: Leading part of the name given to the new tmux session.
+          If there is no existing session with this name, it will be used as-is,
+          however if another session exists the name will be uniquified by appending
+          an incrementing counter.
+        multiplexer : tmux or byobu
+        max_parallel_hosts: Maximum number of hosts on which sessions are created
+          concurrently. Defaults to --lp_ssh_max_parallel_hosts.
+        host_timeout_secs: Timeout of the session creation on a single host.
+          Defaults to --lp_ssh_host_timeout_secs.
+    """
+    max_parallel_hosts = max_parallel_hosts or FLAGS.lp_ssh_max_parallel_hosts
+    host_timeout_secs = host_timeout_secs or FLAGS.lp_ssh_host_timeout_secs
+
+    ssh_execute = {}
+    host_ports = {}
+    launch_dir = os.getcwd()
+
+    for command_to_launch in commands_to_launch:
+        host_ports[command_to_launch.host] = command_to_launch.port
+
+    # Master connections are opened concurrently, one per host, and shared by
+    # every later command sent to the same host.
+    with futures.ThreadPoolExecutor(max_workers=max(1, max_parallel_hosts)) as executor:
+        for host, ssh_command in zip(host_ports, executor.map(
+                lambda host: ssh_pool.ssh_command(host, host_ports[host]), host_ports)):
+            ssh_execute[host] = ssh_command
+
+    _push_all_files(ssh_execute, commands_to_launch, max_parallel_hosts, host_timeout_secs)
+
+    # Make a new session with the unmodified name on every host, if this fails
+    # add a suffix to the name and retry.
+    session_name_host_dict = _create_sessions(ssh_execute, session_name_prefix, multiplexer,
+                                              launch_dir, max_parallel_hosts, host_timeout_secs)
+
+    pids = _spawn_all_windows(ssh_execute, commands_to_launch, session_name_host_dict, multiplexer,
+                              launch_dir, max_parallel_hosts, host_timeout_secs)
 
     manager = SSHWorkerManager()
-    atexit.register(manager.wait)
 
     for host in ssh_execute:
-        for pid in get_session_processes(host):
-            # continue
-            manager.register_existing_ssh_process('ssh', host, ssh_execute[host][2], pid)
-
+        for pid in pids[host]:
+            manager.register_existing_ssh_process('ssh', host, host_ports[host], pid)
+
+    if FLAGS.lp_ssh_heartbeat:
+        monitor = heartbeat.HeartbeatMonitor(FLAGS.lp_ssh_heartbeat_interval_secs)
+        # The agent runs with the interpreter of the launch config, hosts
+        # without Python commands are polled.
+        host_python = {command_to_launch.host: command_to_launch.interpreter
+                       for command_to_launch in commands_to_launch
+                       if getattr(command_to_launch, 'interpreter', None)}
+        for host in ssh_execute:
+            if host in host_python:
+                monitor.start(host, host_ports[host], host_python[host],
+                              session_name_host_dict[host], pids[host])
+        # Exit handlers run in reverse order, the agents are closed once all
+        # workers are done.
+        atexit.register(monitor.close)
+        manager.attach_heartbeat(monitor)
+    if startup_report.record_dir():
+        reporter = threading.Thread(
+            target=startup_report.report_when_ready,
+            args=(ssh_execute, startup_report.record_dir(), len(commands_to_launch),
+                  max_parallel_hosts, host_timeout_secs,
+                  FLAGS.lp_ssh_startup_report_timeout_secs),
+            name='startup_report')
+        reporter.daemon = True
+        reporter.start()
+    atexit.register(manager.wait)
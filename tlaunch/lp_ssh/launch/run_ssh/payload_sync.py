@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Copies payloads and entry scripts to hosts without a shared filesystem.
+
+Remote paths embed the content hash of their file, so a file which already
+exists on a host is never sent again. Every push refreshes the modification
+time of the directories of its files, and the directories next to them which
+no push used for `max_age_secs` are removed.
+"""
+
+import io
+import os
+import shlex
+import subprocess
+import tarfile
+from typing import List, Mapping, Optional
+
+from absl import logging
+
+
+def _evict_script(remote_paths: List[str], max_age_secs: float) -> List[str]:
+  """Returns the lines removing the directories next to the ones of
+  `remote_paths` which were not modified for `max_age_secs`."""
+  # Payloads are stored as <root>/<digest>/<file>.
+  roots = sorted({os.path.dirname(os.path.dirname(path)) for path in remote_paths})
+  minutes = max(1, int(max_age_secs // 60))
+  return ['find {} -mindepth 1 -maxdepth 1 -type d -mmin +{} -exec rm -rf {{}} + '
+          '2>/dev/null'.format(shlex.quote(root), minutes) for root in roots]
+
+
+def missing_files(ssh_execute: List[str], remote_paths: List[str],
+                  timeout: float, max_age_secs: Optional[float] = None) -> List[str]:
+  """Returns the paths among `remote_paths` which do not exist on the host.
+
+  The directories of the existing paths are touched, so they are not evicted
+  by this push or by the ones of other launchers, which evict the unused
+  directories when `max_age_secs` is given.
+  """
+  lines = ['[ -e {0} ] && touch -c "$(dirname {0})" || echo {0}'.format(shlex.quote(path))
+           for path in remote_paths]
+  if max_age_secs is not None:
+    lines.extend(_evict_script(remote_paths, max_age_secs))
+  lines.append('true')
+  script = '\n'.join(lines)
+  output = subprocess.check_output(ssh_execute + ['sh', '-s'],
+                                   input=script.encode(),
+                                   stderr=subprocess.STDOUT,
+                                   timeout=timeout)
+  return output.decode().splitlines()
+
+
+def _tar_stream(files: Mapping[str, str], remote_paths: List[str]) -> bytes:
+  stream = io.BytesIO()
+  with tarfile.open(fileobj=stream, mode='w') as tar:
+    for index, remote_path in enumerate(remote_paths):
+      tar.add(files[remote_path], arcname=str(index))
+  return stream.getvalue()
+
+
+def push_files(ssh_execute: List[str], files: Mapping[str, str],
+               timeout: float, max_age_secs: Optional[float] = None) -> int:
+  """Copies `files` (remote path -> local path) missing on the host.
+
+  Two round trips at most: one listing the missing files and evicting the
+  directories unused for `max_age_secs`, one streaming all of the missing
+  files as a single tar archive.
+
+  Returns:
+    The number of files sent.
+  """
+  remote_paths = missing_files(ssh_execute, sorted(files), timeout, max_age_secs)
+  if not remote_paths:
+    return 0
+  # Files are renamed into place once complete, so an interrupted copy never
+  # leaves a truncated payload under its final name.
+  lines = ['set -e', 'tmp=$(mktemp -d)', 'tar -xf - -C "$tmp"']
+  for index, remote_path in enumerate(remote_paths):
+    quoted = shlex.quote(remote_path)
+    lines.append('mkdir -p "$(dirname {0})" && mv "$tmp/{1}" {0}.$$ && mv {0}.$$ {0}'.format(
+        quoted, index))
+  lines.append('rm -rf "$tmp"')
+  subprocess.check_output(
+      ssh_execute + ['sh -c {}'.format(shlex.quote('\n'.join(lines)))],
+      input=_tar_stream(files, remote_paths),
+      stderr=subprocess.STDOUT,
+      timeout=timeout)
+  logging.info('Sent %d files to %s', len(remote_paths), ssh_execute[-1])
+  return len(remote_paths)
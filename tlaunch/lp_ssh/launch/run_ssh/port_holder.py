@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Agent reserving ports on a host until the servers which use them bind.
+
+The agent is piped to the remote interpreter over ssh, so it must only depend
+on the standard library. It listens on `--count` ports picked by the kernel,
+prints them as a JSON list and detaches, so that the ssh command returns while
+the ports stay taken.
+
+Every held port has a marker file `<dir>/<port>`. A server releases its port
+by removing the marker, after which the agent closes the port. Ports which
+were not released after `--hold_secs` are closed anyway, and the agent exits
+once it holds no port.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+
+
+def _reserve(count):
+  held = {}
+  for _ in range(count):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # Neither SO_REUSEADDR nor SO_REUSEPORT, so that no other socket can bind
+    # the port while it is held.
+    sock.bind(('', 0))
+    sock.listen(1)
+    held[sock.getsockname()[1]] = sock
+  return held
+
+
+def _detach():
+  if os.fork():
+    os._exit(0)
+  os.setsid()
+  devnull = os.open(os.devnull, os.O_RDWR)
+  for fd in (0, 1, 2):
+    os.dup2(devnull, fd)
+
+
+def main(argv):
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--dir', required=True)
+  parser.add_argument('--count', type=int, required=True)
+  parser.add_argument('--hold_secs', type=float, default=600.)
+  parser.add_argument('--interval', type=float, default=0.05)
+  args = parser.parse_args(argv)
+
+  os.makedirs(args.dir, exist_ok=True)
+  held = _reserve(args.count)
+  for port in held:
+    open(os.path.join(args.dir, str(port)), 'w').close()
+  sys.stdout.write(json.dumps(sorted(held)) + '\n')
+  sys.stdout.flush()
+  _detach()
+
+  deadline = time.time() + args.hold_secs
+  while held and time.time() < deadline:
+    for port in list(held):
+      if not os.path.exists(os.path.join(args.dir, str(port))):
+        held.pop(port).close()
+    time.sleep(args.interval)
+  for port, sock in held.items():
+    sock.close()
+    try:
+      os.remove(os.path.join(args.dir, str(port)))
+    except OSError:
+      pass
+  try:
+    os.rmdir(args.dir)
+  except OSError:
+    pass
+
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
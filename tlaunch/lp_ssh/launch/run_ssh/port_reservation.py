@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reserves the ports of the servers of an ssh launch on their hosts.
+
+Ports picked on the launcher say nothing about the hosts the servers run on.
+Instead, a `port_holder` agent is started on every host with a single round
+trip, which picks and holds the ports of all servers of that host until each
+server releases its port right before binding it.
+"""
+
+import collections
+import json
+import os
+import subprocess
+import uuid
+from concurrent import futures
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+from absl import logging
+
+from tlaunch.lp_ssh import ssh_pool
+from tlaunch.lp_ssh.nodes.python import local_multi_processing
+
+_HOLDER_PATH = os.path.join(os.path.dirname(__file__), 'port_holder.py')
+_RESERVATION_ROOT = '/tmp/lp_ssh_ports'
+
+
+class PortReservation(NamedTuple):
+  port: int
+  # Directory of the marker file of the port on its host.
+  reservation_dir: str
+
+
+def reserve_ports(host: str, ssh_port: str, count: int, python: str,
+                  reservation_dir: str, hold_secs: float,
+                  timeout: float) -> List[int]:
+  """Reserves `count` ports on `host` and returns them."""
+  holder_args = [python, '-', '--dir', reservation_dir, '--count', str(count),
+                 '--hold_secs', str(hold_secs)]
+  if not ssh_pool.is_local(host):
+    holder_args = ssh_pool.ssh_command(host, ssh_port) + holder_args
+  with open(_HOLDER_PATH, 'rb') as f:
+    script = f.read()
+  output = subprocess.run(holder_args, input=script, stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT, timeout=timeout,
+                          check=True).stdout
+  ports = json.loads(output.decode().strip().splitlines()[-1])
+  logging.info('Reserved %d ports on %s: %s', len(ports), host, ports)
+  return ports
+
+
+def reserve_addresses(
+    addresses: Sequence[Tuple[object, str]],
+    max_parallel_hosts: int,
+    timeout: float,
+    hold_secs: float) -> Dict[int, PortReservation]:
+  """Reserves one port per address on the host of the address.
+
+  Args:
+    addresses: (address, interpreter) pairs, where `address` has `host` and
+      `port` (its ssh port) attributes and `interpreter` is the python used
+      on its host.
+    max_parallel_hosts: Maximum number of hosts contacted concurrently.
+    timeout: Timeout in seconds of the round trip to one host.
+    hold_secs: How long ports are held if their server never binds them.
+
+  Returns:
+    The reservation of every address, keyed by `id(address)`.
+
+  Raises:
+    RuntimeError: if the ports of some host could not be reserved.
+  """
+  host_addresses = collections.defaultdict(list)
+  host_python = {}
+  for address, python in addresses:
+    key = (address.host, str(address.port))
+    if all(address is not other for other in host_addresses[key]):
+      host_addresses[key].append(address)
+      host_python.setdefault(key, python)
+
+  reservation_dir = os.path.join(_RESERVATION_ROOT, uuid.uuid4().hex)
+  reservations = {}
+  failures = {}
+  with futures.ThreadPoolExecutor(max_workers=max(1, max_parallel_hosts)) as executor:
+    future_to_key = {
+        executor.submit(reserve_ports, host, ssh_port, len(host_addresses[(host, ssh_port)]),
+                        host_python[(host, ssh_port)], reservation_dir, hold_secs,
+                        timeout): (host, ssh_port)
+        for host, ssh_port in host_addresses
+    }
+    for future in futures.as_completed(future_to_key):
+      key = future_to_key[future]
+      try:
+        ports = future.result()
+      except subprocess.TimeoutExpired:
+        failures[key[0]] = 'timed out after {}s'.format(timeout)
+        continue
+      except subprocess.CalledProcessError as e:
+        failures[key[0]] = e.output.decode().strip()
+        continue
+      for address, port in zip(host_addresses[key], ports):
+        reservations[id(address)] = PortReservation(port, reservation_dir)
+  if failures:
+    raise RuntimeError('Failed to reserve ports on {}'.format(
+        ', '.join('{} ({})'.format(host, reason) for host, reason in failures.items())))
+  return reservations
+
+
+def reserve_program_ports(program, max_parallel_hosts: int, timeout: float,
+                          hold_secs: float) -> Dict[int, PortReservation]:
+  """Reserves the ports of the addresses of `program` created with `reserve`.
+
+  Other addresses are picked on the launcher, their nodes bind them freely.
+  """
+  addresses = []
+  for node in program.get_all_nodes():
+    # Nodes run with the interpreter of their launch config, see
+    # `to_ssh_multiprocessing_executables`.
+    launch_config = (node._launch_context.launch_config or
+                     local_multi_processing.PythonProcess())
+    python = launch_config.absolute_interpreter_path
+    addresses.extend((address, python) for address in node.addresses
+                     if getattr(address, 'reserve', False) and hasattr(address, 'host'))
+  return reserve_addresses(addresses, max_parallel_hosts, timeout, hold_secs)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Collects the startup records of the nodes and reports their startup time."""
+
+import json
+import os
+import shlex
+import subprocess
+import time
+from concurrent import futures
+from typing import Dict, List, Optional
+
+from absl import flags
+from absl import logging
+
+from tlaunch.lp_ssh.flags import flags as lp_flags
+from tlaunch.utils import startup_profile
+
+FLAGS = flags.FLAGS
+
+_REPORT_FILE_NAME = 'startup_report.json'
+
+_record_dir = None  # type: Optional[str]
+
+
+def record_dir() -> Optional[str]:
+  """Directory of the records of this launch, None if profiling is disabled.
+
+  The directory has the same path on every host, and is unique per launch.
+  """
+  global _record_dir
+  if not FLAGS.lp_ssh_startup_profile_dir:
+    return None
+  if _record_dir is None:
+    _record_dir = os.path.join(
+        FLAGS.lp_ssh_startup_profile_dir,
+        '{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+  return _record_dir
+
+
+def _collect_host(ssh_execute: List[str], directory: str,
+                  timeout: float) -> List[dict]:
+  # Records are single line json documents.
+  script = 'for f in {}/*{}; do [ -e "$f" ] && cat "$f" && echo; done; true'.format(
+      shlex.quote(directory), startup_profile.RECORD_SUFFIX)
+  output = subprocess.check_output(ssh_execute + ['sh', '-s'],
+                                   input=script.encode(),
+                                   stderr=subprocess.DEVNULL,
+                                   timeout=timeout)
+  records = []
+  for line in output.decode().splitlines():
+    try:
+      records.append(json.loads(line))
+    except ValueError:
+      # Partially written, collected at the next round.
+      continue
+  return records
+
+
+def collect(ssh_execute: Dict[str, List[str]], directory: str,
+            max_parallel_hosts: int, timeout: float) -> List[dict]:
+  """Reads the records of `directory` on every host, skipping unreachable ones."""
+  records = []
+  with futures.ThreadPoolExecutor(max_workers=max(1, max_parallel_hosts)) as executor:
+    future_to_host = {
+        executor.submit(_collect_host, command, directory, timeout): host
+        for host, command in ssh_execute.items()
+    }
+    for future in futures.as_completed(future_to_host):
+      try:
+        records.extend(future.result())
+      except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        logging.warning('Failed to collect startup records of %s: %s',
+                        future_to_host[future], e)
+  return records
+
+
+def report_when_ready(ssh_execute: Dict[str, List[str]], directory: str,
+                      num_nodes: int, max_parallel_hosts: int,
+                      host_timeout_secs: float, timeout: float,
+                      poll_interval_secs: float = 2.) -> dict:
+  """Waits for `num_nodes` nodes to start running, then reports their startup.
+
+  The report is logged and written as json next to the records, in the local
+  `directory`.
+  """
+  deadline = time.time() + timeout
+  while True:
+    records = collect(ssh_execute, directory, max_parallel_hosts, host_timeout_secs)
+    ready = sum(startup_profile.RUN_STARTED in record['phases'] for record in records)
+    if ready >= num_nodes or time.time() > deadline:
+      break
+    time.sleep(poll_interval_secs)
+
+  report = startup_profile.aggregate(records)
+  if len(records) < num_nodes:
+    logging.warning('%d nodes did not write a startup record',
+                    num_nodes - len(records))
+  logging.info('%s', startup_profile.format_report(report))
+  os.makedirs(directory, exist_ok=True)
+  with open(os.path.join(directory, _REPORT_FILE_NAME), 'w') as f:
+    json.dump(dict(report, records=records), f, indent=2)
+  return report
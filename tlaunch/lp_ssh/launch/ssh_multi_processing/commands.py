@@ -16,15 +16,26 @@
 
 """Commands to run for multiple processes."""
 
-from typing import Any, Mapping, List
+from typing import Any, Mapping, List, Optional
 
 
 class Command(object):
 
   def __init__(self, command_as_list: List[str],
-               env_overrides: Mapping[str, Any], title: str, host:str, port: str):
+               env_overrides: Mapping[str, Any], title: str, host:str, port: str,
+               files: Optional[Mapping[str, str]] = None,
+               interpreter: Optional[str] = None,
+               files_max_age_secs: Optional[float] = None):
     self.command_as_list = command_as_list
     self.env_overrides = env_overrides or {}
     self.title = title
     self.host = host
     self.port = port
+    # Maps remote paths to the local files to copy there before launching.
+    self.files = files or {}
+    # Directories next to the ones of `files` which no launch used for that
+    # long are removed from the host. None keeps them forever.
+    self.files_max_age_secs = files_max_age_secs
+    # Python interpreter of the launch config on the host, which helpers such
+    # as the heartbeat agent run with. None for commands which are not Python.
+    self.interpreter = interpreter
@@ -387,7 +387,11 @@ class WorkerManager:
           if (return_on_first_completed and len(self._active_workers[label])
               < self._workers_count[label]):
             return
-      time.sleep(0.1)
+      self._sleep_between_checks()
+
+  def _sleep_between_checks(self):
+    """Blocks between two consecutive checks of the workers in `wait`."""
+    time.sleep(0.1)
 
   def cleanup_after_test(self, test_case: absltest.TestCase):
     """Cleanups runtime after a test."""
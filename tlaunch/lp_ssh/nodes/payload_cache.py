@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Content-addressed store of the pickled node functions."""
+
+import atexit
+import contextlib
+import fcntl
+import hashlib
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Set, Tuple
+
+from absl import logging
+
+DATA_FILE_NAME = 'job.pkl'
+# Directory of an entry holding one pin file per launcher using it.
+_PINS_DIR_NAME = 'pins'
+# Locked by the processes writing or evicting entries of the cache.
+_LOCK_FILE_NAME = '.lock'
+
+
+def digest(data: bytes) -> str:
+  return hashlib.sha256(data).hexdigest()
+
+
+def _pin_name() -> str:
+  return '{}@{}'.format(os.getpid(), socket.gethostname())
+
+
+class PayloadCache:
+  """Stores payloads under `<root>/<sha256 of the payload>/<file name>`.
+
+  Several launchers may share the cache, e.g. through `share_temp_dir`. Every
+  launcher pins the entries it wrote or reused with a file
+  `<entry>/pins/<pid>@<host>`, removed when it exits, and entries with a live
+  pin are never evicted. Writes and evictions hold an flock on the cache root.
+
+  Entries age from their last access: writing a payload which is already
+  stored refreshes it, as do the workers reading it where the filesystem
+  records access times.
+  """
+
+  def __init__(self,
+               root: str,
+               max_bytes: Optional[int] = None,
+               max_age_secs: Optional[float] = None):
+    self._root = root
+    self._max_bytes = max_bytes
+    self._max_age_secs = max_age_secs
+    # Entries pinned by this process, unpinned at exit.
+    self._pinned = set()  # type: Set[str]
+    self._lock = threading.Lock()
+    os.makedirs(self._root, exist_ok=True)
+    atexit.register(self.unpin_all)
+
+  @property
+  def root(self) -> str:
+    return self._root
+
+  def path(self, payload_digest: str, file_name: str = DATA_FILE_NAME) -> str:
+    return os.path.join(self._root, payload_digest, file_name)
+
+  @contextlib.contextmanager
+  def _locked(self):
+    """Excludes the other threads and processes using the cache."""
+    with self._lock:
+      with open(os.path.join(self._root, _LOCK_FILE_NAME), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+          yield
+        finally:
+          fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+  def _pin(self, payload_digest: str) -> None:
+    pins_dir = os.path.join(self._root, payload_digest, _PINS_DIR_NAME)
+    os.makedirs(pins_dir, exist_ok=True)
+    with open(os.path.join(pins_dir, _pin_name()), 'w'):
+      pass
+    self._pinned.add(payload_digest)
+
+  def put(self, data: bytes, file_name: str = DATA_FILE_NAME) -> str:
+    """Stores `data` unless already stored, returns the path of the payload."""
+    payload_digest = digest(data)
+    path = self.path(payload_digest, file_name)
+    with self._locked():
+      self._pin(payload_digest)
+      if os.path.exists(path):
+        os.utime(os.path.dirname(path))
+        logging.info('Reusing cached payload %s', path)
+        return path
+      # Written under a temporary name, so that readers never see a partial file.
+      fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+      with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+      os.chmod(tmp_path, 0o644)
+      os.replace(tmp_path, path)
+      return path
+
+  def unpin_all(self) -> None:
+    """Releases the entries pinned by this process."""
+    with self._lock:
+      pinned, self._pinned = self._pinned, set()
+    for payload_digest in pinned:
+      try:
+        os.remove(os.path.join(self._root, payload_digest, _PINS_DIR_NAME, _pin_name()))
+      except OSError:
+        pass
+
+  def _is_live(self, pin_path: str, now: float) -> bool:
+    pid, _, host = os.path.basename(pin_path).partition('@')
+    if host == socket.gethostname():
+      try:
+        os.kill(int(pid), 0)
+      except PermissionError:
+        return True
+      except (OSError, ValueError):
+        return False
+      return True
+    # The launchers of other hosts can not be checked, their pins expire.
+    try:
+      return (self._max_age_secs is None or
+              now - os.path.getmtime(pin_path) <= self._max_age_secs)
+    except OSError:
+      return False
+
+  def _live_pins(self, entry: str, now: float) -> int:
+    """Returns the number of live pins of `entry`, removing the others."""
+    pins_dir = os.path.join(entry, _PINS_DIR_NAME)
+    live = 0
+    for name in os.listdir(pins_dir) if os.path.isdir(pins_dir) else ():
+      pin_path = os.path.join(pins_dir, name)
+      if self._is_live(pin_path, now):
+        live += 1
+      else:
+        try:
+          os.remove(pin_path)
+        except OSError:
+          pass
+    return live
+
+  def _entries(self, now: float) -> Dict[str, Tuple[float, int, bool]]:
+    """Returns a dict mapping each digest to (last access time, size in bytes,
+    whether it is pinned by a live launcher)."""
+    entries = {}
+    for name in os.listdir(self._root):
+      entry = os.path.join(self._root, name)
+      if name.startswith('.') or not os.path.isdir(entry):
+        continue
+      try:
+        access_time, size = os.path.getmtime(entry), 0
+        for file_name in os.listdir(entry):
+          file_path = os.path.join(entry, file_name)
+          if os.path.isfile(file_path):
+            stat = os.stat(file_path)
+            access_time = max(access_time, stat.st_atime)
+            size += stat.st_size
+        entries[name] = (access_time, size, self._live_pins(entry, now) > 0)
+      except OSError:
+        # Removed concurrently.
+        continue
+    return entries
+
+  def evict(self, now: Optional[float] = None) -> None:
+    """Removes the entries without live pins older than `max_age_secs`, then
+    the least recently used ones until the cache fits in `max_bytes`."""
+    now = now or time.time()
+    with self._locked():
+      entries = self._entries(now)
+      candidates = sorted((access_time, name)
+                          for name, (access_time, _, pinned) in entries.items()
+                          if not pinned)
+      total = sum(size for _, size, _ in entries.values())
+      for access_time, name in candidates:
+        too_old = self._max_age_secs is not None and now - access_time > self._max_age_secs
+        too_big = self._max_bytes is not None and total > self._max_bytes
+        if not too_old and not too_big:
+          continue
+        # Renamed first, so that no reader sees a partially removed entry.
+        evicted = os.path.join(self._root, '.evicted_{}_{}'.format(name, uuid.uuid4().hex))
+        try:
+          os.rename(os.path.join(self._root, name), evicted)
+        except OSError:
+          continue
+        shutil.rmtree(evicted, ignore_errors=True)
+        total -= entries[name][1]
+        logging.info('Evicted cached payload %s', name)
+
+
+_CACHES = {}  # type: Dict[str, PayloadCache]
+_CACHES_LOCK = threading.Lock()
+
+
+def get_cache(root: str,
+              max_bytes: Optional[int] = None,
+              max_age_secs: Optional[float] = None) -> PayloadCache:
+  """Returns the cache of `root`, evicting stale entries on first use."""
+  root = os.path.abspath(root)
+  with _CACHES_LOCK:
+    if root not in _CACHES:
+      _CACHES[root] = PayloadCache(root, max_bytes, max_age_secs)
+      _CACHES[root].evict()
+    return _CACHES[root]
@@ -19,7 +19,7 @@
 import getpass
 import os
 import typing
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional
 
 from absl import flags
 from absl import logging
@@ -34,8 +34,22 @@ def bind_addresses_local(addresses: List[lp_address.Address]):
   for address in addresses:
     address.bind(lp_address.LocalAddressBuilder())
 
-def bind_addresses_host(addresses: List[lp_address.Address]):
-  """Binds addresses for the local launch."""
+def bind_addresses_host(addresses: List[lp_address.Address],
+                        reserved_ports: Optional[Dict[int, Any]] = None):
+  """Binds addresses for the ssh launch.
+
+  Args:
+    addresses: Addresses to bind.
+    reserved_ports: Ports reserved on the hosts of the addresses, keyed by
+      `id(address)` (see `port_reservation.reserve_addresses`). Addresses
+      without a reservation get a port picked on the launcher.
+  """
 
+  reserved_ports = reserved_ports or {}
   for address in addresses:
-    address.bind(lp_address.HostAddressBuilder(address.host,address.port))
+    reservation = reserved_ports.get(id(address))
+    if reservation is None:
+      address.bind(lp_address.HostAddressBuilder(address.host, address.port))
+    else:
+      address.bind(lp_address.HostAddressBuilder(
+          address.host, address.port, reservation.port, reservation.reservation_dir))
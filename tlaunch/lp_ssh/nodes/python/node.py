@@ -35,6 +35,7 @@ import tree
 
 from tlaunch.lp_ssh.nodes import base
 from tlaunch.lp_ssh import context
+from tlaunch.utils import startup_profile
 
 T = TypeVar('T')
 HandleType = TypeVar('HandleType', bound=base.Handle)
@@ -109,7 +110,8 @@ class PyNode(base.Node[HandleType], Generic[HandleType, ReturnType]):
     ]:
       addressing.bind_addresses_local(self.addresses)
     elif self._launch_context.launch_type in [context.LaunchType.SSH_MULTI_PROCESSING,]:
-      addressing.bind_addresses_host(self.addresses)
+      addressing.bind_addresses_host(self.addresses,
+                                     reserved_ports=kwargs.get('reserved_ports'))
     else:
       raise NotImplementedError('Unsupported launch type: {}'.format(
           self._launch_context.launch_type))
@@ -165,7 +167,10 @@ class PyClassNode(PyNode[HandleType, type(None)],
   def _construct_instance(self) -> WorkerType:
     args, kwargs = tree.map_structure(dereference.maybe_dereference,
                                       (self._args, self._kwargs))
-    return self._constructor(*args, **kwargs)
+    startup_profile.mark(startup_profile.HANDLES_DEREFERENCED)
+    instance = self._constructor(*args, **kwargs)
+    startup_profile.mark(startup_profile.CONSTRUCTED)
+    return instance
 
   def disable_run(self) -> None:
     """Prevents the node from calling `run` on the Python object.
@@ -191,6 +196,7 @@ class PyClassNode(PyNode[HandleType, type(None)],
     """
     instance = self._construct_instance()
     if hasattr(instance, 'run') and self._should_run:
+      startup_profile.mark(startup_profile.RUN_STARTED)
       instance.run()
     else:
       logging.warning(
@@ -15,9 +15,15 @@
 
 """Entry of a PythonNode worker."""
 
+import time
+
+_ENTRY_START_TIME = time.time()
+_FLAGS_POPULATED_TIME = None
 
 import contextlib
+import importlib
 import json
+import multiprocessing
 import os
 import sys
 
@@ -28,6 +34,7 @@ from absl import flags
 from absl import logging
 import cloudpickle
 from tlaunch.lp_ssh.launch import worker_manager
+from tlaunch.utils import startup_profile
 import six
 
 
@@ -47,6 +54,23 @@ flags.DEFINE_string(
     'init_file', '', 'Pickle file location containing initialization module '
     'executed for each node prior to an entry point')
 flags.DEFINE_string('flags_to_populate', '{}', '')
+flags.DEFINE_boolean(
+    'lp_payload_per_task', False,
+    'Whether data_file holds the entry point of this task only, instead of '
+    'the entry points of all tasks of the group')
+flags.DEFINE_string(
+    'lp_start_method', None,
+    'multiprocessing start method to set before running the node, e.g. spawn')
+flags.DEFINE_list(
+    'lp_preimports', [],
+    'Modules to import before the entry points are unpickled, e.g. torch')
+flags.DEFINE_string(
+    'lp_startup_profile_dir', '',
+    'Directory in which the startup phases of this node are recorded, '
+    'disabled if empty')
+flags.DEFINE_string(
+    'lp_startup_profile_name', '',
+    'Name of the startup record of this node')
 
 _FLAG_TYPE_MAPPING = {
     str: flags.DEFINE_string,
@@ -98,6 +122,24 @@ def _get_task_id():
   return FLAGS.lp_task_id
 
 
+def _preimport():
+  """Applies the start method and imports the requested modules.
+
+  Returns:
+    A dict mapping each preimported module to its import time in seconds.
+  """
+  if FLAGS.lp_start_method:
+    # torch.multiprocessing shares the start method of multiprocessing, so
+    # torch does not need to be imported for this.
+    multiprocessing.set_start_method(FLAGS.lp_start_method)
+  import_secs = {}
+  for module in FLAGS.lp_preimports:
+    start = time.time()
+    importlib.import_module(module)
+    import_secs[module] = time.time() - start
+  return import_secs
+
+
 def main(_):
   # Allow for importing modules from the current directory.
   sys.path.append(os.getcwd())
@@ -108,12 +150,28 @@ def main(_):
     # For GCP runtime log to STDOUT so that logs are not reported as errors.
     logging.get_absl_handler().python_handler.stream = sys.stdout
 
+  if FLAGS.lp_startup_profile_dir:
+    startup_profile.configure(FLAGS.lp_startup_profile_dir,
+                              FLAGS.lp_startup_profile_name or str(_get_task_id()),
+                              interpreter_start=_ENTRY_START_TIME)
+    startup_profile.mark(startup_profile.FLAGS_POPULATED, _FLAGS_POPULATED_TIME)
+
+  import_secs = _preimport()
+  logging.info(
+      'Entry point imports took %.3fs (%s)', time.time() - _ENTRY_START_TIME,
+      ', '.join('{} {:.3f}s'.format(module, secs)
+                for module, secs in import_secs.items()) or 'no preimports')
+
   if init_file:
     init_function = cloudpickle.load(open(init_file, 'rb'))
     init_function()
   f = open(data_file, 'rb')
-  functions = cloudpickle.load(f)
   task_id = _get_task_id()
+  if FLAGS.lp_payload_per_task:
+    function = cloudpickle.load(f)
+  else:
+    function = cloudpickle.load(f)[task_id]
+  startup_profile.mark(startup_profile.PAYLOAD_UNPICKLED)
 
   # Worker manager is used here to handle termination signals and provide
   # preemption support.
@@ -122,7 +180,7 @@ def main(_):
 
   with contextlib.suppress():  # no-op context manager
     try:
-      functions[task_id]()
+      function()
   
     except Exception as e:
           traceback.print_exc()
@@ -134,9 +192,8 @@ def main(_):
           if answer == 'yes':
               pass
 
-import torch
 
 if __name__ == '__main__':
-  torch.multiprocessing.set_start_method('spawn')     # 多进程中使用cuda
   _populate_flags()
+  _FLAGS_POPULATED_TIME = time.time()
   app.run(main)
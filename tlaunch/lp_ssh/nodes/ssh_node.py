@@ -17,24 +17,39 @@
 """"""
 import os
 import json
+import dataclasses
 from pathlib import Path
 
 from typing import Any, List, Mapping, Optional, Union, Sequence, Tuple
-import shutil
-
-import atexit
-
 import cloudpickle
 import tempfile
 
 from launchpad.nodes.python.local_multi_processing import PythonProcess, _to_cmd_arg, flags_utils
 from tlaunch.lp_ssh import context
+from tlaunch.lp_ssh import placement
+from tlaunch.lp_ssh import ssh_pool
 
+from tlaunch.lp_ssh.launch.run_ssh import startup_report
 from tlaunch.lp_ssh.launch.ssh_multi_processing import commands as mp_commands
 
+from . import payload_cache
 from .python.node import PyClassNode
 
-_DATA_FILE_NAME = 'job.pkl'
+_PAYLOAD_CACHE_DIR = 'tlaunch_payloads'
+
+
+@dataclasses.dataclass
+class SSHPythonProcess(PythonProcess):
+    """Launch configuration of a group of SSHNodes.
+
+    Attributes:
+      start_method: multiprocessing start method set before the node runs
+        (e.g. 'spawn' to use CUDA in subprocesses), None to keep the default.
+      preimports: Modules imported before the node is unpickled, e.g. ['torch'].
+    """
+
+    start_method: Optional[str] = None
+    preimports: Sequence[str] = ()
 
 
 def to_ssh_multiprocessing_executables(
@@ -52,37 +67,50 @@ def to_ssh_multiprocessing_executables(
 
 
 
+    if hasattr(nodes[0], "host"):
+        group_host = nodes[0].host
+        group_port = nodes[0].port
+    else:
+        group_host = "localhost"
+        group_port = "22"
+
+    # Payloads are stored by content hash, so relaunching an identical program
+    # reuses them instead of writing new ones.
+    cache = payload_cache.get_cache(
+        os.path.join(nodes[0].share_temp_dir or tempfile.gettempdir(), _PAYLOAD_CACHE_DIR),
+        max_bytes=nodes[0].payload_cache_max_bytes,
+        max_age_secs=nodes[0].payload_cache_max_age_secs)
+
+    # Without a shared filesystem, files are copied to the host by the launcher
+    # and the commands refer to the remote copies.
+    push_files = not nodes[0].share_temp_dir and not ssh_pool.is_local(group_host)
+    files = {}
+
+    def to_host_path(local_path):
+        if not push_files:
+            return local_path
+        remote_path = os.path.join(nodes[0].remote_payload_dir,
+                                   os.path.relpath(local_path, cache.root))
+        files[remote_path] = local_path
+        return remote_path
+
     if nodes[0].share_entry_script_path:
         entry_script_path = nodes[0].share_entry_script_path
     else:
         entry_script_path = os.path.join(os.path.dirname(__file__), 'python',
                                          'process_entry.py')
-    if nodes[0].share_temp_dir:
-        if not Path(nodes[0].share_temp_dir).exists():
-            os.makedirs(nodes[0].share_temp_dir)
-        tmp_dir = tempfile.mkdtemp(dir=nodes[0].share_temp_dir)
+        if push_files:
+            with open(entry_script_path, 'rb') as f:
+                entry_script_path = to_host_path(cache.put(f.read(), file_name='process_entry.py'))
+    if nodes[0].shard_payload:
+        # One payload per task, every worker only unpickles its own function.
+        data_file_paths = [to_host_path(cache.put(cloudpickle.dumps(node.function, protocol=4)))
+                           for node in nodes]
     else:
-        tmp_dir = tempfile.mkdtemp()
-
-   
-
-    rm_tmp_dir = False
-    if rm_tmp_dir:
-        atexit.register(shutil.rmtree, tmp_dir, ignore_errors=True)
-
-
-    data_file_path = os.path.join(tmp_dir, _DATA_FILE_NAME)
-    with open(data_file_path, 'wb') as f:
-        cloudpickle.dump([node.function for node in nodes], f,protocol=4)
+        data_file_paths = [to_host_path(cache.put(
+            cloudpickle.dumps([node.function for node in nodes], protocol=4)))] * len(nodes)
 
     commands = []
-    if hasattr(nodes[0], "host"):
-        group_host = nodes[0].host
-        group_port = nodes[0].port
-    else:
-        group_host = "localhost"
-        group_port = "22"
-
     for task_id, node in enumerate(nodes):
         assert not hasattr(node, "host") or group_host == node.host, 'Nodes in the same group must have the same host. Node {} in group {} should run on host {} instead of {}'.format(
             task_id, label, group_host, node.host)
@@ -103,11 +131,28 @@ def to_ssh_multiprocessing_executables(
                 _to_cmd_arg('flags_to_populate', json.dumps(flags_to_populate)))
 
         command_as_list.extend([
-            '--data_file', data_file_path,
+            '--data_file', data_file_paths[task_id],
             '--lp_task_id', str(task_id),
         ])
+        # Settings of the node override the ones of its group.
+        start_method = node.start_method or getattr(launch_config, 'start_method', None)
+        if start_method:
+            command_as_list.extend(['--lp_start_method', start_method])
+        preimports = node.preimports or getattr(launch_config, 'preimports', ())
+        if preimports:
+            command_as_list.extend(['--lp_preimports', ','.join(preimports)])
+        if nodes[0].shard_payload:
+            command_as_list.append('--lp_payload_per_task')
+        if startup_report.record_dir():
+            command_as_list.extend([
+                '--lp_startup_profile_dir', startup_report.record_dir(),
+                '--lp_startup_profile_name', label + '/' + str(task_id),
+            ])
         command = mp_commands.Command(command_as_list, launch_config.env,
-                                      label + '/' + str(task_id), group_host, group_port)
+                                      label + '/' + str(task_id), group_host, group_port,
+                                      files=files,
+                                      interpreter=launch_config.absolute_interpreter_path,
+                                      files_max_age_secs=nodes[0].payload_cache_max_age_secs)
 
         commands.append(command)
 
@@ -117,10 +162,43 @@ def to_ssh_multiprocessing_executables(
 class SSHNode(PyClassNode):
     share_entry_script_path: str = None
     share_temp_dir: str = None
+    # Eviction policy of the payload cache under `share_temp_dir`.
+    payload_cache_max_bytes: int = 10 * 2 ** 30
+    payload_cache_max_age_secs: float = 7 * 24 * 3600
+    # Write one payload per task instead of one per group.
+    shard_payload: bool = False
+    # Where payloads are copied on hosts which do not share `share_temp_dir`.
+    remote_payload_dir: str = '/tmp/tlaunch_payloads'
+    # Applied by the entry point before the node is unpickled, see
+    # `SSHPythonProcess`.
+    start_method: Optional[str] = None
+    preimports: Sequence[str] = ()
+    # Used to place the node on a host of the inventory of the program, see
+    # `placement`.
+    resources: Optional[placement.Resources] = None
+    affinities: Sequence[placement.AffinityTarget] = ()
+    anti_affinities: Sequence[placement.AffinityTarget] = ()
 
     def run(self) -> None:
         super().run()
 
+    def require(self, cpus: float = 1., memory_gb: float = 0., gpus: int = 0):
+        """Declares the resources of the host used by the node."""
+        self.resources = placement.Resources(cpus, memory_gb, gpus)
+        return self
+
+    def affinity(self, *targets):
+        """Places the node on the host of `targets`, nodes or group labels."""
+        self.affinities = tuple(self.affinities) + tuple(
+            placement.affinity_target(target) for target in targets)
+        return self
+
+    def anti_affinity(self, *targets):
+        """Keeps the node off the hosts of `targets`, nodes or group labels."""
+        self.anti_affinities = tuple(self.anti_affinities) + tuple(
+            placement.affinity_target(target) for target in targets)
+        return self
+
     def to_host(self, host):
         if ":" in host:
             self.host = host.split(":")[0]
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Nodes aggregating messages along a tree of transmit servers."""
+
+import functools
+from typing import List, NamedTuple, Sequence
+
+from tlaunch.lp_ssh.nodes import ssh_node
+from tlaunch.lp_ssh.nodes.transmit import node as transmit_node
+from tlaunch.lp_ssh.transmit import aggregator
+
+
+class AggregatorNode(ssh_node.SSHNode):
+    """Runs an `Aggregator` from the servers of `children` into `parent`.
+
+    The servers must hold the queue table of the messages, see
+    `aggregator.aggregation_tables`.
+    """
+
+    def __init__(self,
+                 children: Sequence[transmit_node.TransmitHandle],
+                 parent: transmit_node.TransmitHandle,
+                 reducer: aggregator.Reducer = aggregator.merge_dicts,
+                 table: str = aggregator.AGGREGATION_TABLE,
+                 flush_interval_secs: float = 1.):
+        super().__init__(aggregator.Aggregator, list(children), parent, reducer, table,
+                         flush_interval_secs)
+
+
+class AggregationTree(NamedTuple):
+    # Handle of the root server, to read the aggregated messages from with
+    # `aggregator.iter_messages`.
+    root: transmit_node.TransmitHandle
+    # Handle of the server of every host, in the order of the hosts. Messages
+    # sent to any of them reach the root.
+    servers: List[transmit_node.TransmitHandle]
+
+
+def build_aggregation_tree(program,
+                           hosts: Sequence[str],
+                           arity: int = 8,
+                           reducer: aggregator.Reducer = aggregator.merge_dicts,
+                           table: str = aggregator.AGGREGATION_TABLE,
+                           flush_interval_secs: float = 1.,
+                           label: str = 'aggregation') -> AggregationTree:
+    """Adds a k-ary aggregation tree over `hosts` to `program`.
+
+    Every host runs a server, `hosts[0]` being the root. The server at index i
+    has the servers at indices `arity * i + 1` to `arity * i + arity` as
+    children, which an aggregator on its host consumes. Every aggregator
+    therefore reads at most `arity` servers, and messages go through
+    O(log_arity(len(hosts))) hops to the root.
+
+    Returns:
+      The handles of the root and of all servers, producers should write to the
+      server of their host (or the nearest one).
+    """
+    if arity < 1:
+        raise ValueError('arity must be positive, got {}'.format(arity))
+    servers = []
+    for host_id, host in enumerate(hosts):
+        server = transmit_node.TransmitNode(
+            functools.partial(aggregator.aggregation_tables, table)).to_host(host)
+        servers.append(program.add_node(server, label='{}_server_{}'.format(label, host_id)))
+    for host_id, host in enumerate(hosts):
+        children = servers[arity * host_id + 1:arity * host_id + arity + 1]
+        if not children:
+            continue
+        aggregator_node = AggregatorNode(children, servers[host_id], reducer, table,
+                                         flush_interval_secs).to_host(host)
+        program.add_node(aggregator_node, label='{}_aggregator_{}'.format(label, host_id))
+    return AggregationTree(servers[0], servers)
@@ -20,11 +20,11 @@ from typing import Any, Callable, Optional, Sequence
 
 from absl import logging
 
-import portpicker
-
 import reverb
 
 from tlaunch.lp_ssh import address as lp_address
+from tlaunch.lp_ssh import ssh_pool
+from tlaunch.lp_ssh import ssh_tunnel
 
 from tlaunch.lp_ssh.launch import worker_manager
 
@@ -35,16 +35,17 @@ from tmarl.transmit.rl_tables import rl_tables
 
 
 # from tmarl import transmit
-from tmarl.transmit import client
+from tlaunch.lp_ssh.transmit import registry
+from tlaunch.lp_ssh.transmit import sharded_client
 from tmarl.transmit import launch_server
 from tlaunch.lp_ssh.nodes import base
 from tlaunch.lp_ssh.address import get_port_from_address
+from tlaunch.utils import startup_profile
 
 PriorityTablesFactory = Callable[[], Sequence[reverb.Table]]
 CheckpointerFactory = Callable[[], reverb.checkpointers.CheckpointerBase]
 
 TRANSMIT_PORT_NAME = 'transmit'
-import subprocess
 
 
 class TransmitHandle(base.Handle):
@@ -54,13 +55,18 @@ class TransmitHandle(base.Handle):
     actors.
     """
 
-    def __init__(self, address: lp_address.Address):
+    def __init__(self, address: lp_address.Address, client_pool_size: int = 1,
+                 reverse_proxy: bool = False):
         self._address = address
+        self._client_pool_size = client_pool_size
+        self._reverse_proxy = reverse_proxy
 
-    def dereference(self):
+    def server_address(self) -> str:
+        """Returns the address clients of this process connect to."""
         address = self._address.resolve()
         if isinstance(address,str):
             host = address.split(':')[0]
+            host_port = '22'
             client_port = address.split(':')[1]
         else:
             host = address.split(':')[0]
@@ -68,32 +74,38 @@ class TransmitHandle(base.Handle):
             client_port = get_port_from_address(address)
         print("data server address:",address)
 
-        # 反向代理，但是程序结束后不会自动断开，需要实现自动断开的功能
-        reverse_proxy = False
-        if host == '127.0.0.1' or host == 'localhost':
-            reverse_proxy=False
+        # Servers which are not reachable directly are reached through an ssh
+        # tunnel, shared by all clients of this process.
+        reverse_proxy = self._reverse_proxy and not ssh_pool.is_local(host)
 
         if reverse_proxy:
-
-            try:
-                local_port = portpicker.pick_unused_port()
-                server_address = 'localhost:{}'.format(local_port)
-                exe_list = ['ssh','-p', host_port, '-NL', '{}:localhost:{}'.format(local_port, client_port), host, '&']
-
-                subprocess.Popen(exe_list)
-                print("Use reverse proxy:{}".format(" ".join(exe_list)))
-
-            except subprocess.CalledProcessError as e:
-                print(e.output.decode())
-                raise e  # If `tmux new-session` failed for some other reason.
-
+            local_port = ssh_tunnel.open_tunnel(host, host_port, int(client_port))
+            server_address = 'localhost:{}'.format(local_port)
             logging.info('Transmit client connecting to: %s', address)
             logging.info('Transmit client using local address: {}'.format(server_address))
         else:
             server_address = '{}:{}'.format(host,client_port)
-            logging.info('Transmit client connecting to server: %s', server_address)
+        return server_address
+
+    def dereference(self):
+        # Handles of the same server share their clients within a process.
+        return registry.get_client(self.server_address(), self._client_pool_size)
+
+
+class ShardedTransmitHandle(base.Handle):
+    """Handle of a ShardedTransmitNode.
+
+    When dereferenced a `ShardedClient` over the clients of all shards is
+    returned, with the same API as the transmit-Client.
+    """
+
+    def __init__(self, shard_handles: Sequence[TransmitHandle], keyed_tables: Sequence[str] = ()):
+        self._shard_handles = list(shard_handles)
+        self._keyed_tables = tuple(keyed_tables)
 
-        return client.Client(server_address)
+    def dereference(self):
+        return sharded_client.ShardedClient(
+            [handle.dereference() for handle in self._shard_handles], self._keyed_tables)
 
 
 class TransmitNode(ssh_node.SSHNode):
@@ -101,11 +113,20 @@ class TransmitNode(ssh_node.SSHNode):
 
     def __init__(self,
                  priority_tables_fn: Optional[PriorityTablesFactory] = lambda: [],
-                 checkpoint_ctor: Optional[CheckpointerFactory] = None):
+                 checkpoint_ctor: Optional[CheckpointerFactory] = None,
+                 client_pool_size: int = 1,
+                 reverse_proxy: bool = False):
         super().__init__(self.run)
         self._priority_tables_fn = priority_tables_fn
+        # Clients per process and server address handed out by the handles,
+        # more than one for nodes which write concurrently from several threads.
+        self._client_pool_size = client_pool_size
+        # Whether clients reach the server through an ssh tunnel, for servers
+        # behind a bastion.
+        self._reverse_proxy = reverse_proxy
         self._checkpoint_ctor = checkpoint_ctor
-        self._address = lp_address.HostAddress(TRANSMIT_PORT_NAME)
+        # The port is reserved on the host at launch and released in `run`.
+        self._address = lp_address.HostAddress(TRANSMIT_PORT_NAME, reserve=True)
 
         self.allocate_address(self._address)
 
@@ -115,7 +136,8 @@ class TransmitNode(ssh_node.SSHNode):
         return self
 
     def create_handle(self):
-        return self._track_handle(TransmitHandle(self._address))
+        return self._track_handle(TransmitHandle(self._address, self._client_pool_size,
+                                                 self._reverse_proxy))
 
     def run(self):
         priority_tables = self._priority_tables_fn()
@@ -133,10 +155,15 @@ class TransmitNode(ssh_node.SSHNode):
         else:
             checkpointer = self._checkpoint_ctor()
 
+        startup_profile.mark(startup_profile.CONSTRUCTED)
+
+        # The port was held on this host since launch, free it to bind it.
+        self._address.release_reservation()
         self._server = launch_server.LaunchServer(
             tables=priority_tables,
             port=lp_address.get_port_from_address(self._address.resolve()),
             checkpointer=checkpointer)
+        startup_profile.mark(startup_profile.RUN_STARTED)
         worker_manager.wait_for_stop()
 
     @property
@@ -144,6 +171,45 @@ class TransmitNode(ssh_node.SSHNode):
         return self._address
 
 
+class ShardedTransmitNode:
+    """A transmit service made of `num_shards` TransmitNodes, possibly on
+    several hosts.
+
+    Every shard serves all the tables of `priority_tables_fn`. Clients route
+    each table to one shard by consistent hashing, except for `keyed_tables`
+    which are spread over all shards by the key of each insert (see
+    `ShardedClient`).
+
+    It is not a node itself: its shards are added to a program with `add_to`,
+    one group per shard, which returns the handle of the service.
+    """
+
+    def __init__(self,
+                 num_shards: int,
+                 priority_tables_fn: Optional[PriorityTablesFactory] = lambda: [],
+                 keyed_tables: Sequence[str] = (),
+                 checkpoint_ctor: Optional[CheckpointerFactory] = None,
+                 client_pool_size: int = 1,
+                 reverse_proxy: bool = False):
+        if num_shards < 1:
+            raise ValueError('num_shards must be positive, got {}'.format(num_shards))
+        self.shards = [TransmitNode(priority_tables_fn, checkpoint_ctor, client_pool_size,
+                                    reverse_proxy) for _ in range(num_shards)]
+        self._keyed_tables = tuple(keyed_tables)
+
+    def to_hosts(self, hosts: Sequence[str]):
+        """Places the shards on `hosts` ('host' or 'host:ssh_port') in turn."""
+        for shard_id, shard in enumerate(self.shards):
+            shard.to_host(hosts[shard_id % len(hosts)])
+        return self
+
+    def add_to(self, program, label: str) -> ShardedTransmitHandle:
+        """Adds the shards to `program`, in groups `<label>_<shard id>`."""
+        shard_handles = [program.add_node(shard, label='{}_{}'.format(label, shard_id))
+                         for shard_id, shard in enumerate(self.shards)]
+        return ShardedTransmitHandle(shard_handles, self._keyed_tables)
+
+
 class RLTransmitNode(TransmitNode):
     def __init__(self, argv,actor_num,
                  checkpoint_ctor: Optional[CheckpointerFactory] = None):
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Places the nodes of a program on the hosts of an inventory.
+
+Nodes declare what they need with `SSHNode.require` and which nodes or groups
+they must share a host with (`affinity`) or must not (`anti_affinity`). The
+groups of the program are then bin-packed onto the hosts of the inventory,
+groups being the unit of placement since all nodes of a group run on the same
+host. Groups whose nodes communicate, e.g. a transmit server and the nodes
+using its handle, are kept on the same host where resources allow.
+
+Nodes already pinned with `to_host` keep their host. Placement only works
+on the program and the inventory, so plans can be computed and checked
+without any host.
+"""
+
+import collections
+import json
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Union
+
+from absl import logging
+
+# Preference for sharing a host with a declared affinity, over one with a
+# communication partner.
+_AFFINITY_WEIGHT = 100.
+
+
+class Resources(NamedTuple):
+  cpus: float = 0.
+  memory_gb: float = 0.
+  gpus: int = 0
+
+  def __add__(self, other: 'Resources') -> 'Resources':
+    return Resources(self.cpus + other.cpus, self.memory_gb + other.memory_gb,
+                     self.gpus + other.gpus)
+
+  def __sub__(self, other: 'Resources') -> 'Resources':
+    return Resources(self.cpus - other.cpus, self.memory_gb - other.memory_gb,
+                     self.gpus - other.gpus)
+
+  def fits_in(self, capacity: 'Resources') -> bool:
+    return (self.cpus <= capacity.cpus and self.memory_gb <= capacity.memory_gb and
+            self.gpus <= capacity.gpus)
+
+
+# Demand of nodes which did not declare any.
+DEFAULT_NODE_RESOURCES = Resources(cpus=1.)
+
+
+class Host(NamedTuple):
+  # As passed to `to_host`, 'host' or 'host:ssh_port'.
+  name: str
+  cpus: float
+  memory_gb: float
+  gpus: int = 0
+
+  @property
+  def capacity(self) -> Resources:
+    return Resources(self.cpus, self.memory_gb, self.gpus)
+
+
+class PlacementError(ValueError):
+  """Raised when the nodes of a program do not fit on the inventory."""
+
+
+class PlacementPlan(NamedTuple):
+  # Host of every group.
+  assignments: Dict[str, str]
+  # Resources of every host used by the groups placed on it.
+  usage: Dict[str, Resources]
+  inventory: Sequence[Host]
+
+  def to_dict(self) -> Dict:
+    hosts = {}
+    for host in self.inventory:
+      used = self.usage.get(host.name, Resources())
+      hosts[host.name] = dict(
+          groups=sorted(label for label, name in self.assignments.items() if name == host.name),
+          used=used._asdict(), capacity=host.capacity._asdict())
+    return dict(assignments=dict(self.assignments), hosts=hosts)
+
+  def format(self) -> str:
+    lines = ['Placement of {} groups on {} hosts:'.format(len(self.assignments),
+                                                          len(self.inventory))]
+    for host in self.inventory:
+      used = self.usage.get(host.name, Resources())
+      groups = sorted(label for label, name in self.assignments.items() if name == host.name)
+      lines.append('  {}: cpus {:g}/{:g}, memory {:g}/{:g}GB, gpus {}/{}: {}'.format(
+          host.name, used.cpus, host.cpus, used.memory_gb, host.memory_gb, used.gpus,
+          host.gpus, ', '.join(groups) or '-'))
+    return '\n'.join(lines)
+
+  def write(self, path: str) -> None:
+    with open(path, 'w') as f:
+      json.dump(self.to_dict(), f, indent=2)
+
+
+AffinityTarget = Union[str, int]
+
+
+def affinity_target(target) -> AffinityTarget:
+  """Returns how an affinity with `target`, a node or a group label, is stored."""
+  return target if isinstance(target, str) else id(target)
+
+
+def _node_host(node) -> Optional[str]:
+  if not hasattr(node, 'host'):
+    return None
+  port = getattr(node, 'port', '22')
+  return node.host if str(port) == '22' else '{}:{}'.format(node.host, port)
+
+
+class _Group(NamedTuple):
+  label: str
+  demand: Resources
+  pinned_host: Optional[str]
+  affinities: Set[str]
+  anti_affinities: Set[str]
+  partners: Set[str]
+
+
+def _groups(program) -> Dict[str, _Group]:
+  label_of = {}
+  handle_owner = {}
+  for label, nodes in program.groups.items():
+    for node in nodes:
+      label_of[id(node)] = label
+      for handle in node._created_handles:
+        handle_owner[id(handle)] = label
+
+  def to_label(target: AffinityTarget) -> Optional[str]:
+    if isinstance(target, str):
+      return target if target in program.groups else None
+    return label_of.get(target)
+
+  groups = {}
+  for label, nodes in program.groups.items():
+    demand = Resources()
+    pinned_hosts = set()
+    affinities, anti_affinities, partners = set(), set(), set()
+    for node in nodes:
+      demand += getattr(node, 'resources', None) or DEFAULT_NODE_RESOURCES
+      host = _node_host(node)
+      if host is not None:
+        pinned_hosts.add(host)
+      affinities.update(to_label(target) for target in getattr(node, 'affinities', ()))
+      anti_affinities.update(to_label(target) for target in getattr(node, 'anti_affinities', ()))
+      partners.update(handle_owner.get(id(handle)) for handle in node._input_handles)
+    if len(pinned_hosts) > 1:
+      raise PlacementError('Nodes of group {} are pinned to different hosts: {}'.format(
+          label, sorted(pinned_hosts)))
+    for related in (affinities, anti_affinities, partners):
+      related.discard(None)
+      related.discard(label)
+    groups[label] = _Group(label, demand, next(iter(pinned_hosts), None), affinities,
+                           anti_affinities, partners)
+  # Relations are symmetric.
+  for group in list(groups.values()):
+    for other in group.affinities:
+      groups[other].affinities.add(group.label)
+    for other in group.anti_affinities:
+      groups[other].anti_affinities.add(group.label)
+    for other in group.partners:
+      groups[other].partners.add(group.label)
+  return groups
+
+
+def _affinity_clusters(groups: Dict[str, _Group]) -> List[List[str]]:
+  """Returns the groups connected by affinities, each to place on one host."""
+  clusters, seen = [], set()
+  for label in groups:
+    if label in seen:
+      continue
+    cluster, pending = [], [label]
+    seen.add(label)
+    while pending:
+      current = pending.pop()
+      cluster.append(current)
+      for other in groups[current].affinities:
+        if other not in seen:
+          seen.add(other)
+          pending.append(other)
+    clusters.append(cluster)
+  return clusters
+
+
+def _size(demand: Resources, total: Resources) -> float:
+  """Demand relative to the whole inventory, used to sort and pack."""
+  return sum(value / capacity for value, capacity in zip(demand, total) if capacity)
+
+
+def plan(program, inventory: Sequence[Host]) -> PlacementPlan:
+  """Computes the host of every group of `program`.
+
+  Groups are placed by decreasing demand (first fit decreasing), each cluster
+  of groups related by affinities on a single host when it fits. Among the
+  hosts with enough free resources and no anti-affine group, the one holding
+  the most related groups is chosen, then the one left with the least free
+  resources so that large groups still find room.
+
+  Raises:
+    PlacementError: if some group does not fit on any host, or if groups
+      related by affinities are anti-affine.
+  """
+  if not inventory:
+    raise PlacementError('The inventory is empty')
+  hosts = {host.name: host for host in inventory}
+  total = sum((host.capacity for host in inventory), Resources())
+  groups = _groups(program)
+  affinity_clusters = _affinity_clusters(groups)
+  for cluster in affinity_clusters:
+    members = set(cluster)
+    for label in sorted(cluster):
+      conflicts = groups[label].anti_affinities & members
+      if conflicts:
+        raise PlacementError(
+            'Group {} has an anti-affinity with {}, but their affinities place them '
+            'on the same host'.format(label, ', '.join(sorted(conflicts))))
+  free = {host.name: host.capacity for host in inventory}
+  assignments = {}  # type: Dict[str, str]
+
+  def assign(label: str, host_name: str) -> None:
+    assignments[label] = host_name
+    free[host_name] -= groups[label].demand
+
+  def allowed(labels: Sequence[str], host_name: str) -> bool:
+    demand = sum((groups[label].demand for label in labels), Resources())
+    if not demand.fits_in(free[host_name]):
+      return False
+    return not any(assignments.get(other) == host_name
+                   for label in labels for other in groups[label].anti_affinities)
+
+  def score(labels: Sequence[str], host_name: str):
+    related = 0.
+    for label in labels:
+      related += _AFFINITY_WEIGHT * sum(assignments.get(other) == host_name
+                                        for other in groups[label].affinities)
+      related += sum(assignments.get(other) == host_name for other in groups[label].partners)
+    return related, -_size(free[host_name], total)
+
+  # Pinned groups first, they constrain the others.
+  for group in groups.values():
+    if group.pinned_host is None:
+      continue
+    if group.pinned_host not in hosts:
+      logging.warning('Group %s is pinned to %s, which is not in the inventory',
+                      group.label, group.pinned_host)
+      assignments[group.label] = group.pinned_host
+      continue
+    if not group.demand.fits_in(free[group.pinned_host]):
+      logging.warning('Group %s is pinned to %s, which does not have enough free resources',
+                      group.label, group.pinned_host)
+    assign(group.label, group.pinned_host)
+
+  clusters = []
+  for cluster in affinity_clusters:
+    cluster = [label for label in cluster if label not in assignments]
+    if cluster:
+      clusters.append(cluster)
+  clusters.sort(key=lambda cluster: -_size(
+      sum((groups[label].demand for label in cluster), Resources()), total))
+
+  for cluster in clusters:
+    candidates = [name for name in hosts if allowed(cluster, name)]
+    if candidates:
+      host_name = max(candidates, key=lambda name: score(cluster, name))
+      for label in cluster:
+        assign(label, host_name)
+      continue
+    if len(cluster) > 1:
+      logging.warning('Groups %s do not fit on a single host, placing them separately',
+                      sorted(cluster))
+    for label in sorted(cluster, key=lambda label: -_size(groups[label].demand, total)):
+      candidates = [name for name in hosts if allowed([label], name)]
+      if not candidates:
+        raise PlacementError('Group {} ({}) does not fit on any host of the inventory'.format(
+            label, groups[label].demand))
+      assign(label, max(candidates, key=lambda name: score([label], name)))
+
+  # Only pinned groups can still break an anti-affinity.
+  for label, host_name in assignments.items():
+    conflicts = sorted(other for other in groups[label].anti_affinities
+                       if assignments.get(other) == host_name)
+    if conflicts:
+      raise PlacementError('Group {} has an anti-affinity with {}, but they are pinned '
+                           'to the same host {}'.format(label, ', '.join(conflicts), host_name))
+
+  usage = collections.defaultdict(Resources)
+  for label, host_name in assignments.items():
+    usage[host_name] += groups[label].demand
+  return PlacementPlan(assignments, dict(usage), list(inventory))
+
+
+def apply(program, placement_plan: PlacementPlan) -> None:
+  """Moves the nodes which are not pinned yet to the host of their group."""
+  for label, nodes in program.groups.items():
+    for node in nodes:
+      if not hasattr(node, 'host'):
+        node.to_host(placement_plan.assignments[label])
+
+
+def place(program, inventory: Sequence[Host]) -> PlacementPlan:
+  """Places the nodes of `program` on `inventory` and returns the plan."""
+  placement_plan = plan(program, inventory)
+  apply(program, placement_plan)
+  return placement_plan
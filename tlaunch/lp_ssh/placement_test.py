@@ -0,0 +1,113 @@
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for tlaunch.lp_ssh.placement."""
+
+from absl.testing import absltest
+
+from tlaunch.lp_ssh import placement
+
+
+class _Node:
+  """Holds the attributes of an `SSHNode` read by the placement."""
+
+  def __init__(self, cpus=1., memory_gb=0., gpus=0, host=None):
+    self.resources = placement.Resources(cpus, memory_gb, gpus)
+    self.affinities = []
+    self.anti_affinities = []
+    self._created_handles = []
+    self._input_handles = []
+    if host is not None:
+      self.host = host
+
+
+class _Program:
+
+  def __init__(self, **nodes):
+    self.groups = {label: [node] for label, node in nodes.items()}
+
+
+def _hosts(**cpus):
+  return [placement.Host(name, cpus=value, memory_gb=64.) for name, value in cpus.items()]
+
+
+class PlanTest(absltest.TestCase):
+
+  def test_pinned_group_keeps_its_host_and_uses_its_resources(self):
+    program = _Program(server=_Node(cpus=3., host='x'), worker=_Node(cpus=2.))
+    plan = placement.plan(program, _hosts(x=4., y=4.))
+    self.assertEqual(plan.assignments, {'server': 'x', 'worker': 'y'})
+    self.assertEqual(plan.usage['x'].cpus, 3.)
+
+  def test_largest_groups_are_placed_first(self):
+    # Placed in the order of the program, the small groups would be packed on
+    # x and leave no host with 2 free cpus for d.
+    program = _Program(a=_Node(cpus=1.), b=_Node(cpus=1.), c=_Node(cpus=2.),
+                       d=_Node(cpus=2.))
+    plan = placement.plan(program, _hosts(x=3., y=3.))
+    self.assertEqual(plan.usage['x'].cpus, 3.)
+    self.assertEqual(plan.usage['y'].cpus, 3.)
+    self.assertNotEqual(plan.assignments['c'], plan.assignments['d'])
+
+  def test_anti_affine_groups_are_placed_on_different_hosts(self):
+    a, b = _Node(), _Node()
+    b.anti_affinities.append(placement.affinity_target('a'))
+    plan = placement.plan(_Program(a=a, b=b), _hosts(x=8., y=8.))
+    self.assertNotEqual(plan.assignments['a'], plan.assignments['b'])
+
+  def test_affine_groups_share_a_host(self):
+    a, b = _Node(), _Node()
+    b.affinities.append(placement.affinity_target(a))
+    plan = placement.plan(_Program(a=a, b=b, c=_Node(cpus=7.)), _hosts(x=8., y=8.))
+    self.assertEqual(plan.assignments['a'], plan.assignments['b'])
+
+  def test_partners_are_colocated(self):
+    handle = object()
+    server = _Node(cpus=2., host='y')
+    server._created_handles.append(handle)
+    client = _Node()
+    client._input_handles.append(handle)
+    # x has the least free cpus, where the client would go without its server.
+    program = _Program(other=_Node(cpus=6., host='x'), server=server, client=client)
+    plan = placement.plan(program, _hosts(x=8., y=8.))
+    self.assertEqual(plan.assignments['client'], 'y')
+
+  def test_conflicting_affinity_and_anti_affinity_raise(self):
+    c = _Node()
+    c.affinities.append(placement.affinity_target('b'))
+    c.anti_affinities.append(placement.affinity_target('a'))
+    a, b = _Node(), _Node()
+    b.affinities.append(placement.affinity_target('a'))
+    program = _Program(a=a, b=b, c=c)
+    with self.assertRaisesRegex(placement.PlacementError, 'affinities place them'):
+      placement.plan(program, _hosts(x=8., y=8.))
+
+  def test_anti_affine_groups_pinned_to_the_same_host_raise(self):
+    a, b = _Node(host='x'), _Node(host='x')
+    b.anti_affinities.append(placement.affinity_target(a))
+    with self.assertRaisesRegex(placement.PlacementError, 'pinned'):
+      placement.plan(_Program(a=a, b=b), _hosts(x=8., y=8.))
+
+  def test_group_larger_than_any_host_raises(self):
+    program = _Program(a=_Node(cpus=16.))
+    with self.assertRaisesRegex(placement.PlacementError, 'does not fit'):
+      placement.plan(program, _hosts(x=8., y=8.))
+
+  def test_empty_inventory_raises(self):
+    with self.assertRaises(placement.PlacementError):
+      placement.plan(_Program(a=_Node()), [])
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -18,8 +18,9 @@ import argparse
 import contextlib
 import itertools
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Union
 
+from . import placement
 from .nodes import base
 
 HandleType = Any
@@ -33,6 +34,8 @@ class Program(object):
     # Group to add nodes to. Used by group()
     self._current_group = None  # type: str
     self.all_args = all_args
+    # Hosts on which `launch` places the nodes without a host.
+    self._inventory = None  # type: Optional[List[Union[placement.Host, str]]]
 
   def add_node(self,
                node: base.Node,
@@ -69,6 +72,19 @@ class Program(object):
       self._current_group = None
 
 
+  def set_inventory(self, inventory: Sequence[Union[placement.Host, str]]) -> None:
+    """Sets the hosts to place the nodes on, see `placement.plan`.
+
+    Hosts are either described by `placement.Host`s, or given by name ('host'
+    or 'host:ssh_port'), in which case they are sized at launch from their
+    facts, see `host_facts.inventory`.
+    """
+    self._inventory = list(inventory)
+
+  @property
+  def inventory(self) -> Optional[List[Union[placement.Host, str]]]:
+    return self._inventory
+
   def get_all_nodes(self) -> List[base.Node]:
     return list(itertools.chain(*self._groups.values()))
 
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pool of multiplexed (ControlMaster) ssh connections, one per host."""
+
+import atexit
+import collections
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from absl import logging
+
+_MASTER_STARTUP_TIMEOUT_SECS = 30
+# How long the commands to a host whose master failed to open use regular
+# connections before opening the master is tried again.
+_MASTER_RETRY_SECS = 300
+_LOCAL_HOSTS = ('localhost', '127.0.0.1')
+
+
+def is_local(host: str) -> bool:
+  """Whether `host` is the launcher itself."""
+  return host in _LOCAL_HOSTS
+
+
+class SSHConnectionPool:
+  """Opens one master connection per (host, port) and reuses it.
+
+  Commands built by `command()` go through the master connection of their
+  host, so only the first command sent to a host pays the TCP and key-exchange
+  handshake. If a master cannot be opened the commands silently fall back to
+  regular ssh connections for `master_retry_secs`, before the master is tried
+  again.
+  """
+
+  def __init__(self, control_dir: str = None,
+               master_retry_secs: float = _MASTER_RETRY_SECS):
+    self._control_dir = control_dir or tempfile.mkdtemp(prefix='lp_ssh_')
+    self._master_retry_secs = master_retry_secs
+    self._masters = {}  # type: Dict[Tuple[str, str], subprocess.Popen]
+    # Time at which opening the master of a host last failed.
+    self._failures = {}  # type: Dict[Tuple[str, str], float]
+    self._host_locks = collections.defaultdict(threading.Lock)
+    self._lock = threading.Lock()
+    self._closed = False
+
+  def control_path(self, host: str, port: str) -> str:
+    # Unix socket paths are short, so the socket is named by a digest.
+    digest = hashlib.sha1('{}:{}'.format(host, port).encode()).hexdigest()[:16]
+    return os.path.join(self._control_dir, digest)
+
+  def command(self, host: str, port: str = '22') -> List[str]:
+    """Returns the ssh command prefix to run a command on `host`."""
+    port = str(port)
+    if not self._ensure_master(host, port):
+      return ['ssh', '-p', port, host]
+    return ['ssh', '-o', 'ControlPath={}'.format(self.control_path(host, port)),
+            '-p', port, host]
+
+  def _ensure_master(self, host: str, port: str) -> bool:
+    """Opens the master of `host` if needed, returns whether it is open."""
+    key = (host, port)
+    with self._lock:
+      if self._closed:
+        return False
+      host_lock = self._host_locks[key]
+    with host_lock:
+      master = self._masters.get(key)
+      if master is not None and master.poll() is None:
+        return True
+      failed_at = self._failures.get(key)
+      if failed_at is not None and time.time() < failed_at + self._master_retry_secs:
+        return False
+      control_path = self.control_path(host, port)
+      # BatchMode makes the master fail instead of waiting on a password or
+      # host key prompt that nobody answers.
+      master = subprocess.Popen(
+          ['ssh', '-M', '-N', '-o', 'BatchMode=yes',
+           '-o', 'ControlPath={}'.format(control_path), '-p', port, host],
+          stdin=subprocess.DEVNULL,
+          stdout=subprocess.DEVNULL,
+          stderr=subprocess.PIPE)
+      deadline = time.time() + _MASTER_STARTUP_TIMEOUT_SECS
+      while not os.path.exists(control_path):
+        if master.poll() is not None or time.time() > deadline:
+          if master.poll() is None:
+            master.kill()
+          logging.warning(
+              'Unable to open master ssh connection to %s:%s, falling back to '
+              'one connection per command: %s', host, port,
+              master.stderr.read().decode().strip())
+          self._failures[key] = time.time()
+          return False
+        time.sleep(0.05)
+      self._masters[key] = master
+      self._failures.pop(key, None)
+      logging.info('Opened master ssh connection to %s:%s', host, port)
+      return True
+
+  def close(self, host: str, port: str = '22') -> None:
+    """Tears down the master connection of `host`, if any."""
+    port = str(port)
+    with self._host_locks[(host, port)]:
+      master = self._masters.pop((host, port), None)
+      if master is None:
+        return
+      subprocess.call(
+          ['ssh', '-O', 'exit', '-o',
+           'ControlPath={}'.format(self.control_path(host, port)),
+           '-p', port, host],
+          stdout=subprocess.DEVNULL,
+          stderr=subprocess.DEVNULL)
+      try:
+        master.wait(timeout=5)
+      except subprocess.TimeoutExpired:
+        master.kill()
+
+  def close_all(self) -> None:
+    """Tears down all master connections of the pool."""
+    with self._lock:
+      self._closed = True
+      keys = list(self._masters)
+    for host, port in keys:
+      self.close(host, port)
+    shutil.rmtree(self._control_dir, ignore_errors=True)
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool() -> SSHConnectionPool:
+  """Returns the process-wide pool, closed when the process exits."""
+  global _POOL
+  with _POOL_LOCK:
+    if _POOL is None:
+      _POOL = SSHConnectionPool()
+      atexit.register(_POOL.close_all)
+    return _POOL
+
+
+def ssh_command(host: str, port: str = '22') -> List[str]:
+  """Returns the ssh command prefix to run a command on `host`."""
+  return get_pool().command(host, port)
+
+
+def close_pool() -> None:
+  """Closes the process-wide pool; the next command opens a new one."""
+  global _POOL
+  with _POOL_LOCK:
+    pool, _POOL = _POOL, None
+  if pool is not None:
+    pool.close_all()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local port forwards to remote servers, shared by a whole process."""
+
+import atexit
+import collections
+import socket
+import subprocess
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from absl import logging
+import portpicker
+
+_TUNNEL_STARTUP_TIMEOUT_SECS = 30
+_HEALTH_CHECK_INTERVAL_SECS = 10.
+
+TunnelKey = Tuple[str, str, int]
+
+
+def _is_listening(port: int) -> bool:
+  try:
+    with socket.create_connection(('localhost', port), timeout=1):
+      return True
+  except OSError:
+    return False
+
+
+class SSHTunnelManager:
+  """Opens one tunnel per (host, ssh port, remote port) and keeps it up.
+
+  A tunnel forwards a local port to `localhost:<remote port>` on the remote
+  host. Tunnels are checked every `health_check_interval_secs` and rebuilt on
+  the same local port when their ssh process exited or the port stopped
+  accepting connections, so clients connected through them keep their
+  address.
+  """
+
+  def __init__(self, health_check_interval_secs: float = _HEALTH_CHECK_INTERVAL_SECS):
+    self._health_check_interval_secs = health_check_interval_secs
+    self._tunnels = {}  # type: Dict[TunnelKey, Tuple[int, subprocess.Popen]]
+    self._key_locks = collections.defaultdict(threading.Lock)
+    self._lock = threading.Lock()
+    self._stopped = threading.Event()
+    self._health_checker = None  # type: Optional[threading.Thread]
+
+  def _start(self, host: str, ssh_port: str, remote_port: int,
+             local_port: int) -> subprocess.Popen:
+    tunnel = subprocess.Popen(
+        ['ssh', '-N',
+         '-o', 'ExitOnForwardFailure=yes',
+         '-o', 'ServerAliveInterval=15',
+         '-o', 'ServerAliveCountMax=3',
+         '-L', '{}:localhost:{}'.format(local_port, remote_port),
+         '-p', ssh_port, host],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE)
+    deadline = time.time() + _TUNNEL_STARTUP_TIMEOUT_SECS
+    while not _is_listening(local_port):
+      if tunnel.poll() is not None or time.time() > deadline:
+        if tunnel.poll() is None:
+          tunnel.kill()
+        raise RuntimeError('Unable to open a tunnel to {}:{} through {}:{}: {}'.format(
+            host, remote_port, host, ssh_port, tunnel.stderr.read().decode().strip()))
+      time.sleep(0.05)
+    logging.info('Forwarding localhost:%d to %s:%d', local_port, host, remote_port)
+    return tunnel
+
+  def open(self, host: str, ssh_port: str, remote_port: int) -> int:
+    """Returns the local port forwarded to `remote_port` on `host`."""
+    key = (host, str(ssh_port), int(remote_port))
+    with self._lock:
+      if self._stopped.is_set():
+        raise RuntimeError('SSHTunnelManager is closed')
+      key_lock = self._key_locks[key]
+      if self._health_checker is None:
+        self._health_checker = threading.Thread(target=self._check_health,
+                                                name='ssh_tunnel_health')
+        self._health_checker.daemon = True
+        self._health_checker.start()
+    with key_lock:
+      if key in self._tunnels:
+        return self._tunnels[key][0]
+      local_port = portpicker.pick_unused_port()
+      tunnel = self._start(*key, local_port)
+      with self._lock:
+        self._tunnels[key] = (local_port, tunnel)
+      return local_port
+
+  def _entries(self):
+    """Returns the key and the lock of every tunnel."""
+    with self._lock:
+      return [(key, self._key_locks[key]) for key in self._tunnels]
+
+  def _check_health(self) -> None:
+    while not self._stopped.wait(self._health_check_interval_secs):
+      for key, key_lock in self._entries():
+        with key_lock:
+          if key not in self._tunnels or self._stopped.is_set():
+            continue
+          local_port, tunnel = self._tunnels[key]
+          if tunnel.poll() is None and _is_listening(local_port):
+            continue
+          logging.warning('Tunnel to %s:%d is down, rebuilding it', key[0], key[2])
+          if tunnel.poll() is None:
+            tunnel.kill()
+          try:
+            self._tunnels[key] = (local_port, self._start(*key, local_port))
+          except RuntimeError as e:
+            # Retried at the next check.
+            logging.error('%s', e)
+
+  def close_all(self) -> None:
+    """Closes all tunnels; later calls to `open` fail."""
+    self._stopped.set()
+    for key, key_lock in self._entries():
+      with key_lock:
+        with self._lock:
+          _, tunnel = self._tunnels.pop(key, (None, None))
+        if tunnel is not None and tunnel.poll() is None:
+          tunnel.terminate()
+          try:
+            tunnel.wait(timeout=5)
+          except subprocess.TimeoutExpired:
+            tunnel.kill()
+
+
+_MANAGER = None  # type: Optional[SSHTunnelManager]
+_MANAGER_LOCK = threading.Lock()
+
+
+def get_tunnel_manager() -> SSHTunnelManager:
+  """Returns the manager of this process.
+
+  Its tunnels are closed at exit, once the node returned from its run function:
+  nodes keep using them during the termination notice.
+  """
+  global _MANAGER
+  with _MANAGER_LOCK:
+    if _MANAGER is None:
+      _MANAGER = SSHTunnelManager()
+      atexit.register(_MANAGER.close_all)
+    return _MANAGER
+
+
+def open_tunnel(host: str, ssh_port: str, remote_port: int) -> int:
+  """Returns a local port forwarded to `remote_port` on `host`."""
+  return get_tunnel_manager().open(host, ssh_port, remote_port)
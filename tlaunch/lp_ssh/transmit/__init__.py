@@ -18,3 +18,4 @@
 
 from .client import Client
 from .server import Server
+from .sharded_client import ShardedClient
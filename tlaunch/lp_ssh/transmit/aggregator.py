@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Hierarchical aggregation of messages through transmit servers.
+
+Messages to aggregate are published with `send_info(message, table=...)` into
+a queue table (see `aggregation_tables`) of a server. An `Aggregator` consumes
+the queues of several child servers concurrently, reduces the messages
+received during a flush interval with a user-provided reducer and publishes
+the result to the queue of its parent server, with one insert per interval.
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from absl import logging
+import reverb
+
+from tlaunch.lp_ssh.launch import worker_manager
+from tlaunch.lp_ssh.transmit import client as transmit_client
+
+AGGREGATION_TABLE = 'aggregation'
+
+Reducer = Callable[[List[Any]], Any]
+
+# Items streamed by one sample request of a consumer.
+_SAMPLES_PER_REQUEST = 1024
+_RETRY_SECS = 1.
+
+
+def aggregation_tables(table: str = AGGREGATION_TABLE,
+                       max_size: int = 100000) -> List[reverb.Table]:
+    """Returns the queue holding the messages to aggregate, each read once."""
+    return [reverb.Table.queue(name=table, max_size=max_size)]
+
+
+def merge_dicts(messages: List[Dict[Any, Any]]) -> Dict[Any, Any]:
+    """Reducer merging dict messages, later values of a key win."""
+    merged = {}
+    for message in messages:
+        merged.update(message)
+    return merged
+
+
+def concat(messages: List[Any]) -> List[Any]:
+    """Reducer forwarding the list of messages, flattening lists of messages
+    already reduced by `concat`."""
+    combined = []
+    for message in messages:
+        combined.extend(message if isinstance(message, list) else [message])
+    return combined
+
+
+def iter_messages(client: transmit_client.Client,
+                  table: str = AGGREGATION_TABLE) -> Iterator[Any]:
+    """Yields the messages published to `table`, e.g. by the root aggregator."""
+    while True:
+        for sample in client.sample(table, num_samples=_SAMPLES_PER_REQUEST):
+            yield transmit_client.decode_info(sample[0].data)[1]
+
+
+class Aggregator:
+    """Reduces the messages of child servers into their parent server."""
+
+    def __init__(self,
+                 children: Sequence[transmit_client.Client],
+                 parent: transmit_client.Client,
+                 reducer: Reducer = merge_dicts,
+                 table: str = AGGREGATION_TABLE,
+                 flush_interval_secs: float = 1.,
+                 max_pending: int = 100000):
+        """
+        Args:
+          children: Clients of the servers to consume `table` from.
+          parent: Client of the server to publish the reduced messages to.
+          reducer: Combines the messages of a flush interval into one.
+          table: Queue table of the messages on every server.
+          flush_interval_secs: Interval between two publications to `parent`.
+          max_pending: Maximum number of messages waiting to be reduced, the
+            consumption of the children pauses beyond that.
+        """
+        self._children = list(children)
+        self._parent = parent
+        self._reducer = reducer
+        self._table = table
+        self._flush_interval_secs = flush_interval_secs
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._stopped = threading.Event()
+
+    def _consume(self, child: transmit_client.Client) -> None:
+        while not self._stopped.is_set():
+            try:
+                for sample in child.sample(self._table, num_samples=_SAMPLES_PER_REQUEST):
+                    self._pending.put(transmit_client.decode_info(sample[0].data)[1])
+            except Exception:  # pylint: disable=broad-except
+                if self._stopped.is_set():
+                    return
+                logging.exception('Failed to consume %s, retrying in %ss', self._table,
+                                  _RETRY_SECS)
+                self._stopped.wait(_RETRY_SECS)
+
+    def flush(self) -> int:
+        """Publishes the messages received so far, reduced into one.
+
+        Returns:
+          The number of messages reduced.
+        """
+        messages = []
+        while True:
+            try:
+                messages.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+        if messages:
+            self._parent.send_info(self._reducer(messages), table=self._table)
+        return len(messages)
+
+    def run(self) -> None:
+        for child_id, child in enumerate(self._children):
+            consumer = threading.Thread(target=self._consume, args=(child,),
+                                        name='aggregator_consumer_{}'.format(child_id))
+            consumer.daemon = True
+            consumer.start()
+        while not worker_manager.wait_for_stop(self._flush_interval_secs):
+            self.flush()
+        self._stopped.set()
+        # The clients of the node stay open until it returns, see
+        # `registry.get_registry`, so the last batch still reaches the parent.
+        try:
+            self.flush()
+        except RuntimeError:
+            logging.exception('Failed to publish the last %s batch', self._table)
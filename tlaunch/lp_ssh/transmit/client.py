@@ -15,16 +15,89 @@
 # limitations under the License.
 
 """"""
-from typing import Dict
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
 
 import numpy as np
 import torch
 import reverb
+from absl import logging
+
+from tlaunch.lp_ssh.transmit import info_writer
+from tlaunch.lp_ssh.transmit import serializers
+from tlaunch.lp_ssh.transmit import weight_buffer
+from tlaunch.lp_ssh.transmit import weight_sync
+
+INFO_TABLE = 'info'
+
+
+def _to_bytes(value) -> bytes:
+    # Strings are sampled as object arrays holding the bytes.
+    if isinstance(value, np.ndarray):
+        value = value.item()
+    return value.encode() if isinstance(value, str) else value
+
+
+def decode_info(data) -> Tuple[int, Any]:
+    """Returns the send time in nanoseconds, 0 if unknown, and the value of an
+    item inserted by `send_info`."""
+    if len(data) == 1:
+        # Published without a send time, with dill.
+        sent_ns, name, payload, buffers = 0, serializers.DILL, data[0], []
+    elif len(data) == 2:
+        # Published with dill.
+        sent_ns, name, payload, buffers = int(data[0]), serializers.DILL, data[1], []
+    else:
+        sent_ns, name, payload, buffers = (int(data[0]), _to_bytes(data[1]).decode(),
+                                           data[2], list(data[3:]))
+    return sent_ns, serializers.get_serializer(name).loads(_to_bytes(payload), buffers)
 
-from dill import dumps, loads
 
 class Client(reverb.Client):
-    def insert_weight(self, model_weight, priorities: Dict[str, float]):
+    def __init__(self, server_address: str, *args,
+                 serializers_by_table: Optional[Dict[str, str]] = None, **kwargs):
+        """
+        Args:
+          server_address: Address of the reverb server.
+          serializers_by_table: Name of the serializer (see
+            `serializers.available_serializers`) used by `send_info` for each
+            info table, the default one is used for the other tables.
+        """
+        super().__init__(server_address, *args, **kwargs)
+        self._weight_packer = weight_buffer.WeightPacker()
+        # The packer reuses one buffer, which clients shared between threads
+        # must not overwrite before it is inserted.
+        self._weight_packer_lock = threading.Lock()
+        self._info_writers = []
+        self._serializers = {}  # type: Dict[str, serializers.Serializer]
+        for table, name in (serializers_by_table or {}).items():
+            self.set_serializer(table, name)
+        # Latest info sampled from each table: key of its item, version, value.
+        # The version counts the items seen by this client, see
+        # `get_info_with_version`.
+        self._info_cache = {}  # type: Dict[str, Tuple[int, int, Any]]
+
+    def set_serializer(self, table: str, name: str) -> None:
+        """Selects the serializer of the messages sent to `table`. Readers
+        need no configuration, every message records its serializer."""
+        self._serializers[table] = serializers.get_serializer(name)
+
+    def insert_weight(self, model_weight, priorities: Dict[str, float], packed: bool = False):
+        """Inserts the weights of the models in `model_weight`.
+
+        With `packed`, all tensors are copied into one reusable buffer and
+        inserted as three columns (buffer, layout descriptor, episode) instead
+        of one column per tensor, to be read back with `get_weight`.
+        """
+        if packed:
+            episode = model_weight.get(weight_buffer.EPISODE_KEY, -1)
+            with self._weight_packer_lock:
+                buffer, descriptor = self._weight_packer.pack(model_weight)
+                self.insert(data=[buffer, np.frombuffer(descriptor, dtype=np.uint8), episode],
+                            priorities=priorities)
+            return
+
         model_values = []
         episode = -1
         for model_key in model_weight:
@@ -40,10 +113,124 @@ class Client(reverb.Client):
 
         self.insert(data=model_values, priorities=priorities)
 
-    def send_info(self,info):
-      data = dumps(info)
-      self.insert(data=data, priorities={'info':1})
+    def _check_open(self):
+        if self._client is None:
+            raise RuntimeError('The transmit client of {} is closed'.format(
+                self._server_address))
+
+    def insert(self, *args, **kwargs):
+        self._check_open()
+        return super().insert(*args, **kwargs)
+
+    def sample(self, *args, **kwargs):
+        self._check_open()
+        return super().sample(*args, **kwargs)
+
+    def weight_sender(self, table: str, full_every: int = 100,
+                      quantization: Optional[str] = None,
+                      resync_check_secs: float = 0.1) -> weight_sync.WeightSyncSender:
+        """Returns a sender broadcasting weights as snapshots and deltas through
+        `table`, whose tables are built by `weight_sync.weight_sync_tables`."""
+        return weight_sync.WeightSyncSender(self, table, full_every, quantization,
+                                            resync_check_secs)
+
+    def weight_receiver(self, table: str,
+                        resync_retry_secs: float = 1.) -> weight_sync.WeightSyncReceiver:
+        """Returns a receiver of the weights sent by a `weight_sender`."""
+        return weight_sync.WeightSyncReceiver(self, table, resync_retry_secs)
+
+    def send_info(self, info, table: str = INFO_TABLE):
+        """Publishes `info` in `table`.
+
+        The item carries the time of the call in nanoseconds, for information
+        only as the clocks of the senders may differ, the name of the
+        serializer, the payload and the out-of-band buffers of the serializer.
+        """
+        serializer = self._serializers.get(table) or serializers.get_serializer(
+            serializers.DEFAULT_SERIALIZER)
+        payload, buffers = serializer.dumps(info)
+        self.insert(data=[time.time_ns(), serializer.name, payload] + buffers,
+                    priorities={table: 1})
+
+    def info_writer(self, merge: str = info_writer.LAST_WRITER_WINS, max_batch: int = 64,
+                    flush_interval_secs: float = 0.1,
+                    max_queue: int = 1024) -> info_writer.InfoWriter:
+        """Returns a writer batching the info messages of high frequency
+        producers into few `send_info` calls, see `info_writer.InfoWriter`."""
+        writer = info_writer.InfoWriter(self, merge, max_batch, flush_interval_secs, max_queue)
+        self._info_writers.append(writer)
+        return writer
+
+    def close(self):
+        """Sends what the info writers of this client hold and releases the
+        connection to the server. The client can not be used afterwards."""
+        writers, self._info_writers = self._info_writers, []
+        for writer in writers:
+            try:
+                writer.close()
+            except RuntimeError as e:
+                logging.warning('Failed to flush an info writer: %s', e)
+        # The channel is closed once the last reference to it is dropped, later
+        # calls raise a RuntimeError.
+        self._client = None
+
+    def get_info_with_version(self, table: str = INFO_TABLE):
+        """Returns the version and value of the latest info of `table`.
+
+        Info tables only hold the latest item, in the order the server received
+        them, so the version is the number of distinct items this client read
+        from `table`, starting at 1: it does not depend on the clocks of the
+        senders, and is only comparable with versions of this client.
+
+        The value is only deserialized when the latest item changed since the
+        previous call, otherwise the cached value is returned: callers must not
+        modify it. Arrays decoded from out-of-band buffers are read-only views
+        into the sampled item.
+        """
+        sample = next(self.sample(table=table, num_samples=1))[0]
+        cached = self._info_cache.get(table)
+        if cached is None or sample.info.key != cached[0]:
+            version = 1 if cached is None else cached[1] + 1
+            cached = self._info_cache[table] = (sample.info.key, version,
+                                                decode_info(sample.data)[1])
+        return cached[1], cached[2]
+
+    def get_info(self, table: str = INFO_TABLE):
+        return self.get_info_with_version(table)[1]
+
+    def wait_for_info(self, newer_than: int, timeout: Optional[float] = None,
+                      poll_interval_secs: float = 0.01, table: str = INFO_TABLE):
+        """Blocks until the version of the latest info is above `newer_than`.
+
+        Args:
+          newer_than: Version previously returned by this client, e.g. 0 to
+            wait for any info.
+          timeout: Seconds to wait, forever if None.
+          poll_interval_secs: Interval between two checks of the info table.
+          table: Info table to wait on.
+
+        Returns:
+          The version and the value of the info.
+
+        Raises:
+          TimeoutError: if no newer info was published within `timeout`.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            version, value = self.get_info_with_version(table)
+            if version > newer_than:
+                return version, value
+            if deadline is not None and time.time() > deadline:
+                raise TimeoutError('No info newer than version {} after {}s'.format(
+                    newer_than, timeout))
+            time.sleep(poll_interval_secs)
+
+    def get_weight(self, table: str):
+        """Samples weights inserted with `insert_weight(..., packed=True)`.
 
-    def get_info(self):
-      feteched_data = np.array(list(self.sample(table='info', num_samples=1))[0][0].data[0], dtype=bytes)
-      return loads(feteched_data)
+        Returns:
+          The weights as a dict of tensors viewing the sampled buffer, and the
+          episode.
+        """
+        buffer, descriptor, episode = next(self.sample(table=table, num_samples=1))[0].data
+        return weight_buffer.unpack(buffer, descriptor.tobytes()), int(episode)
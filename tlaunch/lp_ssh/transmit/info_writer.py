@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Coalesces info messages and sends them from a background thread."""
+
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional
+
+LAST_WRITER_WINS = 'last'
+APPEND = 'append'
+
+_FLUSH = object()
+_CLOSE = object()
+
+
+class InfoWriter:
+    """Merges the info dicts written to it and sends them in batches.
+
+    Messages are merged per key: with `LAST_WRITER_WINS` the latest value of a
+    key is kept, with `APPEND` each key maps to the list of its values since
+    the previous batch. A batch is sent with a single `send_info` once
+    `max_batch` messages were merged or `flush_interval_secs` passed since the
+    first one.
+
+    At most `max_queue` messages wait to be merged, writers block beyond that.
+    """
+
+    def __init__(self,
+                 client,
+                 merge: str = LAST_WRITER_WINS,
+                 max_batch: int = 64,
+                 flush_interval_secs: float = 0.1,
+                 max_queue: int = 1024):
+        if merge not in (LAST_WRITER_WINS, APPEND):
+            raise ValueError('merge must be {!r} or {!r}, got {!r}'.format(
+                LAST_WRITER_WINS, APPEND, merge))
+        self._client = client
+        self._merge = merge
+        self._max_batch = max_batch
+        self._flush_interval_secs = flush_interval_secs
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._error = None  # type: Optional[BaseException]
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='info_writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise RuntimeError('Failed to send info') from self._error
+
+    def write(self, info: Dict[Any, Any], timeout: Optional[float] = None) -> None:
+        """Queues `info`, blocking while the queue is full.
+
+        Raises:
+          queue.Full: if the queue is still full after `timeout` seconds.
+          RuntimeError: if a previous batch could not be sent.
+        """
+        self._raise_error()
+        if self._closed:
+            raise RuntimeError('InfoWriter is closed')
+        self._queue.put(info, timeout=timeout)
+
+    def flush(self) -> None:
+        """Sends the merged messages now and waits until they are sent.
+
+        Returns immediately once closed, `close` having sent every message.
+        """
+        if self._closed:
+            self._raise_error()
+            return
+        self._queue.put(_FLUSH)
+        self._queue.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        """Sends the remaining messages and stops the background thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_CLOSE)
+        self._thread.join()
+        self._raise_error()
+
+    def _merge_into(self, pending: Dict[Any, Any], info: Dict[Any, Any]) -> None:
+        if self._merge == LAST_WRITER_WINS:
+            pending.update(info)
+        else:
+            for key, value in info.items():
+                pending.setdefault(key, []).append(value)
+
+    def _send(self, pending: Dict[Any, Any]) -> None:
+        if not pending:
+            return
+        try:
+            self._client.send_info(pending)
+        except Exception as e:  # pylint: disable=broad-except
+            self._error = e
+
+    def _run(self) -> None:
+        pending = {}
+        num_messages = 0
+        # Items taken from the queue, acknowledged once their batch is sent.
+        num_dequeued = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0., deadline - time.time())
+            try:
+                item = self._queue.get(timeout=timeout)
+                num_dequeued += 1
+            except queue.Empty:
+                # The flush interval passed.
+                item = _FLUSH
+            if item is not _FLUSH and item is not _CLOSE:
+                self._merge_into(pending, item)
+                num_messages += 1
+                if deadline is None:
+                    deadline = time.time() + self._flush_interval_secs
+                if num_messages < self._max_batch:
+                    continue
+            self._send(pending)
+            pending = {}
+            num_messages = 0
+            deadline = None
+            for _ in range(num_dequeued):
+                self._queue.task_done()
+            num_dequeued = 0
+            if item is _CLOSE:
+                return
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Process-wide registry of transmit clients, shared per server address."""
+
+import atexit
+import collections
+import threading
+from typing import Callable, Dict, List, Optional
+
+from absl import logging
+
+from tlaunch.lp_ssh.transmit import client
+
+
+class ClientRegistry:
+    """Hands out shared clients, at most `pool_size` per server address.
+
+    While the pool of an address is not full every request gets a new client,
+    so that concurrent writers do not share a channel. Once full, the clients of
+    the pool are handed out in turn.
+    """
+
+    def __init__(self, client_factory: Callable[[str], client.Client] = client.Client):
+        self._client_factory = client_factory
+        self._lock = threading.Lock()
+        self._clients = collections.defaultdict(list)  # type: Dict[str, List[client.Client]]
+        self._next = collections.defaultdict(int)  # type: Dict[str, int]
+
+    def get(self, server_address: str, pool_size: int = 1) -> client.Client:
+        with self._lock:
+            pool = self._clients[server_address]
+            if len(pool) < max(1, pool_size):
+                pool.append(self._client_factory(server_address))
+                logging.info('Transmit client %d connecting to server: %s',
+                             len(pool), server_address)
+                return pool[-1]
+            self._next[server_address] += 1
+            return pool[self._next[server_address] % len(pool)]
+
+    def close_all(self) -> None:
+        with self._lock:
+            pools, self._clients = self._clients, collections.defaultdict(list)
+            self._next.clear()
+        for pool in pools.values():
+            for transmit_client in pool:
+                transmit_client.close()
+
+
+_REGISTRY = None  # type: Optional[ClientRegistry]
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_registry() -> ClientRegistry:
+    """Returns the registry of this process.
+
+    Its clients are closed at exit, once the node returned from its run
+    function: nodes keep using them during the termination notice.
+    """
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = ClientRegistry()
+            atexit.register(_REGISTRY.close_all)
+        return _REGISTRY
+
+
+def get_client(server_address: str, pool_size: int = 1) -> client.Client:
+    return get_registry().get(server_address, pool_size)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Serializers of the messages sent through the transmit info tables.
+
+A serializer turns a message into a payload plus a list of out-of-band
+buffers. The buffers hold the data of the arrays of the message and are
+inserted as separate columns, so that reverb stores them without copying them
+into the payload, and arrays are rebuilt as views into the sampled columns.
+
+The name of the serializer is stored with every message, so readers decode
+any message without knowing how it was written.
+"""
+
+import abc
+import pickle
+from typing import Any, Dict, List, Sequence, Tuple
+
+import dill
+import numpy as np
+
+if pickle.HIGHEST_PROTOCOL >= 5:
+    _pickle5 = pickle
+else:
+    try:
+        import pickle5 as _pickle5
+    except ImportError:
+        _pickle5 = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+DILL = 'dill'
+PICKLE5 = 'pickle5'
+MSGPACK = 'msgpack'
+
+DEFAULT_SERIALIZER = DILL
+
+
+class Serializer(metaclass=abc.ABCMeta):
+    """Encodes messages into a payload and out-of-band buffers."""
+
+    name = None  # type: str
+
+    @abc.abstractmethod
+    def dumps(self, obj: Any) -> Tuple[bytes, List[np.ndarray]]:
+        """Returns the payload and the uint8 buffers encoding `obj`."""
+
+    @abc.abstractmethod
+    def loads(self, payload: bytes, buffers: Sequence[np.ndarray]) -> Any:
+        """Rebuilds the object encoded by `dumps`."""
+
+
+class DillSerializer(Serializer):
+    """Dill pickles, for arbitrary python objects. Arrays are copied into the
+    payload."""
+
+    name = DILL
+
+    def dumps(self, obj):
+        return dill.dumps(obj), []
+
+    def loads(self, payload, buffers):
+        return dill.loads(payload)
+
+
+class Pickle5Serializer(Serializer):
+    """Pickle protocol 5, with the data of arrays as out-of-band buffers."""
+
+    name = PICKLE5
+
+    def dumps(self, obj):
+        buffers = []
+        payload = _pickle5.dumps(obj, protocol=5, buffer_callback=buffers.append)
+        return payload, [np.frombuffer(buffer.raw(), dtype=np.uint8) for buffer in buffers]
+
+    def loads(self, payload, buffers):
+        return _pickle5.loads(payload, buffers=buffers)
+
+
+# msgpack extension type of numpy arrays, whose data is an out-of-band buffer.
+_NDARRAY_EXT = 1
+
+
+class MsgpackSerializer(Serializer):
+    """msgpack, for messages made of plain python values and numpy arrays.
+
+    Faster and more compact than pickles, but tuples are decoded as lists and
+    other objects are not supported.
+    """
+
+    name = MSGPACK
+
+    def dumps(self, obj):
+        buffers = []
+
+        def default(value):
+            if isinstance(value, np.generic):
+                return value.item()
+            if not isinstance(value, np.ndarray) or value.dtype.hasobject:
+                raise TypeError('Unable to encode {} with msgpack'.format(type(value)))
+            value = np.ascontiguousarray(value)
+            buffers.append(value.reshape(-1).view(np.uint8))
+            return msgpack.ExtType(_NDARRAY_EXT, msgpack.packb(
+                [value.dtype.str, list(value.shape), len(buffers) - 1]))
+
+        return msgpack.packb(obj, default=default, use_bin_type=True), buffers
+
+    def loads(self, payload, buffers):
+
+        def ext_hook(code, data):
+            if code != _NDARRAY_EXT:
+                return msgpack.ExtType(code, data)
+            dtype, shape, index = msgpack.unpackb(data)
+            return np.frombuffer(buffers[index], dtype=np.dtype(dtype)).reshape(shape)
+
+        return msgpack.unpackb(payload, ext_hook=ext_hook, raw=False,
+                               strict_map_key=False)
+
+
+_SERIALIZERS = {}  # type: Dict[str, Serializer]
+
+
+def register_serializer(serializer: Serializer) -> None:
+    """Makes `serializer` selectable by its name."""
+    _SERIALIZERS[serializer.name] = serializer
+
+
+def get_serializer(name: str) -> Serializer:
+    if name not in _SERIALIZERS:
+        raise ValueError('Unknown serializer {!r}, available ones are {}'.format(
+            name, available_serializers()))
+    return _SERIALIZERS[name]
+
+
+def available_serializers() -> List[str]:
+    return sorted(_SERIALIZERS)
+
+
+register_serializer(DillSerializer())
+if _pickle5 is not None:
+    register_serializer(Pickle5Serializer())
+if msgpack is not None:
+    register_serializer(MsgpackSerializer())
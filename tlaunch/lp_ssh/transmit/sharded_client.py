@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Client of a transmit service sharded over several reverb servers.
+
+Tables are mapped to shards by consistent hashing of their name, so adding a
+shard only moves the tables of one arc of the ring. Tables declared as keyed
+are spread over all shards instead: every insert goes to the shard of its key
+(e.g. the actor id) and sampling fans out to all shards.
+"""
+
+import bisect
+import hashlib
+import random
+import threading
+import time
+from concurrent import futures
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from tlaunch.lp_ssh.transmit import client as transmit_client
+from tlaunch.lp_ssh.transmit import info_writer
+from tlaunch.lp_ssh.transmit import weight_sync
+
+
+def _hash(key: Any) -> int:
+    return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hashing of keys to `num_shards` shards, with
+    `replicas` points per shard on the ring to balance them."""
+
+    def __init__(self, num_shards: int, replicas: int = 64):
+        points = sorted((_hash('{}-{}'.format(shard, replica)), shard)
+                        for shard in range(num_shards) for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard(self, key: Any) -> int:
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._shards[index]
+
+
+class ShardedClient:
+    """Has the API of `Client`, each call being routed to the shard of its
+    table, or to the shards of its key for keyed tables.
+
+    Calls on a whole keyed table (`reset`, `update_priorities`, ...) fan out
+    to all shards, and `server_info` sums the sizes of keyed tables over the
+    shards. Writers are not bound to a table until they create items, so
+    `writer` and `trajectory_writer` take the `table` (and the `key` of keyed
+    tables) their items go to.
+    """
+
+    def __init__(self,
+                 clients: Sequence[transmit_client.Client],
+                 keyed_tables: Sequence[str] = (),
+                 size_refresh_secs: float = 1.,
+                 poll_interval_secs: float = 0.01):
+        """
+        Args:
+          clients: Client of every shard, in the order of the shards.
+          keyed_tables: Tables spread over all shards.
+          size_refresh_secs: How long the sizes of the keyed tables are cached,
+            they weight how many samples are drawn from each shard.
+          poll_interval_secs: Interval between two checks of the sizes of a
+            keyed table while it is empty on all shards.
+        """
+        self._clients = list(clients)
+        self._ring = HashRing(len(self._clients))
+        self._keyed_tables = frozenset(keyed_tables)
+        self._size_refresh_secs = size_refresh_secs
+        self._poll_interval_secs = poll_interval_secs
+        self._sizes = {}  # type: Dict[str, Any]
+        self._lock = threading.Lock()
+        self._executor = futures.ThreadPoolExecutor(max_workers=len(self._clients),
+                                                    thread_name_prefix='sharded_sample')
+
+    @property
+    def num_shards(self) -> int:
+        return len(self._clients)
+
+    def shard_for(self, table: str, key: Any = None) -> transmit_client.Client:
+        """Returns the client of the shard holding `key` of `table`.
+
+        Raises:
+          ValueError: if `table` is keyed and `key` is None, or the other way
+            around.
+        """
+        if key is None:
+            if table in self._keyed_tables:
+                raise ValueError('Table {!r} is keyed, routing into it needs a key'.format(table))
+            return self._clients[self._ring.shard(table)]
+        if table not in self._keyed_tables:
+            raise ValueError('Table {!r} is not keyed, inserts can not be routed by key'.format(
+                table))
+        return self._clients[self._ring.shard(key)]
+
+    def _shard_for_priorities(self, priorities: Dict[str, float], key: Any):
+        shards = {id(self.shard_for(table, key)): self.shard_for(table, key)
+                  for table in priorities}
+        if len(shards) != 1:
+            raise ValueError('Tables {} are held by different shards, insert into them '
+                             'separately'.format(sorted(priorities)))
+        return next(iter(shards.values()))
+
+    def insert(self, data, priorities: Dict[str, float], key: Any = None):
+        """Inserts `data` into the shard of `priorities`' tables.
+
+        Args:
+          key: Routing key of keyed tables, e.g. the id of the actor. Items of
+            the same key always go to the same shard.
+        """
+        return self._shard_for_priorities(priorities, key).insert(data, priorities)
+
+    def insert_weight(self, model_weight, priorities: Dict[str, float], packed: bool = False):
+        return self._shard_for_priorities(priorities, None).insert_weight(
+            model_weight, priorities, packed)
+
+    def _shard_sizes(self, table: str) -> List[int]:
+        with self._lock:
+            sizes, expiry = self._sizes.get(table, (None, 0.))
+            if sizes is not None and time.time() < expiry and any(sizes):
+                return sizes
+        sizes = list(self._executor.map(
+            lambda shard: shard.server_info()[table].current_size, self._clients))
+        with self._lock:
+            self._sizes[table] = (sizes, time.time() + self._size_refresh_secs)
+        return sizes
+
+    def _shards_of(self, table: str) -> List[transmit_client.Client]:
+        """Returns the clients of all shards holding items of `table`."""
+        if table in self._keyed_tables:
+            return self._clients
+        return [self.shard_for(table)]
+
+    def _sample_keyed(self, table: str, num_samples: int, **kwargs) -> Iterator:
+        sizes = self._shard_sizes(table)
+        while not any(sizes):
+            time.sleep(self._poll_interval_secs)
+            sizes = self._shard_sizes(table)
+        # Samples are drawn from the shards in proportion to their sizes, which
+        # samples the union of the shards like a single table would.
+        counts = [0] * len(sizes)
+        for shard in random.choices(range(len(sizes)), weights=sizes, k=num_samples):
+            counts[shard] += 1
+        requests = [self._executor.submit(
+            lambda shard, count: list(self._clients[shard].sample(
+                table, num_samples=count, **kwargs)),
+            shard, count) for shard, count in enumerate(counts) if count]
+        for request in requests:
+            yield from request.result()
+
+    def sample(self, table: str, num_samples: int = 1, **kwargs) -> Iterator:
+        if table in self._keyed_tables:
+            return self._sample_keyed(table, num_samples, **kwargs)
+        return self.shard_for(table).sample(table, num_samples=num_samples, **kwargs)
+
+    def server_info(self, timeout: Optional[int] = None) -> Dict[str, Any]:
+        """Returns the info of every table, from the shard holding it. The
+        size of keyed tables is the sum of their sizes on all shards."""
+        infos = list(self._executor.map(lambda shard: shard.server_info(timeout),
+                                        self._clients))
+        merged = {}
+        for table in infos[0]:
+            if table in self._keyed_tables:
+                merged[table] = infos[0][table]._replace(
+                    current_size=sum(info[table].current_size for info in infos))
+            else:
+                merged[table] = infos[self._ring.shard(table)][table]
+        return merged
+
+    def reset(self, table: str, timeout: Optional[int] = None):
+        for shard in self._shards_of(table):
+            shard.reset(table, timeout)
+
+    def update_priorities(self, table: str, updates: Dict[int, float],
+                          timeout: Optional[int] = None):
+        # Shards ignore the keys of the items they do not hold.
+        for shard in self._shards_of(table):
+            shard.update_priorities(table, updates, timeout)
+
+    def mutate_priorities(self, table: str, updates: Optional[Dict[int, float]] = None,
+                          deletes: Optional[List[int]] = None):
+        for shard in self._shards_of(table):
+            shard.mutate_priorities(table, updates, deletes)
+
+    def writer(self, *args, table: str, key: Any = None, **kwargs):
+        """Returns a writer of the shard holding `key` of `table`, the other
+        arguments are those of `Client.writer`."""
+        return self.shard_for(table, key).writer(*args, **kwargs)
+
+    def trajectory_writer(self, *args, table: str, key: Any = None, **kwargs):
+        """Returns a trajectory writer of the shard holding `key` of `table`,
+        the other arguments are those of `Client.trajectory_writer`."""
+        return self.shard_for(table, key).trajectory_writer(*args, **kwargs)
+
+    def checkpoint(self, timeout: Optional[int] = None) -> List[str]:
+        """Checkpoints every shard, returns the paths in the order of the shards."""
+        return list(self._executor.map(lambda shard: shard.checkpoint(timeout), self._clients))
+
+    def weight_sender(self, table: str, full_every: int = 100,
+                      quantization: Optional[str] = None,
+                      resync_check_secs: float = 0.1) -> weight_sync.WeightSyncSender:
+        return self.shard_for(table).weight_sender(table, full_every, quantization,
+                                                   resync_check_secs)
+
+    def weight_receiver(self, table: str,
+                        resync_retry_secs: float = 1.) -> weight_sync.WeightSyncReceiver:
+        return self.shard_for(table).weight_receiver(table, resync_retry_secs)
+
+    def get_weight(self, table: str):
+        return self.shard_for(table).get_weight(table)
+
+    def set_serializer(self, table: str, name: str) -> None:
+        self.shard_for(table).set_serializer(table, name)
+
+    def send_info(self, info, table: str = transmit_client.INFO_TABLE):
+        self.shard_for(table).send_info(info, table)
+
+    def info_writer(self, merge: str = info_writer.LAST_WRITER_WINS, max_batch: int = 64,
+                    flush_interval_secs: float = 0.1,
+                    max_queue: int = 1024) -> info_writer.InfoWriter:
+        return self.shard_for(transmit_client.INFO_TABLE).info_writer(
+            merge, max_batch, flush_interval_secs, max_queue)
+
+    def get_info_with_version(self, table: str = transmit_client.INFO_TABLE):
+        return self.shard_for(table).get_info_with_version(table)
+
+    def get_info(self, table: str = transmit_client.INFO_TABLE):
+        return self.shard_for(table).get_info(table)
+
+    def wait_for_info(self, newer_than: int, timeout: Optional[float] = None,
+                      poll_interval_secs: float = 0.01, table: str = transmit_client.INFO_TABLE):
+        return self.shard_for(table).wait_for_info(newer_than, timeout, poll_interval_secs, table)
+
+    def close(self):
+        """Stops sampling from the shards. The clients of the shards are left
+        open: they may be shared, and are closed by their owner (e.g. the
+        client registry of the process)."""
+        self._executor.shutdown(wait=False)
@@ -15,8 +15,268 @@
 # limitations under the License.
 
 """"""
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
 import reverb
 
+PER_ACTOR_LAYOUT = 'per_actor'
+KEYED_LAYOUT = 'keyed'
+TABLE_LAYOUTS = (PER_ACTOR_LAYOUT, KEYED_LAYOUT)
+
+WEIGHT_TABLE = 'weight'
+REPLAY_BUFFER_TABLE = 'replay_buffer'
+
+
+def sync_signal_tables(actor_num: int) -> List[reverb.Table]:
+    return [reverb.Table(
+        name='sync_signal',
+        sampler=reverb.selectors.Uniform(),
+        remover=reverb.selectors.Fifo(),
+        max_size=actor_num,
+        rate_limiter=reverb.rate_limiters.Queue(actor_num),
+        max_times_sampled=1),
+        reverb.Table(
+            name='id',
+            sampler=reverb.selectors.Uniform(),
+            remover=reverb.selectors.Fifo(),
+            max_size=actor_num,
+            rate_limiter=reverb.rate_limiters.Queue(actor_num),
+            max_times_sampled=1)]
+
+
+def per_actor_tables(actor_num: int) -> List[reverb.Table]:
+    """One weight and one replay buffer table per actor."""
+    tables = []
+    for i in range(actor_num):
+        tables.append(reverb.Table(  # Replay buffer storing weight.
+            name='weight_{}'.format(i),
+            sampler=reverb.selectors.Uniform(),
+            remover=reverb.selectors.Fifo(),
+            max_size=1,
+            rate_limiter=reverb.rate_limiters.Queue(1)))
+        tables.append(reverb.Table(  # Replay buffer storing experience.
+            name='replay_buffer_{}'.format(i),
+            sampler=reverb.selectors.Uniform(),
+            remover=reverb.selectors.Fifo(),
+            max_size=1,
+            rate_limiter=reverb.rate_limiters.Queue(1)))
+    return tables
+
+
+def keyed_tables(actor_num: int) -> List[reverb.Table]:
+    """Two tables whatever the number of actors.
+
+    The weights are broadcast through a single item, which every actor reads
+    once per version (the key of the item) without consuming it, so an actor
+    fetching twice in a round can not take the share of the others. Experience
+    of all actors goes to one queue, every item ending with the id of its actor.
+    """
+    return [
+        reverb.Table(  # Latest weights, read by all actors.
+            name=WEIGHT_TABLE,
+            sampler=reverb.selectors.Lifo(),
+            remover=reverb.selectors.Fifo(),
+            max_size=1,
+            rate_limiter=reverb.rate_limiters.MinSize(1)),
+        reverb.Table.queue(  # Experience of all actors.
+            name=REPLAY_BUFFER_TABLE,
+            max_size=actor_num),
+    ]
+
+
+def make_tables(table_layout: str, actor_num: int) -> List[reverb.Table]:
+    """Returns the tables of the sync mode with `table_layout`."""
+    if table_layout == PER_ACTOR_LAYOUT:
+        return sync_signal_tables(actor_num) + per_actor_tables(actor_num)
+    if table_layout == KEYED_LAYOUT:
+        return sync_signal_tables(actor_num) + keyed_tables(actor_num)
+    raise ValueError('table_layout must be one of {}, got {!r}'.format(
+        TABLE_LAYOUTS, table_layout))
+
+
+def publish_weights(client: reverb.Client, table_layout: str, actor_num: int,
+                    data: Sequence[Any]) -> None:
+    """Sends the weights of the next round to all actors."""
+    if table_layout == PER_ACTOR_LAYOUT:
+        # One item shared by the tables of all actors.
+        client.insert(data, priorities={'weight_{}'.format(i): 1. for i in range(actor_num)})
+    else:
+        client.insert(data, priorities={WEIGHT_TABLE: 1.})
+
+
+def fetch_weights(client: reverb.Client, table_layout: str, actor_id: int,
+                  last_key: Optional[int] = None,
+                  min_poll_interval_secs: float = 0.001,
+                  max_poll_interval_secs: float = 0.05) -> Tuple[int, Any]:
+    """Waits for weights newer than the ones of item `last_key`.
+
+    In the per actor layout the sample blocks on the server until the learner
+    publishes. In the keyed layout the latest weights are read until their key
+    changes, the interval between two reads doubling from
+    `min_poll_interval_secs` to `max_poll_interval_secs`.
+
+    Returns:
+      The key of the item, to pass as `last_key` of the next call, and the
+      weights.
+    """
+    if table_layout == PER_ACTOR_LAYOUT:
+        sample = next(client.sample('weight_{}'.format(actor_id), num_samples=1))[0]
+        return sample.info.key, sample.data
+    poll_interval_secs = min_poll_interval_secs
+    while True:
+        sample = next(client.sample(WEIGHT_TABLE, num_samples=1))[0]
+        if sample.info.key != last_key:
+            return sample.info.key, sample.data
+        time.sleep(poll_interval_secs)
+        poll_interval_secs = min(2 * poll_interval_secs, max_poll_interval_secs)
+
+
+def insert_experience(client: reverb.Client, table_layout: str, actor_id: int,
+                      data: Sequence[Any]) -> None:
+    if table_layout == PER_ACTOR_LAYOUT:
+        client.insert(data, priorities={'replay_buffer_{}'.format(actor_id): 1.})
+    else:
+        client.insert(list(data) + [actor_id], priorities={REPLAY_BUFFER_TABLE: 1.})
+
+
+def sample_experiences(client: reverb.Client, table_layout: str,
+                       actor_num: int) -> List[Any]:
+    """Waits for the experience of the round of every actor.
+
+    Returns:
+      The experience of every actor, in the order of the actor ids.
+    """
+    if table_layout == PER_ACTOR_LAYOUT:
+        return [next(client.sample('replay_buffer_{}'.format(i), num_samples=1))[0].data
+                for i in range(actor_num)]
+    samples = [sample[0].data for sample in
+               client.sample(REPLAY_BUFFER_TABLE, num_samples=actor_num)]
+    samples.sort(key=lambda data: int(data[-1]))
+    return [data[:-1] for data in samples]
+
+
+SYNC = 'sync'
+ASYNC = 'async'
+
+ASYNC_REPLAY_BUFFER_TABLE = 'async_replay_buffer'
+
+
+def async_tables(actor_num: int,
+                 buffer_size: int = 10000,
+                 samples_per_insert: float = 1.,
+                 min_size_to_sample: int = 1,
+                 error_buffer: float = 100.) -> List[reverb.Table]:
+    """Returns the tables of the async mode.
+
+    Actors act with the latest weights they fetched and never wait for the
+    learner, whose sampling is paced by the inserts of all actors together
+    through a `SampleToInsertRatio` limiter rather than by the slowest actor.
+
+    Args:
+      actor_num: Number of actors.
+      buffer_size: Maximum number of experience items kept.
+      samples_per_insert: Average number of times an experience item is
+        sampled, see `reverb.rate_limiters.SampleToInsertRatio`.
+      min_size_to_sample: Number of items to insert before the first sample.
+      error_buffer: Tolerated deviation from `samples_per_insert`, in items.
+    """
+    return sync_signal_tables(actor_num) + [
+        reverb.Table(  # Latest weights with their version, read by all actors.
+            name=WEIGHT_TABLE,
+            sampler=reverb.selectors.Lifo(),
+            remover=reverb.selectors.Fifo(),
+            max_size=1,
+            rate_limiter=reverb.rate_limiters.MinSize(1)),
+        reverb.Table(  # Experience of all actors.
+            name=ASYNC_REPLAY_BUFFER_TABLE,
+            sampler=reverb.selectors.Uniform(),
+            remover=reverb.selectors.Fifo(),
+            max_size=buffer_size,
+            rate_limiter=reverb.rate_limiters.SampleToInsertRatio(
+                samples_per_insert=samples_per_insert,
+                min_size_to_sample=min_size_to_sample,
+                error_buffer=error_buffer)),
+    ]
+
+
+def publish_versioned_weights(client: reverb.Client, version: int, data: Sequence[Any]) -> None:
+    """Replaces the weights read by the actors in the async mode."""
+    client.insert([version] + list(data), priorities={WEIGHT_TABLE: 1.})
+
+
+def fetch_latest_weights(client: reverb.Client) -> Tuple[int, Any]:
+    """Returns the version and the latest weights, without waiting for new ones."""
+    data = next(client.sample(WEIGHT_TABLE, num_samples=1))[0].data
+    return int(data[0]), data[1:]
+
+
+def insert_async_experience(client: reverb.Client, actor_id: int, weight_version: int,
+                            data: Sequence[Any]) -> None:
+    """Inserts experience collected with the weights of `weight_version`."""
+    client.insert(list(data) + [actor_id, weight_version],
+                  priorities={ASYNC_REPLAY_BUFFER_TABLE: 1.})
+
+
+class StalenessTracker:
+    """Tracks how many versions behind the learner the experience of every
+    actor is."""
+
+    def __init__(self, decay: float = 0.99):
+        self._decay = decay
+        self._mean = {}  # type: Dict[int, float]
+        self._last = {}  # type: Dict[int, int]
+        self._dropped = {}  # type: Dict[int, int]
+
+    def update(self, actor_id: int, staleness: int, dropped: bool = False) -> None:
+        mean = self._mean.get(actor_id)
+        self._mean[actor_id] = staleness if mean is None else (
+            self._decay * mean + (1. - self._decay) * staleness)
+        self._last[actor_id] = staleness
+        if dropped:
+            self._dropped[actor_id] = self._dropped.get(actor_id, 0) + 1
+
+    def per_actor(self) -> Dict[int, Dict[str, float]]:
+        """Returns the last and the moving average staleness, and the number of
+        dropped items, of every actor."""
+        return {actor_id: dict(last=self._last[actor_id], mean=self._mean[actor_id],
+                               dropped=self._dropped.get(actor_id, 0))
+                for actor_id in self._mean}
+
+    def summary(self) -> Dict[str, float]:
+        """Returns the mean and max staleness over actors and the total number of
+        dropped items, e.g. to log them."""
+        if not self._mean:
+            return dict(mean=0., max=0., dropped=0)
+        return dict(mean=sum(self._mean.values()) / len(self._mean),
+                    max=max(self._last.values()),
+                    dropped=sum(self._dropped.values()))
+
+
+def sample_async_experience(client: reverb.Client, batch_size: int, learner_version: int,
+                            tracker: Optional[StalenessTracker] = None,
+                            max_staleness: Optional[int] = None) -> List[Any]:
+    """Samples a batch of experience for the learner at `learner_version`.
+
+    Items collected with weights more than `max_staleness` versions old are
+    dropped from the batch, which may therefore be smaller than `batch_size`.
+
+    Returns:
+      The experience of the kept items, without their actor id and version.
+    """
+    batch = []
+    for sample in client.sample(ASYNC_REPLAY_BUFFER_TABLE, num_samples=batch_size):
+        data = sample[0].data
+        actor_id, weight_version = int(data[-2]), int(data[-1])
+        staleness = learner_version - weight_version
+        dropped = max_staleness is not None and staleness > max_staleness
+        if tracker is not None:
+            tracker.update(actor_id, staleness, dropped)
+        if not dropped:
+            batch.append(data[:-2])
+    return batch
+
+
 class Server:
     def __init__(self,all_args):
         self.all_args = all_args
@@ -29,38 +289,21 @@ class Server:
         # launch server
         port = int(all_args.server_address.split(':')[1])
         print('Launch server at port:{}'.format(port))
-        if all_args.distributed_type == "sync":
-            tables = [reverb.Table(
-                name='sync_signal',
-                sampler=reverb.selectors.Uniform(),
-                remover=reverb.selectors.Fifo(),
-                max_size=all_args.actor_num,
-                rate_limiter=reverb.rate_limiters.Queue(all_args.actor_num),
-                max_times_sampled=1),
-                reverb.Table(
-                    name='id',
-                    sampler=reverb.selectors.Uniform(),
-                    remover=reverb.selectors.Fifo(),
-                    max_size=all_args.actor_num,
-                    rate_limiter=reverb.rate_limiters.Queue(all_args.actor_num),
-                    max_times_sampled=1)]
-
-            for i in range(all_args.actor_num):
-                tables.append(reverb.Table(  # Replay buffer storing weight.
-                    name='weight_{}'.format(i),
-                    sampler=reverb.selectors.Uniform(),
-                    remover=reverb.selectors.Fifo(),
-                    max_size=1,
-                    rate_limiter=reverb.rate_limiters.Queue(1)))
-                tables.append(reverb.Table(  # Replay buffer storing experience.
-                    name='replay_buffer_{}'.format(i),
-                    sampler=reverb.selectors.Uniform(),
-                    remover=reverb.selectors.Fifo(),
-                    max_size=1,
-                    rate_limiter=reverb.rate_limiters.Queue(1)))
+        if all_args.distributed_type == SYNC:
+            # The per actor layout needs 2 * actor_num tables, the keyed one
+            # scales to thousands of actors.
+            tables = make_tables(getattr(all_args, 'table_layout', PER_ACTOR_LAYOUT),
+                                 all_args.actor_num)
+        elif all_args.distributed_type == ASYNC:
+            tables = async_tables(
+                all_args.actor_num,
+                buffer_size=getattr(all_args, 'async_buffer_size', 10000),
+                samples_per_insert=getattr(all_args, 'samples_per_insert', 1.),
+                min_size_to_sample=getattr(all_args, 'min_size_to_sample', 1),
+                error_buffer=getattr(all_args, 'samples_per_insert_error_buffer', 100.))
         else:
-            # async type is reminded for future
-            raise NotImplemented
+            raise ValueError('distributed_type must be {!r} or {!r}, got {!r}'.format(
+                SYNC, ASYNC, all_args.distributed_type))
 
         server = reverb.Server(
             tables=tables,
@@ -0,0 +1,75 @@
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for tlaunch.lp_ssh.transmit.tmarl_server."""
+
+import collections
+import itertools
+import threading
+
+from absl.testing import absltest
+
+from tlaunch.lp_ssh.transmit import tmarl_server
+
+_Info = collections.namedtuple('_Info', ['key'])
+_Sample = collections.namedtuple('_Sample', ['info', 'data'])
+
+
+class _FakeClient:
+    """Holds the latest item of every table, sampled without being consumed."""
+
+    def __init__(self):
+        self._keys = itertools.count(1)
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def insert(self, data, priorities):
+        with self._lock:
+            key = next(self._keys)
+            for table in priorities:
+                self._latest[table] = _Sample(_Info(key), data)
+
+    def sample(self, table, num_samples=1):
+        with self._lock:
+            yield [self._latest[table]]
+
+
+class KeyedFetchWeightsTest(absltest.TestCase):
+
+    def test_actor_fetching_twice_in_a_round_does_not_starve_the_others(self):
+        client = _FakeClient()
+        layout = tmarl_server.KEYED_LAYOUT
+        tmarl_server.publish_weights(client, layout, 2, ['round_1'])
+        key, weights = tmarl_server.fetch_weights(client, layout, 0)
+        self.assertEqual(weights, ['round_1'])
+
+        # Actor 0 fetches again before the next round is published.
+        second_fetch = []
+        fetcher = threading.Thread(target=lambda: second_fetch.append(
+            tmarl_server.fetch_weights(client, layout, 0, key)))
+        fetcher.start()
+        fetcher.join(0.1)
+        self.assertTrue(fetcher.is_alive())
+
+        # Actor 1 still gets the weights of the round.
+        self.assertEqual(tmarl_server.fetch_weights(client, layout, 1)[1], ['round_1'])
+
+        tmarl_server.publish_weights(client, layout, 2, ['round_2'])
+        fetcher.join(5.)
+        self.assertFalse(fetcher.is_alive())
+        self.assertEqual(second_fetch[0][1], ['round_2'])
+
+
+if __name__ == '__main__':
+    absltest.main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Packs model weights into a single contiguous byte buffer.
+
+A weight dict `{model_key: {name: tensor}, 'episode': int}` is described by a
+layout (model key, name, shape, dtype and byte offset of every tensor). The
+layout is computed once and reused as long as the shapes and dtypes of the
+weights do not change, and is sent as a compact json descriptor next to the
+buffer. The receiver turns the buffer back into tensors which are views into
+it, without copying.
+"""
+
+import json
+import warnings
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+import torch
+
+# Offsets are aligned so that every tensor view is aligned for its dtype.
+_ALIGNMENT = 64
+
+EPISODE_KEY = 'episode'
+
+
+class WeightEntry(NamedTuple):
+    model_key: str
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+    offset: int
+    nbytes: int
+
+
+class WeightLayout(NamedTuple):
+    entries: Tuple[WeightEntry, ...]
+    total_bytes: int
+    # Json encoding of the layout, sent along with every buffer.
+    descriptor: bytes
+
+
+def _dtype_name(dtype: torch.dtype) -> str:
+    return str(dtype).replace('torch.', '')
+
+
+def _signature(model_weight) -> Tuple:
+    return tuple((model_key, name, tuple(tensor.shape), tensor.dtype)
+                 for model_key in model_weight if model_key != EPISODE_KEY
+                 for name, tensor in model_weight[model_key].items())
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def make_layout(model_weight) -> WeightLayout:
+    """Computes the layout of the tensors of `model_weight` in a buffer."""
+    entries = []
+    offset = 0
+    for model_key, name, shape, dtype in _signature(model_weight):
+        nbytes = int(np.prod(shape, dtype=np.int64)) * torch.empty((), dtype=dtype).element_size()
+        entries.append(WeightEntry(model_key, name, shape, _dtype_name(dtype), offset, nbytes))
+        offset = _align(offset + nbytes)
+    descriptor = json.dumps([list(entry) for entry in entries]).encode()
+    return WeightLayout(tuple(entries), offset, descriptor)
+
+
+def parse_descriptor(descriptor: bytes) -> WeightLayout:
+    entries = tuple(WeightEntry(model_key, name, tuple(shape), dtype, offset, nbytes)
+                    for model_key, name, shape, dtype, offset, nbytes
+                    in json.loads(bytes(descriptor)))
+    total_bytes = _align(entries[-1].offset + entries[-1].nbytes) if entries else 0
+    return WeightLayout(entries, total_bytes, bytes(descriptor))
+
+
+class WeightPacker:
+    """Packs weights into a buffer which is allocated once and reused.
+
+    The returned buffer is overwritten by the next call to `pack`, so it must be
+    consumed (e.g. inserted into reverb) before packing again.
+    """
+
+    def __init__(self):
+        self._signature = None
+        self._layout = None  # type: Optional[WeightLayout]
+        self._buffer = None  # type: Optional[torch.Tensor]
+
+    @property
+    def layout(self) -> Optional[WeightLayout]:
+        return self._layout
+
+    def _prepare(self, model_weight, pin_memory: bool) -> None:
+        signature = _signature(model_weight)
+        if signature == self._signature:
+            return
+        self._signature = signature
+        self._layout = make_layout(model_weight)
+        self._buffer = torch.empty(self._layout.total_bytes, dtype=torch.uint8,
+                                   pin_memory=pin_memory)
+
+    def pack(self, model_weight) -> Tuple[np.ndarray, bytes]:
+        """Copies the tensors of `model_weight` into the buffer.
+
+        Tensors on GPU are copied asynchronously into pinned memory, followed by
+        a single synchronization, instead of one blocking copy per tensor.
+
+        Returns:
+          The buffer as a uint8 numpy array and the layout descriptor.
+        """
+        tensors = [tensor for model_key in model_weight if model_key != EPISODE_KEY
+                   for tensor in model_weight[model_key].values()]
+        on_gpu = any(tensor.is_cuda for tensor in tensors)
+        self._prepare(model_weight, pin_memory=on_gpu)
+        for entry, tensor in zip(self._layout.entries, tensors):
+            target = self._buffer[entry.offset:entry.offset + entry.nbytes]
+            target.view(tensor.dtype).view(tensor.shape).copy_(tensor.detach(),
+                                                               non_blocking=on_gpu)
+        if on_gpu:
+            torch.cuda.synchronize()
+        return self._buffer.numpy(), self._layout.descriptor
+
+
+_LAYOUT_CACHE = {}  # type: Dict[bytes, WeightLayout]
+_LAYOUT_CACHE_SIZE = 16
+
+
+def unpack(buffer: np.ndarray, descriptor: bytes):
+    """Rebuilds the weights from a packed buffer without copying them.
+
+    Returns:
+      A dict `{model_key: {name: tensor}}` whose tensors are views into
+      `buffer`, which must therefore outlive them.
+    """
+    descriptor = bytes(descriptor)
+    layout = _LAYOUT_CACHE.get(descriptor)
+    if layout is None:
+        if len(_LAYOUT_CACHE) >= _LAYOUT_CACHE_SIZE:
+            _LAYOUT_CACHE.clear()
+        layout = _LAYOUT_CACHE[descriptor] = parse_descriptor(descriptor)
+    with warnings.catch_warnings():
+        # Sampled arrays are read-only, the views must not be written to anyway.
+        warnings.filterwarnings('ignore', message='The given NumPy array is not writable')
+        flat = torch.from_numpy(np.asarray(buffer, dtype=np.uint8).reshape(-1))
+    model_weight = {}  # type: Dict[str, Dict[str, torch.Tensor]]
+    for entry in layout.entries:
+        tensor = flat[entry.offset:entry.offset + entry.nbytes].view(
+            getattr(torch, entry.dtype)).view(entry.shape)
+        model_weight.setdefault(entry.model_key, {})[entry.name] = tensor
+    return model_weight
+
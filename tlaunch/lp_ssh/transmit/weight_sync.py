@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Broadcasts weights as periodic full snapshots and versioned deltas.
+
+Every message carries its version and the version it applies to. The sender
+keeps a copy of the weights as reconstructed by the receivers, and deltas are
+taken against it. Quantization errors are therefore carried over to the next
+delta (error feedback) instead of accumulating on the receivers.
+
+The latest full snapshot is also kept in a table of its own, which deltas do
+not evict. A receiver which misses a delta catches up from that snapshot and
+asks for a resync through a third table, so that the next message of the
+sender is a new snapshot. The request is sent again while the receiver only
+sees deltas it can not apply.
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import reverb
+import torch
+
+from tlaunch.lp_ssh.transmit import weight_buffer
+
+FULL = 0
+DELTA = 1
+
+QUANTIZATIONS = (None, 'fp16', 'int8')
+
+
+def resync_table_name(table: str) -> str:
+    return table + '_resync'
+
+
+def snapshot_table_name(table: str) -> str:
+    return table + '_snapshot'
+
+
+def weight_sync_tables(table: str, max_resync_requests: int = 1024) -> List[reverb.Table]:
+    """Returns the tables used to broadcast weights through `table`."""
+    return [
+        reverb.Table(  # Latest message, sampled by every receiver.
+            name=table,
+            sampler=reverb.selectors.Lifo(),
+            remover=reverb.selectors.Fifo(),
+            max_size=1,
+            rate_limiter=reverb.rate_limiters.MinSize(1)),
+        reverb.Table(  # Latest full snapshot, read by the receivers which fell behind.
+            name=snapshot_table_name(table),
+            sampler=reverb.selectors.Lifo(),
+            remover=reverb.selectors.Fifo(),
+            max_size=1,
+            rate_limiter=reverb.rate_limiters.MinSize(1)),
+        reverb.Table(  # Resync requests of the receivers which missed a delta.
+            name=resync_table_name(table),
+            sampler=reverb.selectors.Fifo(),
+            remover=reverb.selectors.Fifo(),
+            max_size=max_resync_requests,
+            rate_limiter=reverb.rate_limiters.MinSize(1)),
+    ]
+
+
+def _split(layout: weight_buffer.WeightLayout, weights) -> Tuple[List[torch.Tensor], List[torch.Tensor]]:
+    """Splits the tensors of `weights` into floating point ones and the others."""
+    floats, others = [], []
+    for entry in layout.entries:
+        tensor = weights[entry.model_key][entry.name]
+        (floats if tensor.is_floating_point() else others).append(tensor)
+    return floats, others
+
+
+def _flatten(tensors: List[torch.Tensor]) -> torch.Tensor:
+    if not tensors:
+        return torch.zeros(0)
+    return torch.cat([tensor.reshape(-1).float() for tensor in tensors])
+
+
+def _raw_bytes(tensors: List[torch.Tensor]) -> np.ndarray:
+    if not tensors:
+        return np.zeros(0, dtype=np.uint8)
+    return np.concatenate([tensor.reshape(-1).view(torch.uint8).numpy() for tensor in tensors])
+
+
+def _quantize(delta: torch.Tensor, sizes: List[int],
+              quantization: Optional[str]) -> Tuple[np.ndarray, np.ndarray, torch.Tensor]:
+    """Returns the encoded delta, its per tensor scales and its decoded value."""
+    if quantization is None or not sizes:
+        return delta.numpy().view(np.uint8), np.zeros(0, dtype=np.float32), delta
+    if quantization == 'fp16':
+        encoded = delta.half()
+        return encoded.numpy().view(np.uint8), np.zeros(0, dtype=np.float32), encoded.float()
+    scales = torch.stack([segment.abs().max() / 127. if segment.numel() else torch.tensor(0.)
+                          for segment in torch.split(delta, sizes)])
+    scales[scales == 0] = 1.
+    expanded = torch.repeat_interleave(scales, torch.tensor(sizes))
+    encoded = torch.round(delta / expanded).clamp_(-127, 127).to(torch.int8)
+    return encoded.numpy().view(np.uint8), scales.numpy(), encoded.float() * expanded
+
+
+def _dequantize(payload: np.ndarray, scales: np.ndarray, sizes: List[int],
+                quantization: Optional[str]) -> torch.Tensor:
+    payload = np.asarray(payload, dtype=np.uint8)
+    if quantization is None or not sizes:
+        return torch.from_numpy(payload.view(np.float32).copy())
+    if quantization == 'fp16':
+        return torch.from_numpy(payload.view(np.float16).astype(np.float32))
+    expanded = torch.repeat_interleave(torch.from_numpy(np.asarray(scales, dtype=np.float32)),
+                                       torch.tensor(sizes))
+    return torch.from_numpy(payload.view(np.int8).astype(np.float32)) * expanded
+
+
+def _encode_quantization(quantization: Optional[str]) -> int:
+    return QUANTIZATIONS.index(quantization)
+
+
+class WeightSyncSender:
+    """Sends weights as full snapshots every `full_every` versions and deltas
+    in between, optionally quantized to fp16 or int8 (with per tensor scales).
+    """
+
+    def __init__(self,
+                 client: reverb.Client,
+                 table: str,
+                 full_every: int = 100,
+                 quantization: Optional[str] = None,
+                 resync_check_secs: float = 0.1):
+        """
+        Args:
+          client: Client of the server holding the `weight_sync_tables`.
+          table: Table broadcasting the weights.
+          full_every: Number of versions between two full snapshots.
+          quantization: Encoding of the deltas, one of `QUANTIZATIONS`.
+          resync_check_secs: Minimum interval between two checks of the resync
+            requests, each one costs a round trip to the server.
+        """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError('quantization must be one of {}, got {!r}'.format(
+                QUANTIZATIONS, quantization))
+        self._client = client
+        self._table = table
+        self._full_every = full_every
+        self._quantization = quantization
+        self._resync_check_secs = resync_check_secs
+        self._next_resync_check = 0.
+        self._packer = weight_buffer.WeightPacker()
+        self._version = 0
+        self._last_full_version = 0
+        self._descriptor = None  # type: Optional[bytes]
+        # Floating point weights as reconstructed by the receivers.
+        self._reference = None  # type: Optional[torch.Tensor]
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def _resync_requested(self) -> bool:
+        now = time.time()
+        if now < self._next_resync_check:
+            return False
+        self._next_resync_check = now + self._resync_check_secs
+        resync_table = resync_table_name(self._table)
+        if self._client.server_info()[resync_table].current_size == 0:
+            return False
+        self._client.reset(resync_table)
+        return True
+
+    def send(self, model_weight) -> int:
+        """Sends `model_weight` ({model_key: {name: tensor}, 'episode': int}).
+
+        Returns:
+          The version of the message.
+        """
+        buffer, descriptor = self._packer.pack(model_weight)
+        floats, others = _split(self._packer.layout, weight_buffer.unpack(buffer, descriptor))
+        current = _flatten(floats)
+        episode = model_weight.get(weight_buffer.EPISODE_KEY, -1)
+
+        self._version += 1
+        full = (self._reference is None or descriptor != self._descriptor or
+                self._version - self._last_full_version >= self._full_every)
+        # Checked even when a snapshot is due, so that the requests are cleared.
+        full = self._resync_requested() or full
+        if full:
+            kind, payload, scales, raw = FULL, buffer, np.zeros(0, dtype=np.float32), buffer[:0]
+            self._reference = current.clone()
+            self._descriptor = descriptor
+            self._last_full_version = self._version
+        else:
+            sizes = [tensor.numel() for tensor in floats]
+            payload, scales, decoded = _quantize(current - self._reference, sizes,
+                                                 self._quantization)
+            self._reference += decoded
+            kind, raw = DELTA, _raw_bytes(others)
+        self._client.insert(
+            data=[kind, self._version, self._version - 1,
+                  _encode_quantization(self._quantization), payload, scales, raw,
+                  np.frombuffer(descriptor, dtype=np.uint8), episode],
+            priorities=({self._table: 1., snapshot_table_name(self._table): 1.} if full
+                        else {self._table: 1.}))
+        return self._version
+
+
+class WeightSyncReceiver:
+    """Reconstructs the weights broadcast by a `WeightSyncSender`.
+
+    The weights are updated in place, so tensors returned by `weights` always
+    hold the latest received version.
+    """
+
+    def __init__(self, client: reverb.Client, table: str, resync_retry_secs: float = 1.):
+        """
+        Args:
+          client: Client of the server holding the `weight_sync_tables`.
+          table: Table broadcasting the weights.
+          resync_retry_secs: Interval after which a resync request is sent
+            again while no snapshot was received.
+        """
+        self._client = client
+        self._table = table
+        self._resync_retry_secs = resync_retry_secs
+        self._version = 0
+        self._episode = -1
+        self._descriptor = None  # type: Optional[bytes]
+        self._layout = None  # type: Optional[weight_buffer.WeightLayout]
+        self._weights = None  # type: Optional[Dict[str, Dict[str, torch.Tensor]]]
+        self._reference = None  # type: Optional[torch.Tensor]
+        # Time of the last resync request, None once a snapshot was applied.
+        self._resync_requested_at = None  # type: Optional[float]
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def episode(self) -> int:
+        return self._episode
+
+    @property
+    def weights(self) -> Optional[Dict[str, Dict[str, torch.Tensor]]]:
+        return self._weights
+
+    def _request_resync(self) -> None:
+        now = time.time()
+        if (self._resync_requested_at is None or
+                now - self._resync_requested_at >= self._resync_retry_secs):
+            self._client.insert(data=[self._version],
+                                priorities={resync_table_name(self._table): 1.})
+            self._resync_requested_at = now
+
+    def _apply_full(self, payload: np.ndarray, descriptor: bytes) -> None:
+        # Copied once, deltas are then applied in place.
+        self._weights = weight_buffer.unpack(np.array(payload, dtype=np.uint8), descriptor)
+        self._layout = weight_buffer.parse_descriptor(descriptor)
+        self._descriptor = descriptor
+        self._reference = _flatten(_split(self._layout, self._weights)[0])
+
+    def _apply_delta(self, payload, scales, raw, quantization) -> None:
+        floats, others = _split(self._layout, self._weights)
+        sizes = [tensor.numel() for tensor in floats]
+        self._reference += _dequantize(payload, scales, sizes, quantization)
+        for tensor, values in zip(floats, torch.split(self._reference, sizes)):
+            tensor.copy_(values.view(tensor.shape))
+        raw = torch.from_numpy(np.array(raw, dtype=np.uint8))
+        offset = 0
+        for tensor in others:
+            nbytes = tensor.numel() * tensor.element_size()
+            tensor.reshape(-1).view(torch.uint8).copy_(raw[offset:offset + nbytes])
+            offset += nbytes
+
+    def _apply(self, data) -> bool:
+        """Applies a message, returns False for a delta of another version."""
+        (kind, version, base_version, quantization, payload, scales, raw, descriptor,
+         episode) = data
+        descriptor = np.asarray(descriptor, dtype=np.uint8).tobytes()
+        if int(kind) == FULL:
+            self._apply_full(payload, descriptor)
+        elif int(base_version) == self._version and descriptor == self._descriptor:
+            self._apply_delta(payload, scales, raw, QUANTIZATIONS[int(quantization)])
+        else:
+            return False
+        self._version = int(version)
+        self._episode = int(episode)
+        return True
+
+    def update(self) -> bool:
+        """Applies the latest message of the sender, waiting for the first one.
+
+        When a delta was missed, the weights are caught up from the latest
+        snapshot and a resync is requested if the latest delta still does not
+        apply to it.
+
+        Returns:
+          Whether the weights changed.
+        """
+        data = next(self._client.sample(table=self._table, num_samples=1))[0].data
+        if int(data[1]) == self._version:
+            return False
+        if self._apply(data):
+            self._resync_requested_at = None
+            return True
+        # Deltas only follow a snapshot, which is therefore already stored.
+        snapshot = next(self._client.sample(table=snapshot_table_name(self._table),
+                                            num_samples=1))[0].data
+        changed = int(snapshot[1]) > self._version and self._apply(snapshot)
+        if self._apply(data):
+            self._resync_requested_at = None
+            return True
+        self._request_resync()
+        return changed
@@ -0,0 +1,98 @@
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for tlaunch.lp_ssh.transmit.weight_sync."""
+
+import collections
+
+from absl.testing import absltest
+import torch
+
+from tlaunch.lp_ssh.transmit import weight_sync
+
+_Sample = collections.namedtuple('_Sample', ['data'])
+_TableInfo = collections.namedtuple('_TableInfo', ['current_size'])
+
+
+class _FakeClient:
+    """In-memory tables with the sizes of `weight_sync_tables`, sampled Lifo."""
+
+    def __init__(self, table):
+        self._max_sizes = {table: 1, weight_sync.snapshot_table_name(table): 1,
+                           weight_sync.resync_table_name(table): 1024}
+        self._items = {name: [] for name in self._max_sizes}
+
+    def insert(self, data, priorities):
+        for name in priorities:
+            self._items[name] = (self._items[name] + [data])[-self._max_sizes[name]:]
+
+    def sample(self, table, num_samples=1):
+        yield [_Sample(self._items[table][-1])]
+
+    def server_info(self):
+        return {name: _TableInfo(len(items)) for name, items in self._items.items()}
+
+    def reset(self, table):
+        self._items[table] = []
+
+
+def _weights(step):
+    return {'model': {'w': torch.full((4, 3), float(step)),
+                      'steps': torch.tensor([step], dtype=torch.int64)},
+            'episode': step}
+
+
+class WeightSyncTest(absltest.TestCase):
+
+    def _make(self, full_every=100):
+        client = _FakeClient('weights')
+        sender = weight_sync.WeightSyncSender(client, 'weights', full_every,
+                                              resync_check_secs=0.)
+        receiver = weight_sync.WeightSyncReceiver(client, 'weights', resync_retry_secs=0.)
+        return sender, receiver
+
+    def test_receiver_applies_every_delta(self):
+        sender, receiver = self._make()
+        for step in range(1, 6):
+            sender.send(_weights(step))
+            self.assertTrue(receiver.update())
+            self.assertEqual(receiver.version, sender.version)
+        torch.testing.assert_close(receiver.weights['model']['w'], _weights(5)['model']['w'])
+
+    def test_slow_receiver_converges(self):
+        sender, receiver = self._make()
+        versions = []
+        step = 0
+        for _ in range(10):
+            # The receiver samples once every three messages.
+            for _ in range(3):
+                step += 1
+                sender.send(_weights(step))
+            receiver.update()
+            versions.append(receiver.version)
+        # Caught up from the snapshots instead of waiting for `full_every`.
+        self.assertGreater(versions[-1], versions[0])
+        step += 1
+        sender.send(_weights(step))
+        self.assertTrue(receiver.update())
+        self.assertEqual(receiver.version, sender.version)
+        self.assertEqual(receiver.episode, step)
+        torch.testing.assert_close(receiver.weights['model']['w'],
+                                   _weights(step)['model']['w'])
+        torch.testing.assert_close(receiver.weights['model']['steps'],
+                                   _weights(step)['model']['steps'])
+
+
+if __name__ == '__main__':
+    absltest.main()
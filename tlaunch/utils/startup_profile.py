@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2022 The TARTRL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Records when a worker process reaches each phase of its startup.
+
+Worker side, the entry point calls `configure` and every phase is marked with
+`mark`. The record of the process is rewritten at every mark, so a node stuck
+in a phase still shows the phases it went through. Launcher side, the records
+of all nodes are aggregated with `aggregate` and `format_report`.
+
+Only the standard library is used, so that entry points without absl can use
+this module.
+"""
+
+import json
+import os
+import socket
+import statistics
+import threading
+import time
+from typing import Dict, List, Optional
+
+INTERPRETER_START = 'interpreter_start'
+FLAGS_POPULATED = 'flags_populated'
+PAYLOAD_UNPICKLED = 'payload_unpickled'
+HANDLES_DEREFERENCED = 'handles_dereferenced'
+CONSTRUCTED = 'constructed'
+RUN_STARTED = 'run_started'
+
+PHASES = (INTERPRETER_START, FLAGS_POPULATED, PAYLOAD_UNPICKLED,
+          HANDLES_DEREFERENCED, CONSTRUCTED, RUN_STARTED)
+
+RECORD_SUFFIX = '.startup.json'
+# Prefix of the records printed to stdout, for nodes whose logs are collected
+# instead of their files (e.g. kubernetes pods).
+LOG_PREFIX = 'lp_startup_profile: '
+
+_lock = threading.Lock()
+_record_path = None  # type: Optional[str]
+_echo = False
+_record = {}  # type: dict
+
+
+def process_start_time() -> Optional[float]:
+  """Returns when the current process was created, None if unknown."""
+  try:
+    with open('/proc/self/stat') as f:
+      # The command name may contain spaces, fields are counted after it.
+      start_ticks = int(f.read().rpartition(')')[2].split()[19])
+    with open('/proc/stat') as f:
+      boot_time = next(int(line.split()[1]) for line in f
+                       if line.startswith('btime'))
+    return boot_time + start_ticks / os.sysconf('SC_CLK_TCK')
+  except (OSError, ValueError, IndexError, StopIteration):
+    return None
+
+
+def record_file_name(node_name: str) -> str:
+  return node_name.replace('/', '_') + RECORD_SUFFIX
+
+
+def configure(record_dir: str, node_name: str,
+              interpreter_start: Optional[float] = None,
+              echo: bool = False) -> None:
+  """Enables the profiler of this process, writing to `record_dir`.
+
+  Args:
+    record_dir: Directory of the records of all nodes.
+    node_name: Name of the node, unique within the program.
+    interpreter_start: Fallback start time of the interpreter, when the
+      creation time of the process cannot be read.
+    echo: Whether to also print the record to stdout at every mark, prefixed
+      with `LOG_PREFIX`.
+  """
+  global _record_path, _echo
+  os.makedirs(record_dir, exist_ok=True)
+  with _lock:
+    _record_path = os.path.join(record_dir, record_file_name(node_name))
+    _echo = echo
+    _record.clear()
+    _record.update(node=node_name, host=socket.gethostname(), pid=os.getpid(),
+                   phases={})
+  mark(INTERPRETER_START, process_start_time() or interpreter_start)
+
+
+def mark(phase: str, timestamp: Optional[float] = None) -> None:
+  """Records the first time `phase` is reached, no-op if not configured."""
+  if _record_path is None:
+    return
+  with _lock:
+    if phase in _record['phases']:
+      return
+    _record['phases'][phase] = timestamp or time.time()
+    data = json.dumps(_record)
+  if _echo:
+    print(LOG_PREFIX + data, flush=True)
+  tmp_path = '{}.{}.tmp'.format(_record_path, os.getpid())
+  try:
+    with open(tmp_path, 'w') as f:
+      f.write(data)
+    os.replace(tmp_path, _record_path)
+  except OSError:
+    # Profiling never takes a node down.
+    pass
+
+
+def load_records(record_dir: str) -> List[dict]:
+  """Reads the records written in `record_dir`."""
+  records = []
+  for name in sorted(os.listdir(record_dir)):
+    if name.endswith(RECORD_SUFFIX):
+      try:
+        with open(os.path.join(record_dir, name)) as f:
+          records.append(json.load(f))
+      except (OSError, ValueError):
+        continue
+  return records
+
+
+def parse_log(log: str) -> Optional[dict]:
+  """Returns the latest record printed in `log`, None if there is none."""
+  record = None
+  for line in log.splitlines():
+    if line.startswith(LOG_PREFIX):
+      try:
+        record = json.loads(line[len(LOG_PREFIX):])
+      except ValueError:
+        continue
+  return record
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+  values = sorted(values)
+  return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def aggregate(records: List[dict], slowest: int = 5) -> dict:
+  """Aggregates the records of all nodes into a startup report.
+
+  The duration of a phase is the time between the previous phase reached by
+  the node and this one. Phases a node never reached are skipped, and the node
+  is listed as not ready.
+
+  Returns:
+    A dict with:
+      nodes: Number of records.
+      ready: Number of nodes which reached `run_started`.
+      time_to_ready: Time between the first interpreter start and the last
+        `run_started`.
+      phases: Per phase min, median, p95 and max durations in seconds, and the
+        `slowest` nodes in this phase.
+      not_ready: Name and last phase of the nodes which are not ready.
+  """
+  durations = {phase: [] for phase in PHASES[1:]}
+  not_ready = []
+  starts, ready_times = [], []
+  for record in records:
+    phases = record['phases']
+    if INTERPRETER_START in phases:
+      starts.append(phases[INTERPRETER_START])
+    previous = None
+    for phase in PHASES:
+      if phase not in phases:
+        continue
+      if previous is not None:
+        durations[phase].append((phases[phase] - phases[previous], record['node']))
+      previous = phase
+    if RUN_STARTED in phases:
+      ready_times.append(phases[RUN_STARTED])
+    else:
+      not_ready.append({'node': record['node'], 'host': record.get('host'),
+                        'last_phase': previous})
+
+  report = {
+      'nodes': len(records),
+      'ready': len(ready_times),
+      'time_to_ready': (max(ready_times) - min(starts)
+                        if ready_times and starts else None),
+      'phases': {},
+      'not_ready': not_ready,
+  }
+  for phase, values in durations.items():
+    if not values:
+      continue
+    secs = [value for value, _ in values]
+    report['phases'][phase] = {
+        'min': min(secs),
+        'median': statistics.median(secs),
+        'p95': _percentile(secs, 0.95),
+        'max': max(secs),
+        'slowest': [node for _, node in sorted(values, reverse=True)[:slowest]],
+    }
+  return report
+
+
+def format_report(report: dict) -> str:
+  """Renders a report of `aggregate` as a table."""
+  lines = ['Startup of {} nodes, {} ready{}'.format(
+      report['nodes'], report['ready'],
+      '' if report['time_to_ready'] is None else
+      ' after {:.2f}s'.format(report['time_to_ready']))]
+  lines.append('{:<22}{:>9}{:>9}{:>9}{:>9}  slowest'.format(
+      'phase', 'min', 'median', 'p95', 'max'))
+  for phase, stats in report['phases'].items():
+    lines.append('{:<22}{:>9.3f}{:>9.3f}{:>9.3f}{:>9.3f}  {}'.format(
+        phase, stats['min'], stats['median'], stats['p95'], stats['max'],
+        ', '.join(stats['slowest'])))
+  for node in report['not_ready']:
+    lines.append('not ready: {} on {}, last phase {}'.format(
+        node['node'], node['host'], node['last_phase']))
+  return '\n'.join(lines)